@@ -0,0 +1,89 @@
+"""Opt-in mixed precision and torch.compile for the trainers, and peak memory.
+
+Both are off by default, and neither changes what gets exported: autocast
+only affects the dtype of intermediate activations, the parameters stay
+fp32, and compiled models share parameters with the eager module that the
+export code reads. `bench_models.py --only accel/` times a training step of
+each model in every mode and reports its speedup over eager fp32.
+"""
+
+import contextlib
+import sys
+import warnings
+
+import torch
+
+AMP_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def add_accel_args(parser) -> None:
+    """Register the --amp / --compile flags shared by the trainers."""
+    parser.add_argument("--amp", choices=sorted(AMP_DTYPES), default=None,
+                        help="Autocast forward/loss to bf16 or fp16 (fp16 uses loss scaling).")
+    parser.add_argument("--compile", action="store_true",
+                        help="torch.compile the model (falls back to eager if it fails).")
+
+
+def _device_type(device) -> str:
+    return torch.device(device).type
+
+
+def check_amp(device, amp: str | None) -> str | None:
+    """Return `amp` if the device can autocast to it, else warn and return None."""
+    if amp is None:
+        return None
+    kind = _device_type(device)
+    ok = {
+        "cuda": amp == "fp16" or torch.cuda.is_bf16_supported(),
+        "cpu": True,  # CPU autocast supports both; bf16 is only fast on AVX512-BF16/AMX
+        "mps": True,
+    }.get(kind, False)
+    if not ok:
+        warnings.warn(f"--amp {amp} not supported on {kind}; training in fp32")
+        return None
+    return amp
+
+
+def autocast(device, amp: str | None):
+    """Context manager for the forward + loss; a no-op when amp is None."""
+    if amp is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=_device_type(device), dtype=AMP_DTYPES[amp])
+
+
+def grad_scaler(device, amp: str | None) -> torch.amp.GradScaler:
+    """Loss scaler; only enabled for fp16, whose small range underflows gradients."""
+    return torch.amp.GradScaler(_device_type(device), enabled=amp == "fp16")
+
+
+def compile_model(model: torch.nn.Module, example: torch.Tensor, *,
+                  device, amp: str | None = None) -> torch.nn.Module:
+    """torch.compile `model`, or return it unchanged if compilation fails.
+
+    Compilation is lazy, so the compiled module is run once on `example`
+    (without grad) to surface errors here rather than mid-training.
+    """
+    try:
+        compiled = torch.compile(model)
+        with torch.no_grad(), autocast(device, amp):
+            compiled(example)
+        return compiled
+    except Exception as e:  # noqa: BLE001 - any backend failure means "use eager"
+        warnings.warn(f"torch.compile failed, using eager mode: {type(e).__name__}: {e}")
+        return model
+
+
+def peak_memory_mb(device) -> float:
+    """Peak memory so far: allocated tensors on CUDA, else process peak RSS.
+
+    Both are high-water marks for the whole process, so compare modes by
+    running each in a fresh process.
+    """
+    if _device_type(device) == "cuda":
+        return torch.cuda.max_memory_allocated() / 2**20
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10  # bytes vs. KiB
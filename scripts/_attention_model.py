@@ -9,6 +9,8 @@ import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.profiler import record_function
+from torch.utils.checkpoint import checkpoint
 
 CONFIG = {
     "vocab_size": 4096,
@@ -20,18 +22,40 @@ CONFIG = {
 }
 
 
+# "sdpa" runs F.scaled_dot_product_attention (fused kernels, never builds the
+# (B, H, T, T) score tensor); "math" is the explicit matmul + mask + softmax
+# that model-inference.ts mirrors. Both compute the same function; "math" is
+# also what runs whenever the attention weights are requested.
+ATTENTION_BACKENDS = ("sdpa", "math")
+
+
 class AttentionBlock(nn.Module):
-    def __init__(self, embed_dim: int, num_heads: int):
+    def __init__(self, embed_dim: int, num_heads: int, backend: str = "sdpa"):
         super().__init__()
         assert embed_dim % num_heads == 0
+        assert backend in ATTENTION_BACKENDS, backend
         self.embed_dim = embed_dim
         self.num_heads = num_heads
         self.head_dim = embed_dim // num_heads
+        self.backend = backend
         self.ln1 = nn.LayerNorm(embed_dim)
         self.qkv = nn.Linear(embed_dim, 3 * embed_dim)
         self.out = nn.Linear(embed_dim, embed_dim)
+        # Causal mask for the math path, grown on demand and reused across
+        # calls. Not persistent, so checkpoints and exports are unchanged.
+        self.register_buffer("causal_mask", torch.ones(0, 0, dtype=torch.bool), persistent=False)
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def _mask(self, T: int, device: torch.device) -> torch.Tensor:
+        if self.causal_mask.size(0) < T or self.causal_mask.device != device:
+            self.causal_mask = torch.triu(torch.ones(T, T, device=device), diagonal=1).bool()
+        return self.causal_mask[:T, :T]
+
+    def forward(self, x: torch.Tensor, return_weights: bool = False):
+        """Causal self-attention over x: (B, T, C).
+
+        With return_weights, returns (output, weights) where weights is the
+        (B, num_heads, T, T) softmax matrix (always computed via "math").
+        """
         B, T, C = x.shape
         h = self.ln1(x)
         qkv = self.qkv(h)
@@ -39,11 +63,34 @@ class AttentionBlock(nn.Module):
         q = q.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
         k = k.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
         v = v.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
-        scores = (q @ k.transpose(-2, -1)) / math.sqrt(self.head_dim)
-        mask = torch.triu(torch.ones(T, T, device=x.device), diagonal=1).bool()
-        scores = scores.masked_fill(mask, float("-inf"))
-        attn = F.softmax(scores, dim=-1)
-        out = attn @ v
+        if self.backend == "sdpa" and not return_weights:
+            out = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+            attn = None
+        else:
+            scores = (q @ k.transpose(-2, -1)) / math.sqrt(self.head_dim)
+            scores = scores.masked_fill(self._mask(T, x.device), float("-inf"))
+            attn = F.softmax(scores, dim=-1)
+            out = attn @ v
+        out = out.transpose(1, 2).contiguous().view(B, T, C)
+        out = self.out(out)
+        return (out, attn) if return_weights else out
+
+    def forward_cached(self, x: torch.Tensor, cache: "KVCache", layer: int,
+                       mask: torch.Tensor) -> torch.Tensor:
+        """Attend x: (B, T_new, C) over the cached keys/values plus its own.
+
+        The new keys/values are written into `cache` at [cache.length,
+        cache.length + T_new); `mask` is the (B, 1, T_new, cache.length + T_new)
+        boolean "may attend" matrix.
+        """
+        B, T, C = x.shape
+        qkv = self.qkv(self.ln1(x))
+        q, k, v = qkv.split(self.embed_dim, dim=-1)
+        q = q.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+        k = k.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+        v = v.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+        k, v = cache.append(layer, k, v)
+        out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
         out = out.transpose(1, 2).contiguous().view(B, T, C)
         return self.out(out)
 
@@ -61,28 +108,201 @@ class FFNBlock(nn.Module):
         return self.fc2(h)
 
 
+class KVCache:
+    """Per-layer key/value tensors for incremental decoding.
+
+    Preallocated to `size` positions so each decode step writes one column
+    instead of concatenating. `length` counts filled positions (shared by
+    all layers; it advances once per forward, after the last layer, and may
+    be lowered to discard positions). Sequence b is left-padded by pad[b]
+    columns, so cache column c holds its position c - pad[b].
+    """
+
+    def __init__(self, num_layers: int, pad: torch.Tensor, num_heads: int, head_dim: int,
+                 size: int, dtype=torch.float32):
+        shape = (len(pad), num_heads, size, head_dim)
+        self.k = [torch.empty(shape, device=pad.device, dtype=dtype) for _ in range(num_layers)]
+        self.v = [torch.empty(shape, device=pad.device, dtype=dtype) for _ in range(num_layers)]
+        self.pad = pad
+        self.size = size
+        self.key_valid = torch.arange(size, device=pad.device)[None, :] >= pad[:, None]
+        self.length = 0
+
+    def positions(self, n: int) -> torch.Tensor:
+        """(B, n) positions of the next n columns; padding columns get 0."""
+        cols = torch.arange(self.length, self.length + n, device=self.pad.device)
+        return (cols[None, :] - self.pad[:, None]).clamp(min=0)
+
+    def append(self, layer: int, k: torch.Tensor, v: torch.Tensor):
+        end = self.length + k.size(2)
+        self.k[layer][:, :, self.length : end] = k
+        self.v[layer][:, :, self.length : end] = v
+        return self.k[layer][:, :, :end], self.v[layer][:, :, :end]
+
+
 class TinyTransformer(nn.Module):
-    def __init__(self, cfg: dict):
+    def __init__(self, cfg: dict, attn_backend: str = "sdpa"):
         super().__init__()
         self.cfg = cfg
         self.token_emb = nn.Embedding(cfg["vocab_size"], cfg["embed_dim"])
         self.pos_emb = nn.Embedding(cfg["context_len"], cfg["embed_dim"])
         self.layers = nn.ModuleList([
             nn.ModuleDict({
-                "attn": AttentionBlock(cfg["embed_dim"], cfg["num_heads"]),
+                "attn": AttentionBlock(cfg["embed_dim"], cfg["num_heads"], attn_backend),
                 "ffn": FFNBlock(cfg["embed_dim"], cfg["ff_dim"]),
             })
             for _ in range(cfg["num_layers"])
         ])
         self.ln_final = nn.LayerNorm(cfg["embed_dim"])
         self.output = nn.Linear(cfg["embed_dim"], cfg["vocab_size"])
+        # Activation checkpointing: when on, training forwards keep only each
+        # layer's input and recompute its internals during backward.
+        self.checkpoint_layers = False
+
+    def set_activation_checkpointing(self, enabled: bool) -> None:
+        self.checkpoint_layers = enabled
 
-    def forward(self, ids: torch.Tensor) -> torch.Tensor:
+    def set_attention_backend(self, backend: str) -> None:
+        assert backend in ATTENTION_BACKENDS, backend
+        for layer in self.layers:
+            layer["attn"].backend = backend
+
+    def forward(self, ids: torch.Tensor, return_hidden: bool = False) -> torch.Tensor:
+        """Logits (B, T, vocab); with return_hidden, the final-LayerNorm features
+        (B, T, embed_dim) that `output` would project (for fused losses)."""
         B, T = ids.shape
         pos = torch.arange(T, device=ids.device)
         x = self.token_emb(ids) + self.pos_emb(pos)
+        recompute = self.checkpoint_layers and self.training and torch.is_grad_enabled()
         for layer in self.layers:
-            x = x + layer["attn"](x)
-            x = x + layer["ffn"](x)
+            if recompute:
+                x = checkpoint(_layer_forward, layer, x, use_reentrant=False)
+            else:
+                x = _layer_forward(layer, x)
         x = self.ln_final(x)
-        return self.output(x)
+        if return_hidden:
+            return x
+        with record_function("output"):
+            return self.output(x)
+
+    def forward_cached(self, ids: torch.Tensor, cache: KVCache) -> torch.Tensor:
+        """Append new tokens ids: (B, T_new) to the cache; returns their logits."""
+        B, T = ids.shape
+        start = cache.length
+        end = start + T
+        assert end <= cache.size, f"cache full ({cache.size} positions)"
+        x = self.token_emb(ids) + self.pos_emb(cache.positions(T))
+        # Causal over cache columns, restricted to real tokens. Every query may
+        # see itself, so padding rows never softmax over an empty set.
+        cols = torch.arange(end, device=ids.device)
+        rows = torch.arange(start, end, device=ids.device)
+        causal = cols[None, :] <= rows[:, None]
+        mask = (causal[None] & cache.key_valid[:, None, :end]) | (cols[None, None, :] == rows[None, :, None])
+        mask = mask[:, None]  # (B, 1, T_new, end)
+        for i, layer in enumerate(self.layers):
+            with record_function("attention"):
+                x = x + layer["attn"].forward_cached(x, cache, i, mask)
+            with record_function("ffn"):
+                x = x + layer["ffn"](x)
+        cache.length = end
+        with record_function("output"):
+            return self.output(self.ln_final(x))
+
+    def prefill(self, prompts: list[list[int]], reserve: int = 0) -> tuple[torch.Tensor, KVCache]:
+        """Left-pad and run the prompts; returns (logits (B, P, V), cache).
+
+        The cache has room for `reserve` more tokens. Only logits at or after
+        each prompt's own start are meaningful; [:, -1] is every prompt's
+        next-token prediction.
+        """
+        device = self.token_emb.weight.device
+        lengths = torch.tensor([len(p) for p in prompts], device=device)
+        assert lengths.min() >= 1, "empty prompt"
+        P = int(lengths.max())
+        assert P + reserve <= self.cfg["context_len"], \
+            f"{P} + {reserve} tokens exceed context_len={self.cfg['context_len']}"
+        ids = torch.zeros(len(prompts), P, dtype=torch.long, device=device)
+        for b, p in enumerate(prompts):
+            ids[b, P - len(p):] = torch.tensor(p, device=device)
+        attn = self.layers[0]["attn"]
+        cache = KVCache(len(self.layers), P - lengths, attn.num_heads, attn.head_dim,
+                        P + reserve, self.token_emb.weight.dtype)
+        return self.forward_cached(ids, cache), cache
+
+    @torch.inference_mode()
+    def generate(
+        self,
+        prompts: list[list[int]],
+        max_new_tokens: int,
+        *,
+        temperature: float = 1.0,
+        top_k: int | None = None,
+        greedy: bool = False,
+        eos_id: int | None = None,
+        generator: torch.Generator | None = None,
+    ) -> list[list[int]]:
+        """Continue each prompt with a key/value cache: one prefill forward,
+        then one single-token forward per new token.
+
+        Prompts may differ in length (they are left-padded, with per-sequence
+        positions starting at 0). Sampling is greedy, or from the temperature-
+        scaled softmax optionally restricted to the top_k logits. Generation
+        stops at `context_len` (positions are learned, so there is no sliding
+        window); with `eos_id`, a sequence stops at EOS and all stop early once
+        every sequence has. Returns only the new tokens, EOS excluded.
+        """
+        device = self.token_emb.weight.device
+        P = max(len(p) for p in prompts)
+        max_new_tokens = max(0, min(max_new_tokens, self.cfg["context_len"] - P))
+        B = len(prompts)
+        logits, cache = self.prefill(prompts, reserve=max_new_tokens)
+        logits = logits[:, -1]
+
+        out = torch.empty(B, max_new_tokens, dtype=torch.long, device=device)
+        done = torch.zeros(B, dtype=torch.bool, device=device)
+        n = 0
+        for n in range(1, max_new_tokens + 1):
+            nxt = _sample(logits, temperature=temperature, top_k=top_k, greedy=greedy,
+                          generator=generator)
+            out[:, n - 1] = nxt
+            if eos_id is not None:
+                done |= nxt == eos_id
+                if bool(done.all()):
+                    break
+            if n == max_new_tokens:
+                break
+            logits = self.forward_cached(nxt[:, None], cache)[:, -1]
+
+        result = []
+        for row in out[:, :n].tolist():
+            if eos_id is not None and eos_id in row:
+                row = row[: row.index(eos_id)]
+            result.append(row)
+        return result
+
+
+def _layer_forward(layer: nn.ModuleDict, x: torch.Tensor) -> torch.Tensor:
+    # record_function labels group the ops in --profile-steps traces (see _profiling).
+    with record_function("attention"):
+        x = x + layer["attn"](x)
+    with record_function("ffn"):
+        return x + layer["ffn"](x)
+
+
+def sampling_probs(logits: torch.Tensor, *, temperature: float = 1.0,
+                   top_k: int | None = None) -> torch.Tensor:
+    """The distribution generate() samples from: softmax(logits / temperature),
+    renormalised over the top_k logits if given."""
+    logits = logits.float() / max(temperature, 1e-6)
+    if top_k is not None:
+        kth = logits.topk(top_k, dim=-1).values[..., -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    return F.softmax(logits, dim=-1)
+
+
+def _sample(logits: torch.Tensor, *, temperature: float, top_k: int | None, greedy: bool,
+            generator: torch.Generator | None) -> torch.Tensor:
+    if greedy:
+        return logits.argmax(dim=-1)
+    probs = sampling_probs(logits, temperature=temperature, top_k=top_k)
+    return torch.multinomial(probs, 1, generator=generator).squeeze(-1)
@@ -0,0 +1,85 @@
+"""Resumable training state, written on a background thread.
+
+A checkpoint is a plain dict saved with torch.save: model / optimizer /
+scheduler / grad-scaler state dicts, counters, and RNG states. save() takes
+a CPU snapshot of every tensor synchronously (a memory copy), then hands the
+snapshot to a writer thread, so the training loop never waits on the disk
+unless the previous write is still in flight. Files are written to a
+temporary name and renamed, so a run killed mid-write leaves the previous
+checkpoint intact.
+"""
+
+import os
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+
+
+def capture_rng() -> dict:
+    """Every RNG the training loop might draw from."""
+    state = {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng(state: dict) -> None:
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def snapshot(obj: Any) -> Any:
+    """Copy of a (nested) state dict with every tensor cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def load_checkpoint(path: Path) -> dict:
+    # weights_only=False: the state holds numpy / python RNG tuples.
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+class AsyncCheckpointer:
+    """Writes checkpoints to `path` on one background thread."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="checkpoint")
+        self.pending: Future | None = None
+
+    def _write(self, state: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        torch.save(state, tmp)
+        os.replace(tmp, self.path)
+
+    def save(self, state: dict) -> None:
+        """Snapshot `state` now, write it in the background."""
+        state = snapshot(state)
+        self.wait()  # at most one write in flight (and surfaces its errors)
+        self.pending = self.executor.submit(self._write, state)
+
+    def wait(self) -> None:
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def close(self) -> None:
+        self.wait()
+        self.executor.shutdown()
@@ -0,0 +1,172 @@
+"""Shared corpus loading + tokenization for the training scripts.
+
+Stories come either from the TinyStories `datasets` stream or from a local
+file (`.jsonl` with a "text" field per line, or `.txt` with stories separated
+by blank lines / `<|endoftext|>`), so the tokenization stage can be run and
+benchmarked offline.
+
+Tokenization uses `Tokenizer.encode_batch` over chunks of stories. With
+`workers > 1` the chunks are spread over a process pool, each worker loading
+its own copy of the tokenizer; with `workers == 1` the chunks are encoded
+in-process (encode_batch is still multi-threaded inside the Rust library).
+"""
+
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from tokenizers import Tokenizer
+
+TINYSTORIES = "roneneldan/TinyStories"
+STORY_SEPARATOR = "<|endoftext|>"
+
+
+def iter_stories(source: str | None, num_stories: int) -> Iterator[str]:
+    """Yield up to `num_stories` story texts from a local file or TinyStories.
+
+    `source=None` streams the TinyStories train split (needs `datasets`).
+    """
+    if source is None:
+        from datasets import load_dataset
+
+        ds = load_dataset(TINYSTORIES, split="train", streaming=True)
+        texts = (row["text"] for row in ds)
+    else:
+        path = Path(source)
+        texts = _iter_jsonl(path) if path.suffix == ".jsonl" else _iter_txt(path)
+    return islice(texts, num_stories)
+
+
+def _iter_jsonl(path: Path) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)["text"]
+
+
+def _iter_txt(path: Path) -> Iterator[str]:
+    # TinyStories' own dumps separate stories with <|endoftext|> (and may have
+    # blank lines inside a story); plain files separate them with blank lines.
+    with open(path, encoding="utf-8") as f:
+        by_separator = STORY_SEPARATOR in f.read(1 << 20)
+    buf: list[str] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped == STORY_SEPARATOR or (not stripped and not by_separator):
+                if buf:
+                    yield "\n".join(buf)
+                    buf = []
+            elif stripped:
+                buf.append(stripped)
+    if buf:
+        yield "\n".join(buf)
+
+
+# ---------------------------------------------------------------------------
+# Tokenization
+# ---------------------------------------------------------------------------
+_worker_tok: Tokenizer | None = None
+
+
+def _init_worker(tokenizer_path: str) -> None:
+    global _worker_tok
+    # Each worker is one process; don't let the Rust thread pool oversubscribe.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tok = Tokenizer.from_file(tokenizer_path)
+
+
+def _encode_chunk(texts: list[str]) -> list[list[int]]:
+    assert _worker_tok is not None
+    return [enc.ids for enc in _worker_tok.encode_batch(texts)]
+
+
+def _chunks(texts: Iterable[str], size: int) -> Iterator[list[str]]:
+    it = iter(texts)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def encode_stories(
+    tokenizer_path: Path,
+    texts: Iterable[str],
+    *,
+    workers: int = 1,
+    chunk_size: int = 1000,
+    log_every: int = 10_000,
+) -> Iterator[list[int]]:
+    """Tokenize `texts` into token-id lists, in order.
+
+    This is a generator, so callers can stream the ids into their own storage
+    rather than holding the whole corpus. At most `2 * workers` chunks are in
+    flight at once.
+    """
+    done = 0
+    next_log = log_every
+    if workers <= 1:
+        tok = Tokenizer.from_file(str(tokenizer_path))
+        encoded = ([enc.ids for enc in tok.encode_batch(c)] for c in _chunks(texts, chunk_size))
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(str(tokenizer_path),)
+        )
+        encoded = _ordered_map(pool, _chunks(texts, chunk_size), window=2 * workers)
+    try:
+        for ids_chunk in encoded:
+            yield from ids_chunk
+            done += len(ids_chunk)
+            if done >= next_log:
+                print(f"  Tokenized {done:,} stories...")
+                next_log += log_every
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _ordered_map(pool: ProcessPoolExecutor, chunks: Iterator[list[str]],
+                 window: int) -> Iterator[list[list[int]]]:
+    """Like pool.map, but only keeps `window` chunks in flight."""
+    pending: deque = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(_encode_chunk, chunk))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def add_corpus_args(parser) -> None:
+    """Register the --corpus / --workers / --rebuild-cache flags shared by the trainers."""
+    parser.add_argument("--corpus", default=None,
+                        help="Local .txt/.jsonl corpus instead of streaming TinyStories.")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Tokenizer processes (1 = in-process encode_batch).")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="Re-tokenize even if data/token-cache has this corpus.")
+
+
+if __name__ == "__main__":
+    # Offline throughput check: python scripts/_corpus.py corpus.jsonl [workers]
+    import time
+
+    root = Path(__file__).resolve().parent.parent
+    tok_path = root / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else default_workers()
+    t0 = time.time()
+    n_stories = n_tokens = 0
+    for ids in encode_stories(tok_path, iter_stories(sys.argv[1], 10**9), workers=n_workers):
+        n_stories += 1
+        n_tokens += len(ids)
+    dt = time.time() - t0
+    print(f"{n_stories:,} stories, {n_tokens:,} tokens in {dt:.2f}s "
+          f"({n_tokens / dt:,.0f} tokens/s, workers={n_workers})")
@@ -0,0 +1,51 @@
+"""Single-machine multi-process data parallelism (DDP over gloo).
+
+One PyTorch process does not scale linearly across a many-core CPU. Instead,
+launch() starts N workers that split the cores between them and average
+gradients with DistributedDataParallel. The gloo backend on 127.0.0.1
+needs no GPU and no network. Only rank 0 keeps its stdout, so per-rank
+logging doesn't need guarding.
+"""
+
+import os
+import socket
+import sys
+from typing import Callable
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def world() -> tuple[int, int]:
+    """(rank, world_size); (0, 1) when not running distributed."""
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank: int, world_size: int, port: int, fn: Callable, args: tuple) -> None:
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    if rank != 0:
+        sys.stdout = open(os.devnull, "w")
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn: Callable, nproc: int, *args) -> None:
+    """Run fn(rank, world_size, *args) in `nproc` processes and wait for all.
+
+    `fn` must be importable (module level) since workers are spawned.
+    """
+    mp.spawn(_worker, args=(nproc, _free_port(), fn, args), nprocs=nproc, join=True)
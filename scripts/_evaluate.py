@@ -0,0 +1,82 @@
+"""Held-out evaluation shared by the trainers.
+
+Loss and top-k hit counts are accumulated as device tensors and copied to the
+host once, at the end, instead of calling `.item()` per batch (each of which
+is a full device sync on CUDA/MPS). Pulls only torch, like _attention_model.
+"""
+
+import math
+from typing import Iterable
+
+import torch
+import torch.nn.functional as F
+
+
+class Evaluator:
+    """Running next-token metrics for one or more models on shared batches.
+
+    Logits may be (N, V) or (B, T, V); targets are the matching ids.
+    """
+
+    def __init__(self, n_models: int = 1, *, device: str | torch.device = "cpu",
+                 topk: tuple[int, ...] = (1, 5)):
+        self.topk = topk
+        # float64 keeps long sums exact enough; MPS has no float64.
+        acc_dtype = torch.float32 if torch.device(device).type == "mps" else torch.float64
+        self.loss_sum = torch.zeros(n_models, dtype=acc_dtype, device=device)
+        self.hits = torch.zeros(n_models, len(topk), dtype=torch.int64, device=device)
+        self.count = 0  # targets seen per model (host int: known without a sync)
+
+    def update(self, j: int, logits: torch.Tensor, targets: torch.Tensor) -> None:
+        logits = logits.reshape(-1, logits.size(-1))
+        targets = targets.reshape(-1)
+        self.loss_sum[j] += F.cross_entropy(logits.float(), targets, reduction="sum")
+        ranked = logits.topk(max(self.topk), dim=-1).indices == targets[:, None]
+        self.hits[j] += torch.stack([ranked[:, :k].sum() for k in self.topk])
+        if j == 0:
+            self.count += targets.numel()
+
+    def result(self) -> list[dict]:
+        """One host sync: per model loss, perplexity and top-k accuracy (%)."""
+        loss_sum, hits = self.loss_sum.tolist(), self.hits.tolist()
+        out = []
+        for j in range(len(loss_sum)):
+            loss = loss_sum[j] / max(self.count, 1)
+            m = {"loss": loss, "ppl": math.exp(min(loss, 50.0)), "n": self.count}
+            for k, h in zip(self.topk, hits[j]):
+                m[f"top{k}"] = h / max(self.count, 1) * 100
+            out.append(m)
+        return out
+
+
+def evaluate(
+    models: list[torch.nn.Module] | torch.nn.Module,
+    batches: Iterable[tuple[torch.Tensor, torch.Tensor]],
+    *,
+    device: str | torch.device = "cpu",
+    topk: tuple[int, ...] = (1, 5),
+) -> list[dict] | dict:
+    """Evaluate model(s) over (inputs, targets) batches under inference_mode.
+
+    Each batch is moved to `device` once and shared by every model. Returns a
+    metrics dict (or a list, one per model, if a list was passed). Models are
+    put in eval mode and returned to their previous mode afterwards.
+    """
+    single = isinstance(models, torch.nn.Module)
+    models = [models] if single else list(models)
+    was_training = [m.training for m in models]
+    ev = Evaluator(len(models), device=device, topk=topk)
+    try:
+        for m in models:
+            m.eval()
+        with torch.inference_mode():
+            for x, y in batches:
+                x = x.to(device, non_blocking=True)
+                y = y.to(device, non_blocking=True)
+                for j, m in enumerate(models):
+                    ev.update(j, m(x), y)
+    finally:
+        for m, t in zip(models, was_training):
+            m.train(t)
+    results = ev.result()
+    return results[0] if single else results
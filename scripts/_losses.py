@@ -0,0 +1,112 @@
+"""Memory-lean training losses for the vocabulary projection.
+
+chunked_cross_entropy fuses the final Linear with cross-entropy. The usual
+`F.cross_entropy(output(h), y)` materialises (N, vocab) logits, keeps them
+for backward, and then allocates their gradient, all at once. Here the
+rows are processed `chunk_size` at a time, and the gradients for the hidden
+states, weight and bias are computed in the same pass. Only one chunk of
+logits exists at any moment. The loss and gradients are those of the
+unfused version, up to float rounding.
+
+sampled_softmax_cross_entropy trades exactness for speed instead. Each step
+scores the target and a few hundred negatives drawn from a unigram proposal
+Q over the corpus, rather than the whole vocabulary. It is used for
+training only; validation and export still use the full softmax.
+"""
+
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+class _ChunkedLinearCrossEntropy(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, hidden, weight, bias, targets, chunk_size):
+        n = hidden.size(0)
+        needs_grad = any(ctx.needs_input_grad[:3])
+        loss = torch.zeros((), dtype=torch.float32, device=hidden.device)
+        if needs_grad:
+            grad_hidden = torch.empty_like(hidden)
+            grad_weight = torch.zeros_like(weight, dtype=torch.float32)
+            grad_bias = torch.zeros_like(bias, dtype=torch.float32) if bias is not None else None
+        for i in range(0, n, chunk_size):
+            h, y = hidden[i : i + chunk_size], targets[i : i + chunk_size]
+            logits = F.linear(h, weight, bias).float()
+            lse = torch.logsumexp(logits, dim=-1)
+            loss += (lse - logits.gather(1, y[:, None]).squeeze(1)).sum()
+            if not needs_grad:
+                continue
+            # d(mean CE)/d(logits) = (softmax - onehot) / n, reusing `logits`.
+            g = logits.sub_(lse[:, None]).exp_()
+            g[torch.arange(len(y), device=y.device), y] -= 1
+            g /= n
+            g = g.to(h.dtype)
+            grad_hidden[i : i + chunk_size] = g @ weight.to(h.dtype)
+            grad_weight += (g.t() @ h).float()
+            if grad_bias is not None:
+                grad_bias += g.float().sum(0)
+        if needs_grad:
+            ctx.save_for_backward(grad_hidden, grad_weight.to(weight.dtype),
+                                  grad_bias.to(bias.dtype) if bias is not None else None)
+        return loss / n
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        grad_hidden, grad_weight, grad_bias = ctx.saved_tensors
+        return (grad_hidden * grad_out, grad_weight * grad_out,
+                grad_bias * grad_out if grad_bias is not None else None, None, None)
+
+
+def chunked_cross_entropy(hidden: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor | None,
+                          targets: torch.Tensor, chunk_size: int = 1024) -> torch.Tensor:
+    """Mean cross-entropy of `F.linear(hidden, weight, bias)` against `targets`.
+
+    hidden: (..., C), targets: (...). Equivalent to
+    F.cross_entropy(F.linear(hidden, weight, bias).view(-1, V), targets.view(-1)).
+    """
+    return _ChunkedLinearCrossEntropy.apply(hidden.reshape(-1, hidden.size(-1)), weight, bias,
+                                            targets.reshape(-1), chunk_size)
+
+
+def unigram_log_q(tokens: np.ndarray, vocab_size: int, power: float = 0.75,
+                  chunk: int = 1 << 24) -> torch.Tensor:
+    """Log-probabilities of the sampled-softmax proposal: corpus unigram
+    counts raised to `power` (flattening the head, as in word2vec), add-one
+    smoothed so every token can be drawn. Counts a memmap in `chunk`s."""
+    counts = np.ones(vocab_size, dtype=np.float64)
+    for i in range(0, len(tokens), chunk):
+        counts += np.bincount(tokens[i : i + chunk], minlength=vocab_size)[:vocab_size]
+    log_q = power * np.log(counts)
+    return torch.from_numpy(log_q - np.logaddexp.reduce(log_q)).float()
+
+
+def sampled_softmax_cross_entropy(hidden: torch.Tensor, weight: torch.Tensor,
+                                  bias: torch.Tensor | None, targets: torch.Tensor,
+                                  log_q: torch.Tensor, num_samples: int,
+                                  generator: torch.Generator | None = None) -> torch.Tensor:
+    """Sampled-softmax estimate of chunked_cross_entropy's loss (Jean et al., 2015).
+
+    `num_samples` negatives are drawn with replacement from exp(log_q), once
+    per call and shared by every row. The logits of the target and of each
+    negative are then corrected by subtracting log(num_samples * q), the
+    log of the expected number of times that token is drawn (the log-Q
+    correction). Without the correction, training would learn p / q rather
+    than p. A negative that equals a row's target is masked out of that row.
+    Only num_samples + 1 output rows are touched instead of the whole
+    vocabulary.
+    """
+    h = hidden.reshape(-1, hidden.size(-1))
+    y = targets.reshape(-1)
+    neg = torch.multinomial(log_q.exp(), num_samples, replacement=True, generator=generator)
+    log_expected = log_q + math.log(num_samples)
+    true_logits = (h * weight[y].to(h.dtype)).sum(-1)
+    neg_logits = h @ weight[neg].to(h.dtype).t()
+    if bias is not None:
+        true_logits = true_logits + bias[y]
+        neg_logits = neg_logits + bias[neg]
+    true_logits = true_logits.float() - log_expected[y]
+    neg_logits = (neg_logits.float() - log_expected[neg]).masked_fill(neg == y[:, None], -math.inf)
+    logits = torch.cat([true_logits[:, None], neg_logits], dim=1)
+    return F.cross_entropy(logits, torch.zeros_like(y))
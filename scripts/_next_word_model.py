@@ -0,0 +1,41 @@
+"""Shared model definition for the next-word widget.
+
+Like _attention_model.py, this pulls only torch, so the trainer, the test
+script and the inference tools can share it.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.profiler import record_function
+
+
+def count_params(vocab_size: int, embed_dim: int, context_len: int, hidden_dim: int) -> int:
+    """NextWordModel's parameter count for a config, without building it."""
+    return (vocab_size * embed_dim                                  # embedding
+            + context_len * embed_dim * hidden_dim + hidden_dim     # fc1
+            + hidden_dim * vocab_size + vocab_size)                 # fc2
+
+
+class NextWordModel(nn.Module):
+    """Simple next-word predictor: embed context tokens → flatten → dense → vocab."""
+
+    def __init__(self, vocab_size: int, embed_dim: int, context_len: int, hidden_dim: int):
+        super().__init__()
+        self.context_len = context_len
+        self.embed_dim = embed_dim
+        self.embedding = nn.Embedding(vocab_size, embed_dim)
+        self.fc1 = nn.Linear(context_len * embed_dim, hidden_dim)
+        self.fc2 = nn.Linear(hidden_dim, vocab_size)
+
+    def forward(self, x: torch.Tensor, return_hidden: bool = False) -> torch.Tensor:
+        # x: (batch, context_len) of token ids
+        e = self.embedding(x)  # (batch, context_len, embed_dim)
+        e = e.view(e.size(0), -1)  # (batch, context_len * embed_dim)
+        with record_function("ffn"):  # labels for --profile-steps (see _profiling)
+            h = F.relu(self.fc1(e))
+        # return_hidden: the fc2 inputs, for losses that apply fc2 themselves (_losses)
+        if return_hidden:
+            return h
+        with record_function("output"):
+            return self.fc2(h)  # (batch, vocab_size)
@@ -0,0 +1,104 @@
+"""Opt-in torch.profiler capture over a window of steps.
+
+--profile-steps START:END profiles steps START through END (1-based, as in
+the training logs; a "step" is an optimizer step for the trainers and a
+model batch or generation for the inference scripts). When the window
+closes, two files are written to `out_dir` (PROFILE_DIR, data/profiles, for
+the scripts: outside public/, so traces are never deployed or committed):
+
+    {name}.trace.json    Chrome trace (chrome://tracing or ui.perfetto.dev)
+    {name}.top-ops.txt   ops with the most self time, and the labelled spans
+
+The table is printed too. The model code labels its attention and FFN
+sub-blocks, and the loops label loss / backward / optimizer, with
+torch.profiler.record_function, so those show up as named spans.
+
+    prof = StepProfiler(args.profile_steps, PROFILE_DIR, "attention-train", device=device)
+    for ...:
+        ...one step...
+        prof.step()
+    prof.close()
+"""
+
+import argparse
+from pathlib import Path
+
+import torch
+
+PROFILE_DIR = Path(__file__).resolve().parent.parent / "data" / "profiles"
+LABELS = ("attention", "ffn", "output", "loss", "backward", "optimizer")
+
+
+def parse_window(spec: str) -> tuple[int, int]:
+    start, end = (int(n) for n in spec.split(":"))
+    if not 1 <= start <= end:
+        raise argparse.ArgumentTypeError(f"need 1 <= START <= END, got {spec}")
+    return start, end
+
+
+def add_profile_args(parser) -> None:
+    """Register --profile-steps."""
+    parser.add_argument("--profile-steps", type=parse_window, default=None, metavar="START:END",
+                        help="Run torch.profiler over steps START..END and write a Chrome trace "
+                             "and a top-ops table to data/profiles/.")
+
+
+class StepProfiler:
+    """Profiles steps window[0]..window[1]; a no-op when `window` is None."""
+
+    def __init__(self, window: tuple[int, int] | None, out_dir: Path, name: str, *,
+                 device="cpu", row_limit: int = 25):
+        self.window = window
+        self.out_dir = Path(out_dir)
+        self.name = name
+        self.cuda = torch.device(device).type == "cuda"
+        self.row_limit = row_limit
+        self.steps = 0
+        self.prof = None
+        if window is not None and window[0] == 1:
+            self._start()
+
+    def _start(self) -> None:
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.cuda:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.prof = torch.profiler.profile(activities=activities, record_shapes=True)
+        self.prof.start()
+
+    def step(self) -> None:
+        """Call after every step."""
+        if self.window is None:
+            return
+        self.steps += 1
+        start, end = self.window
+        if self.steps == start - 1:
+            self._start()
+        elif self.steps == end and self.prof is not None:
+            self._finish()
+
+    def close(self) -> None:
+        """Write what was captured if the run ended inside the window."""
+        if self.prof is not None:
+            self._finish()
+
+    def _finish(self) -> None:
+        prof, self.prof = self.prof, None
+        prof.stop()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        trace = self.out_dir / f"{self.name}.trace.json"
+        prof.export_chrome_trace(str(trace))
+
+        events = prof.key_averages()
+        kind = "cuda" if self.cuda else "cpu"
+        top = events.table(sort_by=f"self_{kind}_time_total", row_limit=self.row_limit)
+        labelled = sorted((e for e in events if e.key in LABELS),
+                          key=lambda e: -getattr(e, f"{kind}_time_total"))
+        n = min(self.steps, self.window[1]) - self.window[0] + 1
+        lines = [f"Labelled spans over {n} step(s), total {kind} time:"]
+        lines += [f"  {e.key:<10} {getattr(e, f'{kind}_time_total') / 1e3:>10.1f} ms "
+                  f"({e.count} calls)" for e in labelled]
+        text = f"{top}\n" + "\n".join(lines) + "\n"
+        path = self.out_dir / f"{self.name}.top-ops.txt"
+        path.write_text(text)
+        print(f"\nProfile of steps {self.window[0]}..{self.window[0] + n - 1}:\n{text}"
+              f"Wrote {trace} and {path}")
@@ -0,0 +1,222 @@
+"""Speculative decoding: the next-word MLP drafts, TinyTransformer verifies.
+
+Both models share ts-tokenizer-4096. Each round the cheap draft model
+proposes k tokens one at a time, and the transformer scores all of them in
+one cached forward. Draft token d_i (drawn from q_i) is accepted with
+probability min(1, p_i(d_i) / q_i(d_i)). On the first rejection a
+replacement is drawn from max(0, p_i - q_i) renormalised, and the round
+ends. If all k are accepted, one bonus token is drawn from p_{k+1}. The
+output has exactly the distribution of sampling from the transformer alone
+(Leviathan et al., 2023); with greedy=True it is the transformer's greedy
+continuation. Each round costs k draft forwards and one target forward and
+yields between 1 and k+1 tokens.
+
+Benchmark (acceptance rate and tokens/s against plain KV-cached sampling):
+    uv run scripts/_speculative.py --k 1,2,4,6
+"""
+
+import time
+from dataclasses import dataclass
+
+import torch
+
+from _attention_model import TinyTransformer, sampling_probs
+from _next_word_model import NextWordModel
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args
+
+
+@dataclass
+class SpecStats:
+    proposed: int = 0  # draft tokens offered to the target
+    accepted: int = 0  # ... of which the target kept
+    target_calls: int = 0  # target forwards, prefill included
+    tokens: int = 0  # tokens generated
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / max(self.proposed, 1)
+
+    def __iadd__(self, other: "SpecStats") -> "SpecStats":
+        self.proposed += other.proposed
+        self.accepted += other.accepted
+        self.target_calls += other.target_calls
+        self.tokens += other.tokens
+        return self
+
+
+def _draft_window(tokens: list[int], ctx: int, bos: int) -> list[int]:
+    """The draft model's fixed-width context, left-padded with BOS."""
+    window = tokens[-ctx:]
+    return [bos] * (ctx - len(window)) + window
+
+
+@torch.inference_mode()
+def speculative_generate(
+    target: TinyTransformer,
+    draft: NextWordModel,
+    prompt: list[int],
+    max_new_tokens: int,
+    *,
+    k: int = 4,
+    temperature: float = 1.0,
+    top_k: int | None = None,
+    greedy: bool = False,
+    eos_id: int | None = None,
+    bos_id: int = 1,
+    generator: torch.Generator | None = None,
+) -> tuple[list[int], SpecStats]:
+    """Continue one prompt; same arguments and result as TinyTransformer.generate
+    (for a single prompt), plus the round statistics."""
+    device = target.token_emb.weight.device
+    max_new_tokens = max(0, min(max_new_tokens, target.cfg["context_len"] - len(prompt)))
+    stats = SpecStats()
+
+    def probs(logits: torch.Tensor) -> torch.Tensor:
+        return sampling_probs(logits, temperature=temperature, top_k=top_k)
+
+    def pick(dist: torch.Tensor) -> int:
+        if greedy:
+            return int(dist.argmax())
+        return int(torch.multinomial(dist, 1, generator=generator))
+
+    logits, cache = target.prefill([prompt], reserve=max_new_tokens)
+    stats.target_calls += 1
+    p_next = probs(logits[0, -1:])  # target distribution for the next token
+    seq = list(prompt)
+    out: list[int] = []
+    pending: list[int] = []  # sampled but not yet in the cache (at most one)
+
+    while len(out) < max_new_tokens:
+        # Leave room for the round's final token, within the cache and max_new_tokens.
+        n_draft = min(k, max_new_tokens - len(out) - 1)
+        drafts, q = [], []
+        for _ in range(n_draft):
+            window = torch.tensor([_draft_window(seq + drafts, draft.context_len, bos_id)],
+                                  device=device)
+            q.append(probs(draft(window))[0])
+            drafts.append(pick(q[-1]))
+
+        # One target forward scores every draft: row i is the distribution
+        # for the token after (pending + drafts)[i].
+        base = cache.length
+        if pending or drafts:
+            rows = probs(target.forward_cached(torch.tensor([pending + drafts], device=device),
+                                               cache)[0])
+            stats.target_calls += 1
+        else:
+            rows = p_next[:0]
+        p = torch.cat([p_next, rows]) if not pending else rows  # p[i] is for drafts[i]
+
+        n_ok = 0
+        for i, d in enumerate(drafts):
+            if greedy:
+                ok = d == int(p[i].argmax())
+            else:
+                u = torch.rand((), device=device, generator=generator)
+                ok = bool(u * q[i][d] < p[i][d])
+            if not ok:
+                break
+            n_ok += 1
+        stats.proposed += len(drafts)
+        stats.accepted += n_ok
+
+        if n_ok < len(drafts) and not greedy:
+            residual = (p[n_ok] - q[n_ok]).clamp(min=0)
+            nxt = pick(residual / residual.sum())
+        else:
+            nxt = pick(p[n_ok])
+        new = drafts[:n_ok] + [nxt]
+        # Keep the cache entries of pending + accepted drafts; the rest are
+        # overwritten next round. `nxt` becomes the new pending token.
+        cache.length = base + len(pending) + n_ok
+        pending = [nxt]
+        p_next = p[:0]
+
+        for t in new:
+            if eos_id is not None and t == eos_id:
+                stats.tokens += len(out)
+                return out, stats
+            out.append(t)
+            seq.append(t)
+    out = out[:max_new_tokens]
+    stats.tokens += len(out)
+    return out, stats
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+BENCH_PROMPTS = [
+    "once upon a time", "the little girl", "she was very", "he said", "they went to",
+    "the cat sat on the", "it was a sunny day and", "lily wanted to play with her",
+    "one day, a little boy named tom went to the park. he saw a big",
+]
+
+
+def _bench(args) -> None:
+    from pathlib import Path
+
+    from tokenizers import Tokenizer
+
+    from _weights import load_attention_model, load_next_word_model
+
+    root = Path(__file__).resolve().parent.parent
+    tok = Tokenizer.from_file(str(root / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"))
+    target, _ = load_attention_model(root / "public" / "data" / "attention-model")
+    draft, _ = load_next_word_model(root / "public" / "data" / "next-word-model", args.draft)
+    eos = tok.token_to_id("[EOS]")
+    bos = tok.token_to_id("[BOS]") or 1
+    prompts = [tok.encode(p).ids for p in BENCH_PROMPTS] * args.repeats
+    sampling = {"temperature": args.temperature, "top_k": args.top_k, "greedy": args.greedy}
+    # Steps are generations, counted across the modes in the order they run.
+    profiler = StepProfiler(args.profile_steps, PROFILE_DIR, "speculative")
+
+    def generate(fn, p, gen) -> int:
+        n = fn(p, gen)
+        profiler.step()
+        return n
+
+    def timed(fn) -> tuple[float, int]:
+        gen = torch.Generator().manual_seed(args.seed)
+        t0 = time.perf_counter()
+        n = sum(generate(fn, p, gen) for p in prompts)
+        return time.perf_counter() - t0, n
+
+    base_s, base_n = timed(lambda p, g: len(target.generate(
+        [p], args.max_new_tokens, eos_id=eos, generator=g, **sampling)[0]))
+    print(f"\n{len(prompts)} prompts, up to {args.max_new_tokens} new tokens, draft {args.draft}, "
+          f"{'greedy' if args.greedy else f'temperature={args.temperature} top_k={args.top_k}'}")
+    print(f"{'Mode':<10} {'accept':>7} {'tok/call':>9} {'tok/s':>8} {'speedup':>8}")
+    print(f"{'target':<10} {'':>7} {1.0:>9.2f} {base_n / base_s:>8,.0f} {1.0:>7.2f}x")
+    for k in args.k:
+        total = SpecStats()
+
+        def run(p, g, k=k):
+            out, st = speculative_generate(target, draft, p, args.max_new_tokens, k=k, eos_id=eos,
+                                           bos_id=bos, generator=g, **sampling)
+            nonlocal total
+            total += st
+            return len(out)
+
+        s, n = timed(run)
+        print(f"{f'k={k}':<10} {total.acceptance_rate:>6.0%} {n / total.target_calls:>9.2f} "
+              f"{n / s:>8,.0f} {(n / s) / (base_n / base_s):>7.2f}x")
+    profiler.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding.")
+    parser.add_argument("--draft", default="next-word-best", help="next-word export to draft with.")
+    parser.add_argument("--k", type=lambda s: [int(x) for x in s.split(",")], default=[2, 4],
+                        help="Comma-separated draft lengths to try.")
+    parser.add_argument("--max-new-tokens", type=int, default=48)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--greedy", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3, help="Times to run each prompt.")
+    parser.add_argument("--seed", type=int, default=0)
+    add_profile_args(parser)
+    torch.set_grad_enabled(False)
+    _bench(parser.parse_args())
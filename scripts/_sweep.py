@@ -0,0 +1,74 @@
+"""Successive-halving scheduler for hyperparameter sweeps.
+
+Every candidate is trained on a small budget, the best 1/eta are kept, the
+survivors get eta times the budget, and so on until the finalists have been
+trained on the full budget. Most of the compute goes to configs that are
+still in the running, so a sweep can cover many more configs for the same
+cost as training a few of them to completion.
+
+The scheduler only knows about budgets and losses. The caller's `train_fn`
+decides what a budget unit is (epochs, steps, ...) and whether a promoted
+candidate resumes from its previous state or restarts with the bigger
+budget.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+# train_fn(candidate, state, budget) -> (val_loss, state). `state` is None on a
+# candidate's first rung and otherwise whatever the previous call returned;
+# `budget` is the total the candidate should have been trained for so far.
+TrainFn = Callable[[Any, Any, int], tuple[float, Any]]
+
+
+@dataclass
+class Trial:
+    candidate: Any
+    loss: float = math.inf
+    budget: int = 0
+    state: Any = None
+    elapsed: float = 0.0
+
+
+def rung_budgets(min_budget: int, max_budget: int, eta: int) -> list[int]:
+    """Budgets from small to max_budget, each eta times the previous."""
+    n_rungs = max(0, math.floor(math.log(max_budget / min_budget, eta) + 1e-9))
+    budgets = [max(1, round(max_budget / eta**k)) for k in range(n_rungs, -1, -1)]
+    return sorted(set(budgets))
+
+
+def successive_halving(
+    candidates: Sequence,
+    train_fn: TrainFn,
+    *,
+    min_budget: int,
+    max_budget: int,
+    eta: int = 3,
+    label: Callable[[Any], str] = str,
+) -> list[Trial]:
+    """Run successive halving; returns every trial, best (lowest loss) first.
+
+    Trials eliminated early keep the loss and budget they stopped at, and have
+    their state dropped so only survivors' models stay in memory.
+    """
+    trials = [Trial(c) for c in candidates]
+    alive = list(trials)
+    budgets = rung_budgets(min_budget, max_budget, eta)
+    for rung, budget in enumerate(budgets):
+        print(f"\n--- Rung {rung + 1}/{len(budgets)}: {len(alive)} candidates @ budget {budget} ---")
+        for trial in alive:
+            t0 = time.time()
+            trial.loss, trial.state = train_fn(trial.candidate, trial.state, budget)
+            trial.budget = budget
+            trial.elapsed += time.time() - t0
+            print(f"  {label(trial.candidate)}: val_loss={trial.loss:.4f} "
+                  f"({trial.elapsed:.1f}s total)")
+        alive.sort(key=lambda t: t.loss)
+        if rung < len(budgets) - 1:
+            keep = max(1, math.ceil(len(alive) / eta))
+            for trial in alive[keep:]:
+                trial.state = None
+            alive = alive[:keep]
+    return sorted(trials, key=lambda t: (-t.budget, t.loss))
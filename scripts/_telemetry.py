@@ -0,0 +1,180 @@
+"""Training telemetry: one JSON line per sampled step.
+
+Every `every`-th optimizer step gets a record in the JSONL file with its
+data-fetch, forward, backward and optimizer time, tokens/s and samples/s,
+peak RSS (plus peak CUDA memory), learning rate, grad-norm and loss.
+Other steps cost two perf_counter() calls.
+
+Timing is host-side, so on CUDA a phase measures kernel launches rather
+than kernel time unless `sync` is set, which synchronizes the device
+around each phase of a sampled step. Tensor values (loss, grad-norm) are
+kept as tensors and read when the next record is due, or at flush(). By
+then the device has long finished them, so recording never stalls the
+training loop.
+
+    tel = Telemetry(path, every=10, device=device, run={"trainer": "attention"})
+    for batch in tel.iter(batches):       # time spent waiting = fetch
+        with tel.phase("forward"): ...
+        with tel.phase("backward"): ...
+        with tel.phase("optimizer"): ...
+        tel.end_step(tokens=..., samples=..., lr=..., grad_norm=..., loss=...)
+    tel.close()
+"""
+
+import contextlib
+import json
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import torch
+
+from _accel import peak_memory_mb
+
+PHASES = ("fetch", "forward", "backward", "optimizer")
+
+
+def add_telemetry_args(parser) -> None:
+    """Register the --telemetry flags shared by the trainers."""
+    parser.add_argument("--telemetry", type=Path, default=None, metavar="PATH",
+                        help="Append per-step timing / throughput records to this JSONL file.")
+    parser.add_argument("--telemetry-every", type=int, default=10, metavar="STEPS",
+                        help="Record every STEPS-th optimizer step.")
+    parser.add_argument("--telemetry-sync", action="store_true",
+                        help="Synchronize the device around timed phases (exact GPU timing, "
+                             "slower).")
+
+
+def from_args(args, device, run: dict | None = None) -> "Telemetry":
+    return Telemetry(args.telemetry, every=args.telemetry_every, sync=args.telemetry_sync,
+                     device=device, run=run)
+
+
+def grad_norm(params: Iterable[torch.Tensor]) -> torch.Tensor | None:
+    """Total L2 norm of the gradients, as a tensor (no host sync)."""
+    norms = [p.grad.detach().norm() for p in params if p.grad is not None]
+    return torch.linalg.vector_norm(torch.stack(norms)) if norms else None
+
+
+def _value(x):
+    if isinstance(x, torch.Tensor):
+        return x.item() if x.ndim == 0 else x.tolist()
+    return x
+
+
+class Telemetry:
+    """JSONL step records; a no-op when `path` is None.
+
+    `run` fields are copied into every record (e.g. trainer name, model).
+    The file is opened on the first write and appended to, so a resumed run
+    continues the same stream, and an instance that has not written yet
+    can be pickled into worker processes.
+    """
+
+    def __init__(self, path: Path | None, *, every: int = 10, sync: bool = False,
+                 device="cpu", run: dict | None = None):
+        self.path = Path(path) if path is not None else None
+        self.every = max(1, every)
+        self.device = torch.device(device)
+        self.sync = sync and self.device.type == "cuda"
+        self.run = run or {}
+        self.steps = 0
+        self._file = None
+        self._pending: dict | None = None
+        self._times = dict.fromkeys(PHASES, 0.0)
+        self._step_start = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def sampled(self) -> bool:
+        """Whether the step in progress will be recorded."""
+        return self.enabled and self.steps % self.every == 0
+
+    def _now(self) -> float:
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter()
+
+    def phase(self, name: str):
+        """Context manager adding its duration to `name` for a sampled step."""
+        if not self.sampled:
+            return contextlib.nullcontext()
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str):
+        t0 = self._now()
+        try:
+            yield
+        finally:
+            self._times[name] += self._now() - t0
+
+    def iter(self, items: Iterable) -> Iterator:
+        """Yield from `items`, timing each wait as the "fetch" phase."""
+        it = iter(items)
+        while True:
+            with self.phase("fetch"):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def restart_clock(self) -> None:
+        """Start the current step's wall clock now (e.g. after an evaluation)."""
+        self._step_start = time.perf_counter()
+
+    def end_step(self, *, tokens: int, samples: int, step: int | None = None,
+                 lr: float | None = None,
+                 grad_norm: torch.Tensor | float | None = None,
+                 loss: torch.Tensor | float | None = None, **extra) -> None:
+        """Close an optimizer step; on sampled steps, queue its record.
+
+        `step` is the trainer's own step number (default: steps seen here).
+        """
+        if not self.enabled:
+            return
+        if self.sampled:
+            step_s = self._now() - self._step_start
+            record = {
+                "time": time.time(), **self.run, "step": step or self.steps + 1,
+                **{f"{name}_ms": round(t * 1e3, 3) for name, t in self._times.items()},
+                "step_ms": round(step_s * 1e3, 3),
+                "tokens_per_s": round(tokens / step_s, 1),
+                "samples_per_s": round(samples / step_s, 1),
+                "peak_rss_mb": peak_memory_mb("cpu"),
+                "lr": lr, "grad_norm": grad_norm, "loss": loss, **extra,
+            }
+            if self.device.type == "cuda":
+                record["device_peak_mb"] = peak_memory_mb(self.device)
+            self._write_pending()
+            self._pending = record
+            self._times = dict.fromkeys(PHASES, 0.0)
+        self.steps += 1
+        self._step_start = time.perf_counter()
+
+    def _write_pending(self) -> None:
+        if self._pending is None:
+            return
+        record = {k: _value(v) for k, v in self._pending.items()}
+        self._pending = None
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", buffering=1)
+        self._file.write(json.dumps(record) + "\n")
+
+    def flush(self) -> None:
+        """Write the queued record (reads its tensors)."""
+        if self.enabled:
+            self._write_pending()
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
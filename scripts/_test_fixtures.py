@@ -0,0 +1,15 @@
+"""The tiny attention-model config and synthetic corpus the test_*.py scripts
+train on: big enough to exercise every layer, small enough to run in seconds
+on CPU. Don't mutate TINY; build a variant with {**TINY, ...} instead."""
+
+import numpy as np
+
+TINY = {"vocab_size": 64, "embed_dim": 32, "num_heads": 2, "num_layers": 2, "ff_dim": 64,
+        "context_len": 16}
+
+
+def synthetic_tokens(n_windows: int, seed: int = 0) -> np.ndarray:
+    """Uniform random uint16 ids: `n_windows` TINY context windows plus the
+    final window's last target."""
+    n = n_windows * TINY["context_len"] + 1
+    return np.random.default_rng(seed).integers(0, TINY["vocab_size"], n).astype(np.uint16)
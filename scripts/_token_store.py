@@ -0,0 +1,232 @@
+"""On-disk cache of tokenized corpora, memory-mapped by the trainers.
+
+A store is one directory under data/token-cache/ holding:
+
+    tokens.bin     uint16, every story as [BOS] ids... [EOS], back to back
+    offsets.npy    int64, story i is tokens[offsets[i]:offsets[i + 1]]
+    meta.json      what was tokenized, for humans and sanity checks
+
+The directory name is a hash of the tokenizer file and the corpus slice, so a
+changed tokenizer or a different story count gets a fresh store while a warm
+start just maps the existing files (no download, no tokenization, and no
+per-token Python objects).
+"""
+
+import hashlib
+import json
+import queue
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import torch
+from tokenizers import Tokenizer
+
+from _corpus import TINYSTORIES, encode_stories, iter_stories
+
+ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = ROOT / "data" / "token-cache"
+FORMAT_VERSION = 1
+TOKEN_DTYPE = np.uint16
+
+
+@dataclass
+class TokenStore:
+    tokens: np.ndarray   # read-only memmap, TOKEN_DTYPE
+    offsets: np.ndarray  # int64, len(n_stories + 1)
+    bos: int
+    eos: int
+    path: Path
+
+    @property
+    def n_stories(self) -> int:
+        return len(self.offsets) - 1
+
+    def story(self, i: int) -> np.ndarray:
+        """Token ids of story i without its BOS/EOS markers (a view, not a copy)."""
+        return self.tokens[self.offsets[i] + 1 : self.offsets[i + 1] - 1]
+
+
+def _corpus_id(corpus: str | None) -> dict:
+    if corpus is None:
+        return {"dataset": TINYSTORIES, "split": "train"}
+    path = Path(corpus).resolve()
+    st = path.stat()
+    return {"file": str(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def cache_key(tokenizer_path: Path, corpus: str | None, num_stories: int) -> str:
+    h = hashlib.sha256()
+    h.update(Path(tokenizer_path).read_bytes())
+    h.update(json.dumps({
+        "version": FORMAT_VERSION,
+        "corpus": _corpus_id(corpus),
+        "num_stories": num_stories,
+    }, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def open_store(path: Path) -> TokenStore:
+    with open(path / "meta.json") as f:
+        meta = json.load(f)
+    return TokenStore(
+        tokens=np.memmap(path / "tokens.bin", dtype=TOKEN_DTYPE, mode="r"),
+        offsets=np.load(path / "offsets.npy", mmap_mode="r"),
+        bos=meta["bos"],
+        eos=meta["eos"],
+        path=path,
+    )
+
+
+def load_token_store(
+    tokenizer_path: Path,
+    num_stories: int,
+    *,
+    corpus: str | None = None,
+    workers: int = 1,
+    rebuild: bool = False,
+    cache_dir: Path = CACHE_DIR,
+) -> TokenStore:
+    """Return the cached store for this tokenizer + corpus slice, building it if needed."""
+    path = cache_dir / cache_key(tokenizer_path, corpus, num_stories)
+    if rebuild and path.exists():
+        shutil.rmtree(path)
+    if not (path / "meta.json").exists():
+        _build_store(path, tokenizer_path, num_stories, corpus=corpus, workers=workers)
+    else:
+        print(f"Using cached tokens from {path}")
+    store = open_store(path)
+    print(f"  → {store.n_stories:,} stories, {len(store.tokens):,} tokens")
+    return store
+
+
+def _build_store(path: Path, tokenizer_path: Path, num_stories: int, *,
+                 corpus: str | None, workers: int) -> None:
+    tok = Tokenizer.from_file(str(tokenizer_path))
+    assert tok.get_vocab_size() <= np.iinfo(TOKEN_DTYPE).max + 1, "vocab too big for uint16"
+    bos = tok.token_to_id("[BOS]") or 1
+    eos = tok.token_to_id("[EOS]") or 2
+
+    print(f"Tokenizing {corpus or 'TinyStories'} ({num_stories:,} stories) into {path}...")
+    tmp = path.with_name(path.name + ".partial")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    # Stream straight to disk so building a big store never holds the corpus.
+    offsets = [0]
+    with open(tmp / "tokens.bin", "wb") as f:
+        for ids in encode_stories(tokenizer_path, iter_stories(corpus, num_stories),
+                                  workers=workers):
+            story = np.empty(len(ids) + 2, dtype=TOKEN_DTYPE)
+            story[0], story[1:-1], story[-1] = bos, ids, eos
+            f.write(story.tobytes())
+            offsets.append(offsets[-1] + len(story))
+    np.save(tmp / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    with open(tmp / "meta.json", "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "tokenizer": Path(tokenizer_path).name,
+            "corpus": _corpus_id(corpus),
+            "num_stories": num_stories,
+            "n_stories": len(offsets) - 1,
+            "n_tokens": offsets[-1],
+            "bos": bos,
+            "eos": eos,
+        }, f, indent=2)
+    tmp.rename(path)
+
+
+class ContextWindows:
+    """Every (context_len ids → next id) window that fits inside one story.
+
+    Windows are addressed by a flat index and located by arithmetic over the
+    per-story window counts, so nothing beyond the mapped token array and one
+    int64 per story is kept in memory. Windows never cross a story boundary
+    (and never include the BOS/EOS markers).
+    """
+
+    def __init__(self, store: TokenStore, context_len: int, min_story_len: int = 4):
+        lengths = np.diff(store.offsets) - 2
+        keep = lengths >= min_story_len
+        counts = np.maximum(lengths[keep] - context_len, 0)
+        self.tokens = store.tokens
+        self.context_len = context_len
+        self._first = store.offsets[:-1][keep] + 1  # first real token of each story
+        self._end = np.cumsum(counts)                # window index where story i ends
+        self._begin = self._end - counts
+
+    def __len__(self) -> int:
+        return int(self._end[-1]) if len(self._end) else 0
+
+    def positions(self, idx: np.ndarray) -> np.ndarray:
+        """Token offset of the first context id for each window index."""
+        story = np.searchsorted(self._end, idx, side="right")
+        return self._first[story] + (idx - self._begin[story])
+
+    def batch(self, idx) -> tuple[torch.Tensor, torch.Tensor]:
+        """Gather (X, Y) int64 tensors for window indices `idx` in one shot."""
+        pos = self.positions(np.asarray(idx, dtype=np.int64))
+        x = self.tokens[pos[:, None] + np.arange(self.context_len)]
+        y = self.tokens[pos + self.context_len]
+        return torch.from_numpy(x.astype(np.int64)), torch.from_numpy(y.astype(np.int64))
+
+
+def block_batches(tokens: np.ndarray, starts: np.ndarray, ctx: int) -> Iterator[torch.Tensor]:
+    """Yield one (batch, ctx + 1) int64 tensor per row of block indices `starts`.
+
+    Block b covers tokens[b * ctx : b * ctx + ctx + 1]; the caller splits it
+    into inputs [:, :-1] and targets [:, 1:]. Each batch is a single
+    vectorized gather rather than one slice per row.
+    """
+    span = np.arange(ctx + 1)
+    for row in starts:
+        yield torch.from_numpy(tokens[row[:, None] * ctx + span].astype(np.int64))
+
+
+_DONE = object()
+
+
+def prefetch(batches: Iterable, depth: int = 4, pin_memory: bool = False) -> Iterator:
+    """Run `batches` on a background thread, at most `depth` items ahead.
+
+    With pin_memory (CUDA only) each tensor is page-locked on the producer
+    thread so the consumer's `.to(device, non_blocking=True)` can overlap.
+    """
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in batches:
+                if pin_memory:
+                    item = item.pin_memory()
+                if not put(item):
+                    return
+        except BaseException as e:  # re-raised on the consumer side
+            put(e)
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while (item := q.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,276 @@
+"""Read and write the models' `.weights.bin` files, and load them into PyTorch.
+
+The trainers export `<name>.json` (config + vocab) and `<name>.weights.bin`
+for the browser. The weights file is a small self-describing container:
+
+    "AIXW" | uint32 version | uint32 header_bytes | header JSON | data
+
+The header is {"tensors": [{"name", "dtype", "shape", "offset", "nbytes"}]},
+in state_dict names and order, space-padded so the data starts on a 64-byte
+boundary. dtype is "float32", or "int8" with a per-tensor "scale" (value =
+int * scale). Offsets are from the start of the data and multiples of 64,
+so any tensor can be read on its own or viewed in place as a typed array.
+src/lib/weights-file.ts is the browser's reader.
+
+Loading memory-maps the file (MappedWeights): float32 parameters are views
+of the page cache rather than copies, and int8 tensors are dequantized on
+first use, so repeated tool runs load in milliseconds and share the pages.
+
+Files written before the container are a bare stream of
+[ndims][dims...][float32 data] records (a float32 scale + int8 data when
+the config says "quantization": "int8") in state_dict order. They still
+load, given the names, and this script rewrites them as containers:
+
+    uv run scripts/_weights.py public/data/attention-model/model.json \\
+        public/data/next-word-model/next-word-*.json
+"""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "torch>=2.1",  # load_state_dict(assign=True)
+#     "numpy>=1.24",
+# ]
+# ///
+
+import json
+import os
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import torch
+from torch.overrides import TorchFunctionMode
+
+from _attention_model import TinyTransformer
+from _next_word_model import NextWordModel
+
+MAGIC = b"AIXW"
+VERSION = 1
+ALIGN = 64
+PREFIX = struct.Struct("<4sII")  # magic, version, header bytes
+DTYPES = {"float32": np.float32, "int8": np.int8}
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def quantize_int8(arr: np.ndarray) -> tuple[np.ndarray, float]:
+    """Symmetric per-tensor int8: arr ≈ ints * scale."""
+    abs_max = float(np.abs(arr).max()) if arr.size else 0.0
+    scale = float(np.float32(abs_max / 127.0)) if abs_max > 0 else 1.0
+    # Clip to symmetric [-127, 127]; -128 has no positive counterpart and
+    # banker's rounding can occasionally emit it, which would overflow int8.
+    return np.clip(np.round(arr / np.float32(scale)), -127, 127).astype(np.int8), scale
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+def _write(path: Path, records: list[tuple[dict, np.ndarray]]) -> None:
+    """records: ({"name", "dtype", "shape"[, "scale"]}, stored values) in file order."""
+    entries, offset = [], 0
+    for meta, arr in records:
+        entries.append({**meta, "offset": offset, "nbytes": arr.nbytes})
+        offset = _align(offset + arr.nbytes)
+    header = json.dumps({"tensors": entries}).encode()
+    header += b" " * (_align(PREFIX.size + len(header)) - PREFIX.size - len(header))
+    data_start = PREFIX.size + len(header)
+    with open(path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for entry, (_, arr) in zip(entries, records):
+            f.write(b"\0" * (data_start + entry["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+
+def write_weights(path: Path, tensors: dict[str, torch.Tensor],
+                  quantization: str | None = None) -> None:
+    """Write `tensors` (a state_dict) as a container, every tensor as int8
+    when quantization="int8"."""
+    assert quantization in (None, "int8"), f"unknown quantization {quantization!r}"
+    records = []
+    for name, t in tensors.items():
+        arr = t.detach().cpu().contiguous().to(torch.float32).numpy()
+        meta = {"name": name, "dtype": "float32", "shape": list(arr.shape)}
+        if quantization == "int8":
+            arr, scale = quantize_int8(arr)
+            meta.update(dtype="int8", scale=scale)
+        records.append((meta, arr))
+    _write(path, records)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+def is_container(raw: np.ndarray) -> bool:
+    return raw[:len(MAGIC)].tobytes() == MAGIC
+
+
+def read_index(raw: np.ndarray, names: list[str] | None = None,
+               quantized: bool = False) -> list[dict]:
+    """The tensor index of a weights file held in `raw` (uint8), with offsets
+    from the start of `raw`. A legacy file has no index, so it is parsed
+    from its records given the tensor `names` in order (and `quantized`)."""
+    if is_container(raw):
+        _, version, header_bytes = PREFIX.unpack(raw[:PREFIX.size].tobytes())
+        assert version == VERSION, f"unsupported weights version {version}"
+        entries = json.loads(raw[PREFIX.size:PREFIX.size + header_bytes].tobytes())["tensors"]
+        data_start = PREFIX.size + header_bytes
+        return [{**e, "offset": data_start + e["offset"]} for e in entries]
+
+    assert names is not None, "a legacy weights file needs its tensor names"
+    entries, pos = [], 0
+    for name in names:
+        (ndims,) = struct.unpack("<I", raw[pos:pos + 4].tobytes())
+        shape = list(struct.unpack(f"<{ndims}I", raw[pos + 4:pos + 4 + 4 * ndims].tobytes()))
+        pos += 4 + 4 * ndims
+        n = int(np.prod(shape))
+        entry = {"name": name, "dtype": "float32", "shape": shape}
+        if quantized:
+            (scale,) = struct.unpack("<f", raw[pos:pos + 4].tobytes())
+            entry.update(dtype="int8", scale=scale)
+            pos += 4
+        entry.update(offset=pos, nbytes=n * np.dtype(DTYPES[entry["dtype"]]).itemsize)
+        pos += entry["nbytes"]
+        entries.append(entry)
+    assert pos == len(raw), f"{len(raw) - pos} leftover bytes after {len(names)} tensors"
+    return entries
+
+
+def stored_array(raw: np.ndarray, entry: dict) -> np.ndarray:
+    """One tensor's stored values, as a view into `raw` (int8 stays quantized)."""
+    start = entry["offset"]
+    return raw[start:start + entry["nbytes"]].view(DTYPES[entry["dtype"]]).reshape(entry["shape"])
+
+
+def dequantize(arr: np.ndarray, entry: dict) -> np.ndarray:
+    """Stored values → float32 (a no-op for float32 tensors)."""
+    if entry["dtype"] == "int8":
+        return arr.astype(np.float32) * np.float32(entry["scale"])
+    return arr
+
+
+class MappedWeights(Mapping):
+    """name → tensor over a memory-mapped weights file.
+
+    The file is mapped copy-on-write: float32 tensors are views of the mapped
+    pages (nothing is read until touched, the page cache is shared between
+    processes, and writes stay private), and int8 tensors are dequantized the
+    first time they are looked up. `stored(name)` gives the values as stored.
+    """
+
+    def __init__(self, bin_path: Path, names: list[str] | None = None, quantized: bool = False):
+        self.raw = np.memmap(bin_path, dtype=np.uint8, mode="c")
+        self.index = {e["name"]: e for e in read_index(self.raw, names, quantized)}
+        self._dequantized: dict[str, torch.Tensor] = {}
+
+    def stored(self, name: str) -> torch.Tensor:
+        return torch.from_numpy(stored_array(self.raw, self.index[name]))
+
+    def __getitem__(self, name: str) -> torch.Tensor:
+        entry = self.index[name]
+        if entry["dtype"] == "float32":
+            return self.stored(name)
+        if name not in self._dequantized:
+            self._dequantized[name] = torch.from_numpy(
+                dequantize(stored_array(self.raw, entry), entry))
+        return self._dequantized[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def load_weights(model: torch.nn.Module, bin_path: Path, quantized: bool = False) -> None:
+    """Point `model`'s parameters at a mapped weights file (see MappedWeights),
+    replacing rather than copying into them. `quantized` only matters for
+    legacy files."""
+    state = model.state_dict()
+    weights = MappedWeights(bin_path, list(state), quantized)
+    assert list(weights) == list(state), f"{bin_path}: tensors {list(weights)} vs {list(state)}"
+    for key, entry in weights.index.items():
+        assert tuple(entry["shape"]) == tuple(state[key].shape), \
+            f"{key}: {tuple(entry['shape'])} vs {tuple(state[key].shape)}"
+    model.load_state_dict(dict(weights), assign=True)
+
+
+# ---------------------------------------------------------------------------
+# Models
+# ---------------------------------------------------------------------------
+def build_model(config: dict) -> TinyTransformer | NextWordModel:
+    """An untrained model for an exported config (either kind)."""
+    if "num_heads" in config:
+        return TinyTransformer({k: v for k, v in config.items() if k != "quantization"})
+    return NextWordModel(config["vocab_size"], config["embed_dim"], config["context_len"],
+                         config["hidden_dim"])
+
+
+class _SkipInit(TorchFunctionMode):
+    """Turns the initialisers module constructors run into no-ops, so building
+    a model that load_weights will overwrite costs no time or touched memory."""
+
+    SKIP = {"normal_", "uniform_", "kaiming_uniform_", "fill_", "zero_", "ones_", "zeros_"}
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        if getattr(func, "__name__", None) in self.SKIP:
+            return args[0] if args else kwargs["tensor"]  # nn.init passes tensor=
+        return func(*args, **(kwargs or {}))
+
+
+def load_attention_model(model_dir: Path) -> tuple[TinyTransformer, list[str]]:
+    """model.json + model.weights.bin → (TinyTransformer in eval mode, vocab)."""
+    with open(model_dir / "model.json") as f:
+        meta = json.load(f)
+    with _SkipInit():
+        model = build_model(meta["config"])
+    load_weights(model, model_dir / "model.weights.bin",
+                 quantized=meta["config"].get("quantization") == "int8")
+    return model.eval(), meta["vocab"]
+
+
+def load_next_word_model(model_dir: Path, name: str) -> tuple[NextWordModel, list[str]]:
+    """<name>.json + <name>.weights.bin → (NextWordModel in eval mode, vocab)."""
+    with open(model_dir / f"{name}.json") as f:
+        meta = json.load(f)
+    with _SkipInit():
+        model = build_model(meta["config"])
+    load_weights(model, model_dir / f"{name}.weights.bin")
+    return model.eval(), meta["vocab"]
+
+
+# ---------------------------------------------------------------------------
+# Legacy conversion
+# ---------------------------------------------------------------------------
+def convert_legacy(config_path: Path) -> bool:
+    """Rewrite <name>.weights.bin next to `config_path` as a container, keeping
+    every stored value (and int8 scale) bit for bit. False if it already was one."""
+    bin_path = config_path.with_suffix(".weights.bin")
+    raw = np.fromfile(bin_path, dtype=np.uint8)
+    if is_container(raw):
+        return False
+    config = json.loads(config_path.read_text())["config"]
+    with torch.device("meta"):  # only the state_dict names are needed
+        names = list(build_model(config).state_dict())
+    index = read_index(raw, names, quantized=config.get("quantization") == "int8")
+    tmp = bin_path.with_suffix(".tmp")
+    _write(tmp, [({k: e[k] for k in ("name", "dtype", "shape", "scale") if k in e},
+                  stored_array(raw, e)) for e in index])
+    os.replace(tmp, bin_path)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Rewrite legacy .weights.bin files in the container format.")
+    parser.add_argument("configs", type=Path, nargs="+",
+                        help="<name>.json files; each <name>.weights.bin is converted in place.")
+    for path in parser.parse_args().configs:
+        print(f"{path.with_suffix('.weights.bin')}: "
+              f"{'converted' if convert_legacy(path) else 'already a container'}")
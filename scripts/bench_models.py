@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""Performance benchmarks for the models, the data path and export I/O.
+
+Everything is synthetic and seeded: random weights, random token ids, no
+corpus or network. Each case is timed repeatedly (at least --min-time
+seconds and 3 repetitions, after a warm-up call), and the median is kept:
+
+    transformer_fwd/b{B}_t{T}      TinyTransformer forward, inference mode
+    transformer_fwd_bwd/b{B}_t{T}  forward + cross-entropy + backward
+    next_word_step/...             NextWordModel forward + backward + Adam step
+    next_word_group/...            a sweep group's steps: one model at a time vs
+                                   train_models' shared batch and foreach Adam
+    accel/{model}/{mode}           a training step of either model in eager fp32,
+                                   under --amp bf16 / fp16, and with --compile
+    batch/...                      ContextWindows.batch and block_batches gathers
+    export/{fp32,int8}             export_weights / export_weights_int8
+    load/{fp32,int8}               _weights.load_attention_model
+
+Results are written as JSON (median / min ms, repetitions, throughput, and
+the machine and library versions), with the speedup of each SPEEDUPS pair
+that ran. --compare flags every case whose median
+is more than --threshold slower than in a stored baseline, and exits with
+status 1 if there are any.
+
+Usage:
+    uv run scripts/bench_models.py --out data/bench/baseline.json
+    uv run scripts/bench_models.py --compare data/bench/baseline.json
+    uv run scripts/bench_models.py --compare base.json --results other.json  # no run
+"""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _accel import AMP_DTYPES, autocast, check_amp, compile_model, grad_scaler  # noqa: E402
+from _attention_model import CONFIG, TinyTransformer  # noqa: E402
+from _next_word_model import NextWordModel  # noqa: E402
+from _token_store import ContextWindows, TokenStore, block_batches  # noqa: E402
+from _weights import load_attention_model  # noqa: E402
+from train_attention_model import export_weights, export_weights_int8  # noqa: E402
+
+DEFAULT_OUT = ROOT / "data" / "bench" / "latest.json"
+SEED = 0
+
+
+def measure(fn: Callable[[], object], *, device: str, min_time: float,
+            min_reps: int = 3) -> dict:
+    """Median / min wall time of fn() in ms, after one warm-up call."""
+    sync = torch.cuda.synchronize if torch.device(device).type == "cuda" else (lambda: None)
+    fn()
+    sync()
+    times = []
+    deadline = time.perf_counter() + min_time
+    while len(times) < min_reps or time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        fn()
+        sync()
+        times.append(time.perf_counter() - t0)
+    return {"median_ms": statistics.median(times) * 1e3, "min_ms": min(times) * 1e3,
+            "reps": len(times)}
+
+
+# ---------------------------------------------------------------------------
+# Cases: (name, setup) where setup() builds the inputs and returns
+# (fn, items per call, item unit). Setup only runs for selected cases.
+# ---------------------------------------------------------------------------
+Case = tuple[str, Callable[[], tuple[Callable[[], object], int, str]]]
+
+
+def transformer_cases(device: str, batches: list[int], seq_lens: list[int]) -> Iterator[Case]:
+    def model() -> TinyTransformer:
+        torch.manual_seed(SEED)
+        return TinyTransformer(CONFIG).to(device)
+
+    def ids(B: int, T: int) -> torch.Tensor:
+        g = torch.Generator().manual_seed(SEED)
+        return torch.randint(0, CONFIG["vocab_size"], (B, T + 1), generator=g).to(device)
+
+    for B in batches:
+        for T in seq_lens:
+            def fwd(B=B, T=T):
+                m, x = model().eval(), ids(B, T)[:, :-1]
+
+                def run():
+                    with torch.inference_mode():
+                        m(x)
+                return run, B * T, "tokens"
+
+            def fwd_bwd(B=B, T=T):
+                m, batch = model().train(), ids(B, T)
+                x, y = batch[:, :-1], batch[:, 1:]
+
+                def run():
+                    m.zero_grad(set_to_none=True)
+                    F.cross_entropy(m(x).view(-1, CONFIG["vocab_size"]), y.reshape(-1)).backward()
+                return run, B * T, "tokens"
+
+            yield f"transformer_fwd/b{B}_t{T}", fwd
+            yield f"transformer_fwd_bwd/b{B}_t{T}", fwd_bwd
+
+
+def next_word_cases(device: str) -> Iterator[Case]:
+    # The widget's largest sweep config (ctx3_e128_h256) at the trainer's batch size.
+    vocab, embed, ctx, hidden, batch = CONFIG["vocab_size"], 128, 3, 256, 1024
+
+    def step():
+        torch.manual_seed(SEED)
+        model = NextWordModel(vocab, embed, ctx, hidden).to(device)
+        opt = torch.optim.Adam(model.parameters(), lr=1e-3, foreach=True)
+        g = torch.Generator().manual_seed(SEED)
+        x = torch.randint(0, vocab, (batch, ctx), generator=g).to(device)
+        y = torch.randint(0, vocab, (batch,), generator=g).to(device)
+
+        def run():
+            opt.zero_grad()
+            F.cross_entropy(model(x), y).backward()
+            opt.step()
+        return run, batch, "samples"
+
+    yield f"next_word_step/ctx{ctx}_e{embed}_h{hidden}_b{batch}", step
+
+
+def next_word_group_cases(device: str) -> Iterator[Case]:
+    # The default sweep's ctx3 group. train-next-word-model.py trains it as
+    # one train_models group: each batch is gathered once, the summed loss is
+    # backpropagated once and one foreach Adam steps every model.
+    vocab, ctx, batch = CONFIG["vocab_size"], 3, 1024
+    widths = [(32, 128), (64, 128), (64, 256), (128, 256)]
+
+    def steps(grouped: bool):
+        torch.manual_seed(SEED)
+        models = [NextWordModel(vocab, e, ctx, h).to(device) for e, h in widths]
+        data = ContextWindows(synthetic_store(), ctx)
+        rng = np.random.default_rng(SEED)
+
+        def gather() -> tuple[torch.Tensor, torch.Tensor]:
+            xb, yb = data.batch(rng.integers(0, len(data), batch))
+            return xb.to(device), yb.to(device)
+
+        if grouped:
+            opt = torch.optim.Adam([p for m in models for p in m.parameters()], lr=1e-3,
+                                   foreach=True)
+
+            def run():
+                xb, yb = gather()
+                opt.zero_grad()
+                torch.stack([F.cross_entropy(m(xb), yb) for m in models]).sum().backward()
+                opt.step()
+        else:
+            opts = [torch.optim.Adam(m.parameters(), lr=1e-3, foreach=True) for m in models]
+
+            def run():
+                for m, opt in zip(models, opts):
+                    xb, yb = gather()
+                    opt.zero_grad()
+                    F.cross_entropy(m(xb), yb).backward()
+                    opt.step()
+        return run, batch * len(models), "samples"
+
+    name = f"next_word_group/ctx{ctx}_x{len(widths)}"
+    yield f"{name}_sequential", lambda: steps(grouped=False)
+    yield f"{name}_grouped", lambda: steps(grouped=True)
+
+
+ACCEL_MODES = ["eager", *sorted(AMP_DTYPES), "compile"]
+ACCEL_MODELS = {"transformer_b8_t64": (8, 64), "next_word_ctx3_b1024": (1024, 3)}
+
+
+def accel_cases(device: str) -> Iterator[Case]:
+    # One optimizer step as the trainers take it under each _accel mode.
+    def step(model_name: str, mode: str):
+        torch.manual_seed(SEED)
+        batch, ctx = ACCEL_MODELS[model_name]
+        g = torch.Generator().manual_seed(SEED)
+        if model_name.startswith("transformer"):
+            model = TinyTransformer(CONFIG).to(device)
+            ids = torch.randint(0, CONFIG["vocab_size"], (batch, ctx + 1), generator=g).to(device)
+            x, y, items, unit = ids[:, :-1], ids[:, 1:], batch * ctx, "tokens"
+        else:
+            model = NextWordModel(CONFIG["vocab_size"], 128, ctx, 256).to(device)
+            x = torch.randint(0, CONFIG["vocab_size"], (batch, ctx), generator=g).to(device)
+            y = torch.randint(0, CONFIG["vocab_size"], (batch,), generator=g).to(device)
+            items, unit = batch, "samples"
+        amp = check_amp(device, mode if mode in AMP_DTYPES else None)
+        step_model = compile_model(model, x, device=device) if mode == "compile" else model
+        scaler = grad_scaler(device, amp)
+        opt = torch.optim.Adam(model.parameters(), lr=1e-3, foreach=True)
+
+        def run():
+            opt.zero_grad()
+            with autocast(device, amp):
+                logits = step_model(x)
+                loss = F.cross_entropy(logits.reshape(-1, logits.size(-1)), y.reshape(-1))
+            scaler.scale(loss).backward()
+            scaler.step(opt)
+            scaler.update()
+        return run, items, unit
+
+    for model_name in ACCEL_MODELS:
+        for mode in ACCEL_MODES:
+            yield f"accel/{model_name}/{mode}", lambda m=model_name, a=mode: step(m, a)
+
+
+# (baseline case, case): reported as baseline median / case median.
+SPEEDUPS = [
+    ("next_word_group/ctx3_x4_sequential", "next_word_group/ctx3_x4_grouped"),
+    *((f"accel/{m}/eager", f"accel/{m}/{mode}") for m in ACCEL_MODELS for mode in ACCEL_MODES[1:]),
+]
+
+
+def synthetic_store(n_stories: int = 5000, seed: int = SEED) -> TokenStore:
+    """A TokenStore of random stories (lengths 20-400), held in memory."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(20, 400, n_stories) + 2  # + [BOS] / [EOS]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    tokens = rng.integers(3, CONFIG["vocab_size"], offsets[-1]).astype(np.uint16)
+    tokens[offsets[:-1]], tokens[offsets[1:] - 1] = 1, 2
+    return TokenStore(tokens=tokens, offsets=offsets, bos=1, eos=2, path=Path("<synthetic>"))
+
+
+def batch_cases() -> Iterator[Case]:
+    def windows(batch: int = 1024, ctx: int = 3):
+        data = ContextWindows(synthetic_store(), ctx)
+        rng = np.random.default_rng(SEED)
+        return (lambda: data.batch(rng.integers(0, len(data), batch))), batch, "samples"
+
+    def blocks(batch: int = 64, ctx: int = CONFIG["context_len"]):
+        tokens = synthetic_store().tokens
+        rng = np.random.default_rng(SEED)
+        n_blocks = (len(tokens) - 1) // ctx
+        return (lambda: next(block_batches(tokens, rng.integers(0, n_blocks, (1, batch)), ctx)),
+                batch * ctx, "tokens")
+
+    yield "batch/context_windows_ctx3_b1024", windows
+    yield f"batch/blocks_t{CONFIG['context_len']}_b64", blocks
+
+
+def io_cases(tmp: Path) -> Iterator[Case]:
+    vocab = [f"<id_{i}>" for i in range(CONFIG["vocab_size"])]
+
+    def exporter(write, out_dir: Path):
+        torch.manual_seed(SEED)
+        model = TinyTransformer(CONFIG)
+        n_params = sum(p.numel() for p in model.parameters())
+
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):  # exports print a summary
+                write(model, vocab, out_dir)
+        return run, n_params, "params"
+
+    def loader(write, out_dir: Path):
+        run, n_params, unit = exporter(write, out_dir)
+        run()
+        return (lambda: load_attention_model(out_dir)), n_params, unit
+
+    for kind, write in [("fp32", export_weights), ("int8", export_weights_int8)]:
+        yield f"export/{kind}", lambda w=write, k=kind: exporter(w, tmp / k)
+        yield f"load/{kind}", lambda w=write, k=kind: loader(w, tmp / f"load-{k}")
+
+
+def all_cases(device: str, quick: bool, tmp: Path) -> Iterator[Case]:
+    batches, seq_lens = ([1, 8], [16, 64]) if quick else ([1, 8, 32], [16, 32, 64])
+    yield from transformer_cases(device, batches, seq_lens)
+    yield from next_word_cases(device)
+    yield from next_word_group_cases(device)
+    yield from accel_cases(device)
+    yield from batch_cases()
+    yield from io_cases(tmp)
+
+
+def run_benchmarks(*, device: str = "cpu", quick: bool = False, only: str | None = None,
+                   min_time: float = 0.5) -> dict:
+    """Run every case whose name contains `only` (default: all)."""
+    meta = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": quick, "device": device,
+        "python": platform.python_version(), "torch": torch.__version__, "numpy": np.__version__,
+        "platform": platform.platform(), "processor": platform.processor(),
+        "cpu_count": os.cpu_count(), "threads": torch.get_num_threads(),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, setup in all_cases(device, quick, Path(tmp)):
+            if only and only not in name:
+                continue
+            fn, items, unit = setup()
+            r = measure(fn, device=device, min_time=min_time)
+            r[f"{unit}_per_s"] = items / r["median_ms"] * 1e3
+            results[name] = r
+            print(f"  {name:<36} {r['median_ms']:>9.2f} ms  {r[f'{unit}_per_s']:>13,.0f} "
+                  f"{unit}/s  ({r['reps']} reps)")
+    speedups = {}
+    for base, case in SPEEDUPS:
+        if base in results and case in results:
+            x = results[base]["median_ms"] / results[case]["median_ms"]
+            speedups[f"{case} vs {base}"] = x
+            print(f"  {case:<36} {x:>8.2f}x vs {base}")
+    return {"meta": meta, "results": results, "speedups": speedups}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Print per-case changes; return the cases slower than baseline by > threshold."""
+    for key in ("device", "threads", "torch", "processor", "quick"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"note: {key} differs (baseline {baseline['meta'].get(key)!r}, "
+                  f"current {current['meta'].get(key)!r})")
+    base, cur = baseline["results"], current["results"]
+    regressions = []
+    print(f"\n{'Case':<36} {'base ms':>9} {'now ms':>9} {'change':>8}")
+    for name in sorted(base.keys() | cur.keys()):
+        if name not in base or name not in cur:
+            print(f"{name:<36} {'(only in ' + ('baseline' if name in base else 'current') + ')':>28}")
+            continue
+        change = cur[name]["median_ms"] / base[name]["median_ms"] - 1
+        slow = change > threshold
+        if slow:
+            regressions.append(name)
+        print(f"{name:<36} {base[name]['median_ms']:>9.2f} {cur[name]['median_ms']:>9.2f} "
+              f"{change:>+7.0%}{'  SLOWER' if slow else ''}")
+    print(f"\n{len(regressions)} case(s) more than {threshold:.0%} slower than the baseline")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                        help="Where to write this run's results.")
+    parser.add_argument("--compare", type=Path, default=None, metavar="BASELINE",
+                        help="Baseline results JSON to check this run against.")
+    parser.add_argument("--results", type=Path, default=None,
+                        help="With --compare: compare this results file instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown that counts as a regression (default 0.15).")
+    parser.add_argument("--quick", action="store_true", help="Smaller transformer grid.")
+    parser.add_argument("--only", default=None, help="Only cases whose name contains this.")
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="Seconds to spend timing each case (at least 3 repetitions).")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="torch intra-op threads (default: torch's choice).")
+    args = parser.parse_args()
+    if args.results and not args.compare:
+        parser.error("--results needs --compare")
+
+    if args.results:
+        current = json.loads(args.results.read_text())
+    else:
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        print(f"Benchmarks on {args.device} ({torch.get_num_threads()} threads):")
+        current = run_benchmarks(device=args.device, quick=args.quick, only=args.only,
+                                 min_time=args.min_time)
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(current, indent=2))
+        print(f"Wrote {args.out}")
+    if args.compare:
+        if compare(json.loads(args.compare.read_text()), current, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
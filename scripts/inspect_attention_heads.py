@@ -3,6 +3,8 @@
 
 For each (layer, head) and each probe sentence, score how well the head's
 attention matrix matches a set of interpretable templates.
+
+--profile-steps START:END profiles those probe forwards (see _profiling).
 """
 # /// script
 # requires-python = ">=3.11"
@@ -14,6 +16,7 @@ attention matrix matches a set of interpretable templates.
 # ]
 # ///
 
+import argparse
 import json
 import sys
 from pathlib import Path
@@ -22,11 +25,13 @@ import matplotlib.pyplot as plt
 import numpy as np
 import torch
 from tokenizers import Tokenizer
+from torch.profiler import record_function
 
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT / "scripts"))
 from _attention_model import TinyTransformer  # noqa: E402
-from test_weight_roundtrip import load_into_model  # noqa: E402
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args  # noqa: E402
+from _weights import load_attention_model  # noqa: E402
 
 MODEL_DIR = ROOT / "public" / "data" / "attention-model"
 TOKENIZER_PATH = ROOT / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
@@ -48,14 +53,8 @@ PROBE_SENTENCES = [
 
 
 def load_model() -> tuple[TinyTransformer, Tokenizer]:
-    config_path = MODEL_DIR / "model.json"
-    bin_path = MODEL_DIR / "model.weights.bin"
-    assert config_path.exists(), "Run training first."
-    with open(config_path) as f:
-        meta = json.load(f)
-    model = TinyTransformer(meta["config"])
-    load_into_model(model, bin_path, quantized=meta["config"].get("quantization") == "int8")
-    model.eval()
+    assert (MODEL_DIR / "model.json").exists(), "Run training first."
+    model, _ = load_attention_model(MODEL_DIR)
     tok = Tokenizer.from_file(str(TOKENIZER_PATH))
     return model, tok
 
@@ -72,24 +71,15 @@ def forward_with_attentions(
     x = model.token_emb(ids) + model.pos_emb(pos)
     attentions: list[torch.Tensor] = []
     for layer in model.layers:
-        attn = layer["attn"]
-        h = attn.ln1(x)
-        qkv = attn.qkv(h)
-        q, k, v = qkv.split(attn.embed_dim, dim=-1)
-        q = q.view(B, T, attn.num_heads, attn.head_dim).transpose(1, 2)
-        k = k.view(B, T, attn.num_heads, attn.head_dim).transpose(1, 2)
-        v = v.view(B, T, attn.num_heads, attn.head_dim).transpose(1, 2)
-        scores = (q @ k.transpose(-2, -1)) / (attn.head_dim ** 0.5)
-        mask = torch.triu(torch.ones(T, T, device=x.device), diagonal=1).bool()
-        scores = scores.masked_fill(mask, float("-inf"))
-        a = torch.softmax(scores, dim=-1)
+        # Same record_function labels as TinyTransformer.forward (see _profiling).
+        with record_function("attention"):
+            out, a = layer["attn"](x, return_weights=True)
         attentions.append(a[0].detach())
-        out = a @ v
-        out = out.transpose(1, 2).contiguous().view(B, T, attn.embed_dim)
-        x = x + attn.out(out)
-        x = x + layer["ffn"](x)
-    x = model.ln_final(x)
-    logits = model.output(x)
+        x = x + out
+        with record_function("ffn"):
+            x = x + layer["ffn"](x)
+    with record_function("output"):
+        logits = model.output(model.ln_final(x))
     return logits, attentions
 
 
@@ -156,11 +146,14 @@ TEMPLATES = {
 }
 
 
-def score_all_heads(model: TinyTransformer, tok: Tokenizer) -> dict:
+def score_all_heads(model: TinyTransformer, tok: Tokenizer,
+                    profiler: StepProfiler | None = None) -> dict:
     """Run every probe through the model and return both the cross-probe
     template means and the per-(probe, layer, head) attention matrices,
     plus the per-(template, probe) per-head scores so heatmaps can pick the
-    most-relevant probe for each named head."""
+    most-relevant probe for each named head. `profiler` is stepped once per
+    probe forward."""
+    profiler = profiler or StepProfiler(None, PROFILE_DIR, "")
     cfg = model.cfg
     L, H = cfg["num_layers"], cfg["num_heads"]
     sums = {name: np.zeros((L, H)) for name in TEMPLATES}
@@ -174,6 +167,7 @@ def score_all_heads(model: TinyTransformer, tok: Tokenizer) -> dict:
         ids_t = torch.tensor([ids], dtype=torch.long)
         with torch.no_grad():
             _, attentions = forward_with_attentions(model, ids_t)
+        profiler.step()
         per_head_score = {name: np.zeros((L, H)) for name in TEMPLATES}
         captured[sent] = {}
         for l, layer_attn in enumerate(attentions):
@@ -229,10 +223,16 @@ def render_heatmap(A: np.ndarray, sentence_tokens: list[str], out_path: Path,
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_profile_args(parser)  # steps = probe sentences
+    args = parser.parse_args()
+
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     model, tok = load_model()
     print("Scoring heads against templates over probe sentences...")
-    results = score_all_heads(model, tok)
+    profiler = StepProfiler(args.profile_steps, PROFILE_DIR, "inspect-attention-heads")
+    results = score_all_heads(model, tok, profiler)
+    profiler.close()
 
     summary_path = ROOT / "docs" / "superpowers" / "reports" / "phase1-rankings.json"
     summary_path.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""Serve an exported model from one warm process, with micro-batching.
+
+Loads `model.json` + `model.weights.bin` (the attention model) or a
+`next-word-*` export once. Requests are collected in an asyncio queue and run
+as padded micro-batches: a batch starts when it is full (--max-batch) or when
+its oldest request has waited --max-latency-ms, whichever comes first. The
+model runs on a worker thread so the event loop keeps accepting requests
+while a batch is in flight.
+
+Requests are JSON objects:
+
+    {"id": 1, "text": "once upon a", "top_k": 5}
+    {"id": 2, "text": "the little girl", "max_new_tokens": 20, "temperature": 0.8}
+
+`max_new_tokens` (attention model only) also continues the text, greedily
+unless a temperature is given. Responses carry the same "id", the context
+tokens used, the top_k next-token predictions, and the request's latency.
+
+Usage:
+    uv run scripts/serve_models.py --model attention < requests.jsonl
+    uv run scripts/serve_models.py --model next-word-best --http 8765
+        curl -d '{"text": "once upon"}' localhost:8765/predict
+        curl localhost:8765/stats
+    uv run scripts/serve_models.py --model attention --bench 2000 --concurrency 64
+"""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from tokenizers import Tokenizer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args  # noqa: E402
+from _weights import load_attention_model, load_next_word_model  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+TOKENIZER_PATH = ROOT / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
+ATTENTION_DIR = ROOT / "public" / "data" / "attention-model"
+NEXT_WORD_DIR = ROOT / "public" / "data" / "next-word-model"
+
+BENCH_PHRASES = [
+    "once upon a", "the little girl", "she was very", "he said", "they went to",
+    "the cat sat on the", "it was a sunny day and", "lily wanted to play with her",
+    "one day, a little boy named tom went to the park. he saw a big",
+    "mom said", "the dog ran", "they were happy because",
+]
+
+
+# ---------------------------------------------------------------------------
+# Model backends: a batch of request dicts in, a list of response dicts out
+# ---------------------------------------------------------------------------
+def _check_number(request: dict, key: str, types, low: float, high: float = math.inf) -> None:
+    value = request.get(key, low)
+    if isinstance(value, bool) or not isinstance(value, types) or not low <= value <= high:
+        raise ValueError(f'"{key}" must be a{"n integer" if types is int else " number"} '
+                         f"in [{low}, {high}]")
+
+
+class Backend(ABC):
+    def __init__(self, model: torch.nn.Module, vocab: list[str], tok: Tokenizer, context_len: int):
+        self.model = model
+        self.vocab = vocab
+        self.tok = tok
+        self.context_len = context_len
+        self.bos = tok.token_to_id("[BOS]") or 1
+
+    def check(self, request: dict) -> None:
+        """Raise ValueError unless `request` is one this backend can answer."""
+        if not isinstance(request.get("text"), str):
+            raise ValueError('request needs a "text" string')
+        _check_number(request, "top_k", int, 1, len(self.vocab))
+        _check_number(request, "max_new_tokens", int, 0)
+        _check_number(request, "temperature", (int, float), 0)
+
+    def encode(self, requests: list[dict], max_len: int) -> list[list[int]]:
+        return [enc.ids[-max_len:] for enc in self.tok.encode_batch([r["text"] for r in requests])]
+
+    def predictions(self, logits: torch.Tensor, requests: list[dict]) -> list[list[dict]]:
+        """Top-k (token, prob) per request from last-position logits (B, V)."""
+        k = max(r.get("top_k", 5) for r in requests)
+        top = F.softmax(logits.float(), dim=-1).topk(k, dim=-1)
+        probs, ids = top.values.tolist(), top.indices.tolist()
+        return [
+            [{"token": self.vocab[i], "prob": round(p, 5)} for p, i in zip(ps, idx)][: r.get("top_k", 5)]
+            for r, ps, idx in zip(requests, probs, ids)
+        ]
+
+    @abstractmethod
+    def run(self, requests: list[dict]) -> list[dict]:
+        """One response dict per request, in order (called on a worker thread)."""
+
+
+class NextWordBackend(Backend):
+    """Fixed-width context: prompts shorter than context_len are left-padded
+    with [BOS] (which is also what the tokenizer puts at the start)."""
+
+    @torch.inference_mode()
+    def run(self, requests: list[dict]) -> list[dict]:
+        ctx = self.context_len
+        prompts = self.encode(requests, ctx)
+        x = torch.tensor([[self.bos] * (ctx - len(p)) + p for p in prompts])
+        preds = self.predictions(self.model(x), requests)
+        return [{"tokens": [self.vocab[i] for i in p], "predictions": pr}
+                for p, pr in zip(prompts, preds)]
+
+
+class AttentionBackend(Backend):
+    """Variable-length prompts, left-padded by TinyTransformer.prefill."""
+
+    @torch.inference_mode()
+    def run(self, requests: list[dict]) -> list[dict]:
+        max_new = [min(int(r.get("max_new_tokens", 0)), self.context_len - 1) for r in requests]
+        prompts = [p[-(self.context_len - n):] for p, n in
+                   zip(self.encode(requests, self.context_len), max_new)]
+        logits, _ = self.model.prefill(prompts)
+        preds = self.predictions(logits[:, -1], requests)
+        out = [{"tokens": [self.vocab[i] for i in p], "predictions": pr}
+               for p, pr in zip(prompts, preds)]
+
+        # Continuations, one generate() call per (temperature, length). generate
+        # stops at context_len minus the batch's longest prompt; each prompt was
+        # cut to context_len - n above, so within a group every row gets its n.
+        groups = defaultdict(list)
+        for i, n in enumerate(max_new):
+            if n > 0:
+                groups[float(requests[i].get("temperature", 0.0)), n].append(i)
+        for (temperature, n), idx in groups.items():
+            new = self.model.generate([prompts[i] for i in idx], n,
+                                      temperature=temperature, greedy=temperature == 0.0)
+            for i, ids in zip(idx, new):
+                out[i]["continuation"] = self.tok.decode(ids)
+        return out
+
+
+def load_backend(name: str) -> Backend:
+    tok = Tokenizer.from_file(str(TOKENIZER_PATH))
+    if name == "attention":
+        model, vocab = load_attention_model(ATTENTION_DIR)
+        return AttentionBackend(model, vocab, tok, model.cfg["context_len"])
+    model, vocab = load_next_word_model(NEXT_WORD_DIR, name)
+    return NextWordBackend(model, vocab, tok, model.context_len)
+
+
+# ---------------------------------------------------------------------------
+# Micro-batching
+# ---------------------------------------------------------------------------
+class MicroBatcher:
+    """Queue requests from many coroutines and run them through `run` in batches.
+    `check` (e.g. Backend.check) vets each request before it is queued."""
+
+    def __init__(self, run: Callable[[list[dict]], list[dict]], *, max_batch: int = 32,
+                 max_latency_ms: float = 5.0, check: Callable[[dict], None] | None = None):
+        self.run = run
+        self.check = check
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="model")
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.latencies: list[float] = []
+        self.batch_sizes: list[int] = []
+        self.started = time.perf_counter()
+
+    async def submit(self, request: dict) -> dict:
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, fut, time.perf_counter()))
+        return await fut
+
+    async def _next_batch(self) -> list[tuple]:
+        batch = [await self.queue.get()]
+        deadline = batch[0][2] + self.max_latency
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return batch
+
+    async def serve(self) -> None:
+        """Run batches forever; cancel the task to stop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await loop.run_in_executor(self.executor, self.run, [b[0] for b in batch])
+            except Exception as e:  # noqa: BLE001 - report to the callers, keep serving
+                results = [e]
+                if len(batch) > 1:  # rerun one by one so only the bad request fails
+                    results = [await self._run_one(request) for request, _, _ in batch]
+            now = time.perf_counter()
+            self.batch_sizes.append(len(batch))
+            for (_, fut, t0), res in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(res, Exception):
+                    fut.set_exception(res)
+                    continue
+                self.latencies.append(now - t0)
+                res["latency_ms"] = round((now - t0) * 1000, 2)
+                fut.set_result(res)
+
+    async def _run_one(self, request: dict) -> dict | Exception:
+        try:
+            [result] = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.run, [request])
+            return result
+        except Exception as e:  # noqa: BLE001
+            return e
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "requests": len(self.latencies),
+            "batches": len(self.batch_sizes),
+            "mean_batch": round(float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0, 2),
+            "requests_per_s": round(len(self.latencies) / max(elapsed, 1e-9), 1),
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p99_ms": round(float(np.percentile(lat, 99)), 2),
+        }
+
+
+async def answer(batcher: MicroBatcher, request: dict) -> dict:
+    """Submit one request; errors become an "error" field instead of raising."""
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        if batcher.check:
+            batcher.check(request)
+        response = await batcher.submit(request)
+    except Exception as e:  # noqa: BLE001
+        response = {"error": f"{type(e).__name__}: {e}"}
+    if isinstance(request, dict) and "id" in request:
+        response = {"id": request["id"], **response}
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Front ends
+# ---------------------------------------------------------------------------
+async def serve_stdin(batcher: MicroBatcher) -> None:
+    """JSON lines in on stdin, JSON lines out on stdout as each finishes."""
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def handle(line: str) -> None:
+        try:
+            response = await answer(batcher, json.loads(line))
+        except json.JSONDecodeError as e:
+            response = {"error": f"JSONDecodeError: {e}"}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+    while line := await loop.run_in_executor(None, sys.stdin.readline):
+        if line.strip():
+            task = asyncio.create_task(handle(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+
+
+async def serve_http(batcher: MicroBatcher, port: int) -> None:
+    """Minimal HTTP/1.1 on localhost: POST /predict, GET /stats (keep-alive)."""
+
+    async def reply(writer, status: str, body: dict) -> None:
+        data = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "GET" and path == "/stats":
+                    await reply(writer, "200 OK", batcher.stats())
+                elif method == "POST" and path == "/predict":
+                    try:
+                        request = json.loads(body)
+                    except json.JSONDecodeError as e:
+                        await reply(writer, "400 Bad Request", {"error": str(e)})
+                        continue
+                    await reply(writer, "200 OK", await answer(batcher, request))
+                else:
+                    await reply(writer, "404 Not Found", {"error": f"{method} {path}"})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port)
+    print(f"Listening on http://127.0.0.1:{port} (POST /predict, GET /stats)", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+async def bench(batcher: MicroBatcher, n_requests: int, concurrency: int, seed: int = 0) -> dict:
+    """`concurrency` clients, each sending its next request as soon as the last returns."""
+    rng = random.Random(seed)
+    requests = [{"text": rng.choice(BENCH_PHRASES)} for _ in range(n_requests)]
+    await asyncio.gather(*(answer(batcher, r) for r in requests[:concurrency]))  # warm-up
+    batcher.reset_stats()
+    it = iter(requests)
+
+    async def client() -> None:
+        for request in it:
+            await answer(batcher, request)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return batcher.stats()
+
+
+class ProfiledRun:
+    """backend.run, profiled per batch (see _profiling). torch.profiler only
+    records the thread that started it, so the profiler is created, stepped
+    and closed on the batcher's model thread."""
+
+    def __init__(self, run: Callable[[list[dict]], list[dict]], window: tuple[int, int],
+                 out_dir: Path, name: str):
+        self.run, self.args = run, (window, out_dir, name)
+        self.profiler: StepProfiler | None = None
+
+    def __call__(self, requests: list[dict]) -> list[dict]:
+        if self.profiler is None:
+            self.profiler = StepProfiler(*self.args)
+        results = self.run(requests)
+        self.profiler.step()
+        return results
+
+    def close(self) -> None:
+        if self.profiler is not None:
+            self.profiler.close()
+
+
+async def run(args: argparse.Namespace, backend: Backend) -> None:
+    run_batch = backend.run
+    if args.profile_steps:
+        run_batch = ProfiledRun(backend.run, args.profile_steps, PROFILE_DIR,
+                                f"serve-{args.model}")
+    batcher = MicroBatcher(run_batch, max_batch=args.max_batch, max_latency_ms=args.max_latency_ms,
+                           check=backend.check)
+    worker = asyncio.create_task(batcher.serve())
+    try:
+        if args.bench:
+            unbatched = MicroBatcher(backend.run, max_batch=1, check=backend.check)
+            unbatched_worker = asyncio.create_task(unbatched.serve())
+            rows = [("unbatched", await bench(unbatched, args.bench, args.concurrency))]
+            unbatched_worker.cancel()
+            rows.append((f"batch<={args.max_batch}", await bench(batcher, args.bench, args.concurrency)))
+            print(f"\n{args.bench} requests, {args.concurrency} concurrent clients, model {args.model}")
+            print(f"{'Mode':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+            for name, s in rows:
+                print(f"{name:<12} {s['requests_per_s']:>8,.0f} {s['p50_ms']:>8.1f} "
+                      f"{s['p99_ms']:>8.1f} {s['mean_batch']:>11.1f}")
+        elif args.http:
+            await serve_http(batcher, args.http)
+        else:
+            await serve_stdin(batcher)
+    finally:
+        worker.cancel()
+        if isinstance(run_batch, ProfiledRun):
+            batcher.executor.submit(run_batch.close).result()
+        if not args.bench:
+            print(f"stats: {json.dumps(batcher.stats())}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="attention",
+                        help='"attention", or a next-word export name such as next-word-best.')
+    parser.add_argument("--http", type=int, default=0, metavar="PORT",
+                        help="Serve HTTP on 127.0.0.1:PORT instead of JSON lines on stdin.")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-latency-ms", type=float, default=5.0,
+                        help="Longest a request waits for its batch to fill.")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="Benchmark N synthetic requests, unbatched vs. micro-batched.")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Concurrent clients for --bench.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="torch intra-op threads (default: torch's choice).")
+    add_profile_args(parser)  # steps = model batches (with --bench, the micro-batched run)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    backend = load_backend(args.model)
+    print(f"Loaded {args.model}", file=sys.stderr)
+    try:
+        asyncio.run(run(args, backend))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
-"""Quick test: load exported model and run inference."""
+"""Quick test: load exported model and run inference.
+
+--profile-steps START:END profiles those model forwards (see _profiling)."""
 # /// script
 # requires-python = ">=3.11"
 # dependencies = [
@@ -9,74 +11,35 @@
 # ]
 # ///
 
-import json
-import struct
+import argparse
+import sys
 from pathlib import Path
 
-import numpy as np
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
 from tokenizers import Tokenizer
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args  # noqa: E402
+from _weights import load_next_word_model  # noqa: E402
+
 ROOT = Path(__file__).resolve().parent.parent
 TOKENIZER_PATH = ROOT / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
 MODEL_DIR = ROOT / "public" / "data" / "next-word-model"
 
 
-class NextWordModel(nn.Module):
-    def __init__(self, vocab_size, embed_dim, context_len, hidden_dim):
-        super().__init__()
-        self.context_len = context_len
-        self.embed_dim = embed_dim
-        self.embedding = nn.Embedding(vocab_size, embed_dim)
-        self.fc1 = nn.Linear(context_len * embed_dim, hidden_dim)
-        self.fc2 = nn.Linear(hidden_dim, vocab_size)
-
-    def forward(self, x):
-        e = self.embedding(x)
-        e = e.view(e.size(0), -1)
-        h = F.relu(self.fc1(e))
-        return self.fc2(h)
-
-
 def load_model(name: str):
-    config_path = MODEL_DIR / f"{name}.json"
-    bin_path = MODEL_DIR / f"{name}.weights.bin"
-
-    with open(config_path) as f:
-        data = json.load(f)
-
-    cfg = data["config"]
-    model = NextWordModel(cfg["vocab_size"], cfg["embed_dim"], cfg["context_len"], cfg["hidden_dim"])
-
-    # Load binary weights
-    state = {}
-    weight_names = [
-        ("embedding.weight", None),
-        ("fc1.weight", None),
-        ("fc1.bias", None),
-        ("fc2.weight", None),
-        ("fc2.bias", None),
-    ]
-
-    with open(bin_path, "rb") as f:
-        for key, _ in weight_names:
-            ndims = struct.unpack("<I", f.read(4))[0]
-            shape = tuple(struct.unpack("<I", f.read(4))[0] for _ in range(ndims))
-            n_elements = 1
-            for d in shape:
-                n_elements *= d
-            arr = np.frombuffer(f.read(n_elements * 4), dtype=np.float32).reshape(shape)
-            state[key] = torch.from_numpy(arr.copy())
-
-    model.load_state_dict(state)
-    model.eval()
-    return model, data["vocab"], cfg
+    model, vocab = load_next_word_model(MODEL_DIR, name)
+    return model, vocab, {"context_len": model.context_len}
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_profile_args(parser)  # steps = model forwards, across all three models
+    args = parser.parse_args()
+
     tok = Tokenizer.from_file(str(TOKENIZER_PATH))
+    profiler = StepProfiler(args.profile_steps, PROFILE_DIR, "next-word-inference")
 
     for name in ["next-word-ctx2", "next-word-ctx3", "next-word-best"]:
         print(f"\n{'='*60}")
@@ -112,6 +75,7 @@ def main():
                 logits = model(x)
                 probs = F.softmax(logits, dim=-1)
                 top5 = probs.topk(5, dim=-1)
+            profiler.step()
 
             preds = []
             for prob, idx in zip(top5.values[0], top5.indices[0]):
@@ -142,6 +106,7 @@ def main():
                     logits = model(x)
                     probs = F.softmax(logits, dim=-1)
                     top5 = probs.topk(5, dim=-1)
+                profiler.step()
 
                 preds = []
                 for prob, idx in zip(top5.values[0], top5.indices[0]):
@@ -150,6 +115,8 @@ def main():
 
                 print(f"    the {word} → {', '.join(preds)}")
 
+    profiler.close()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Benchmark-suite test: a filtered run times only the selected cases and
+reports sane numbers, compare() flags exactly the cases that slowed down by
+more than the threshold, and speedups are reported for pairs that both ran."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import copy
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from bench_models import SPEEDUPS, all_cases, compare, run_benchmarks  # noqa: E402
+
+
+def main() -> None:
+    baseline = run_benchmarks(only="batch/", min_time=0.05)
+    results = baseline["results"]
+    assert sorted(results) == ["batch/blocks_t64_b64", "batch/context_windows_ctx3_b1024"], results
+    for name, r in results.items():
+        assert 0 < r["min_ms"] <= r["median_ms"] and r["reps"] >= 3, (name, r)
+
+    current = copy.deepcopy(baseline)
+    current["results"]["batch/blocks_t64_b64"]["median_ms"] *= 1.30  # regressed
+    current["results"]["batch/context_windows_ctx3_b1024"]["median_ms"] *= 1.05  # noise
+    current["results"]["new/case"] = {"median_ms": 1.0}  # not in the baseline: ignored
+    assert compare(baseline, current, threshold=0.15) == ["batch/blocks_t64_b64"]
+    assert compare(baseline, baseline, threshold=0.15) == []
+
+    # Every SPEEDUPS pair names real cases; a speedup is reported only when both ran.
+    names = {name for name, _ in all_cases("cpu", quick=False, tmp=ROOT)}
+    assert all(base in names and case in names for base, case in SPEEDUPS), SPEEDUPS
+    assert baseline["speedups"] == {}, baseline["speedups"]
+    group = run_benchmarks(only="next_word_group/", min_time=0.05)
+    (label, x), = group["speedups"].items()
+    r = group["results"]
+    assert label == "next_word_group/ctx3_x4_grouped vs next_word_group/ctx3_x4_sequential"
+    assert x == r["next_word_group/ctx3_x4_sequential"]["median_ms"] / \
+        r["next_word_group/ctx3_x4_grouped"]["median_ms"], (x, r)
+    print("Benchmarks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Chunked cross-entropy must match the loss train() used to compute,
+F.cross_entropy(model.output(h), y), in value and in every gradient, and
+must keep far less memory alive between forward and backward."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "torch>=2.0",
+# ]
+# ///
+
+import sys
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import CONFIG, TinyTransformer  # noqa: E402
+from _losses import chunked_cross_entropy  # noqa: E402
+
+TOL = 1e-5
+
+
+def max_diff(a: torch.Tensor, b: torch.Tensor) -> float:
+    return (a - b).abs().max().item()
+
+
+def check_function() -> None:
+    torch.manual_seed(0)
+    n, c, v = 300, 32, 500
+    weight = torch.randn(v, c, requires_grad=True)
+    bias = torch.randn(v, requires_grad=True)
+    targets = torch.randint(0, v, (n,))
+    for chunk_size in [1, 64, 300, 1000]:  # incl. a ragged last chunk and a single chunk
+        h1 = torch.randn(n, c, generator=torch.Generator().manual_seed(1), requires_grad=True)
+        h2 = h1.detach().clone().requires_grad_()
+        ref = F.cross_entropy(F.linear(h1, weight, bias), targets)
+        ref_grads = torch.autograd.grad(ref, [h1, weight, bias])
+        got = chunked_cross_entropy(h2, weight, bias, targets, chunk_size=chunk_size)
+        got_grads = torch.autograd.grad(got * 1.0, [h2, weight, bias])
+        assert abs(ref.item() - got.item()) < TOL, f"chunk {chunk_size}: loss {got} vs {ref}"
+        for name, r, g in zip(["hidden", "weight", "bias"], ref_grads, got_grads):
+            assert max_diff(r, g) < TOL, f"chunk {chunk_size}: {name} grad diff {max_diff(r, g):.2e}"
+    print("chunked_cross_entropy OK (loss and hidden/weight/bias gradients)")
+
+
+def model_grads(model: TinyTransformer, ids: torch.Tensor, chunked: bool) -> tuple[float, dict]:
+    model.zero_grad()
+    xs, ys = ids[:, :-1], ids[:, 1:]
+    if chunked:
+        loss = chunked_cross_entropy(model(xs, return_hidden=True), model.output.weight,
+                                     model.output.bias, ys, chunk_size=256)
+    else:
+        loss = F.cross_entropy(model(xs).view(-1, CONFIG["vocab_size"]), ys.reshape(-1))
+    loss.backward()
+    return loss.item(), {n: p.grad.clone() for n, p in model.named_parameters()}
+
+
+def check_model() -> None:
+    torch.manual_seed(0)
+    model = TinyTransformer(CONFIG)
+    ids = torch.randint(0, CONFIG["vocab_size"], (8, CONFIG["context_len"] + 1))
+    ref_loss, ref = model_grads(model, ids, chunked=False)
+    loss, got = model_grads(model, ids, chunked=True)
+    grad_diff = max(max_diff(ref[n], got[n]) for n in ref)
+    print(f"TinyTransformer loss diff {abs(ref_loss - loss):.2e}, max grad diff {grad_diff:.2e}")
+    assert abs(ref_loss - loss) < TOL and grad_diff < TOL
+    print("TinyTransformer chunked loss OK")
+
+
+def saved_mb(fn) -> float:
+    """MB of tensors autograd keeps from forward to backward for fn()."""
+    saved = {}
+
+    def pack(t: torch.Tensor) -> torch.Tensor:
+        saved[t.untyped_storage().data_ptr()] = t.untyped_storage().nbytes()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        fn()
+    return sum(saved.values()) / 2**20
+
+
+def check_memory() -> None:
+    torch.manual_seed(0)
+    n, c, v = 4096, 256, 4096  # one full-size batch: 64 x 64 tokens
+    h = torch.randn(n, c, requires_grad=True)
+    weight = torch.randn(v, c, requires_grad=True)
+    bias = torch.zeros(v, requires_grad=True)
+    targets = torch.randint(0, v, (n,))
+    full = saved_mb(lambda: F.cross_entropy(F.linear(h, weight, bias), targets))
+    chunked = saved_mb(lambda: chunked_cross_entropy(h, weight, bias, targets))
+    print(f"saved for backward, {n} tokens x {v} vocab: full {full:.0f} MB, chunked {chunked:.0f} MB")
+    assert chunked < full / 4, "chunked loss did not reduce activation memory"
+
+
+def main() -> None:
+    check_function()
+    check_model()
+    check_memory()
+
+
+if __name__ == "__main__":
+    main()
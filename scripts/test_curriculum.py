@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Sequence-length curriculum test: each stage trains on the expected row
+length, every step sees the same number of tokens, and the step count (and
+so the cosine schedule) matches fixed-length training."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import sys
+from pathlib import Path
+
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _test_fixtures import TINY, synthetic_tokens  # noqa: E402
+from train_attention_model import curriculum_seq_len, parse_curriculum, train  # noqa: E402
+
+BATCH = 4
+
+
+def shapes_seen(curriculum) -> list[tuple[int, int]]:
+    torch.manual_seed(0)
+    model = TinyTransformer(TINY)
+    shapes = []
+    model.register_forward_pre_hook(lambda _m, args: shapes.append(tuple(args[0].shape)))
+    data = synthetic_tokens(32)
+    train(model, data, epochs=2, batch_size=BATCH, lr=1e-3, device="cpu", log_every=10**9,
+          curriculum=curriculum)
+    return shapes
+
+
+def main() -> None:
+    curriculum = parse_curriculum("4:0.25,8:0.25")
+    assert curriculum == [(4, 0.25), (8, 0.25)]
+    assert [curriculum_seq_len(s, 16, 16, curriculum) for s in (0, 3, 4, 7, 8, 15)] == \
+        [4, 4, 8, 8, 16, 16]
+
+    fixed = shapes_seen(None)
+    staged = shapes_seen(curriculum)
+    print(f"fixed:      {fixed}")
+    print(f"curriculum: {staged}")
+    assert len(staged) == len(fixed) == 16, "curriculum changed the number of steps"
+    assert staged == [(16, 4)] * 4 + [(8, 8)] * 4 + [(4, 16)] * 8
+    assert all(r * c == BATCH * TINY["context_len"] for r, c in staged), "tokens per step changed"
+    print("Curriculum OK")
+
+
+if __name__ == "__main__":
+    main()
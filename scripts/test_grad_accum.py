@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Memory-saving modes must not change training: activation checkpointing
+gives bit-identical gradients, and 2 micro-batches of 4 with gradient
+accumulation train the same weights as batches of 8."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import sys
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _test_fixtures import TINY, synthetic_tokens  # noqa: E402
+from train_attention_model import train  # noqa: E402
+
+# Accumulation sums the batch in a different order; see test_ddp_training.py.
+TOL = 1e-4
+
+
+def check_activation_checkpointing() -> None:
+    torch.manual_seed(0)
+    model = TinyTransformer(TINY)
+    ids = torch.randint(0, TINY["vocab_size"], (4, TINY["context_len"] + 1))
+    grads = []
+    for enabled in [False, True]:
+        model.set_activation_checkpointing(enabled)
+        model.zero_grad()
+        logits = model(ids[:, :-1])
+        F.cross_entropy(logits.reshape(-1, TINY["vocab_size"]), ids[:, 1:].reshape(-1)).backward()
+        grads.append({n: p.grad.clone() for n, p in model.named_parameters()})
+    for name in grads[0]:
+        assert torch.equal(grads[0][name], grads[1][name]), f"{name}: checkpointed grad differs"
+    print("Activation checkpointing OK (bit-identical gradients)")
+
+
+def run(batch_size: int, grad_accum_steps: int) -> dict:
+    torch.manual_seed(0)
+    model = TinyTransformer(TINY)
+    train(model, synthetic_tokens(40), epochs=2, batch_size=batch_size, lr=1e-3, device="cpu",
+          log_every=10**9, grad_accum_steps=grad_accum_steps)
+    return model.state_dict()
+
+
+def check_grad_accum() -> None:
+    reference = run(batch_size=8, grad_accum_steps=1)
+    accumulated = run(batch_size=4, grad_accum_steps=2)
+    diff = max((reference[k] - accumulated[k]).abs().max().item() for k in reference)
+    print(f"max param diff, batch 4 x 2 accumulated vs batch 8: {diff:.2e}")
+    assert diff < TOL, f"gradient accumulation diverged ({diff:.2e})"
+    print("Gradient accumulation OK")
+
+
+def main() -> None:
+    torch.set_num_threads(1)
+    check_activation_checkpointing()
+    check_grad_accum()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Profiling test: a --profile-steps window over a tiny attention run writes
+a Chrome trace holding the attention / ffn / loss / backward / optimizer
+spans for exactly the profiled steps, plus the top-ops table; a window that
+outlasts the run is written when the run ends."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _profiling import StepProfiler  # noqa: E402
+from _test_fixtures import TINY, synthetic_tokens  # noqa: E402
+from train_attention_model import train  # noqa: E402
+
+STEPS = 8  # 32 blocks / batch 4
+
+
+def profile(window: tuple[int, int], out_dir: Path) -> dict[str, int]:
+    """Train with `window` profiled; returns how often each label appears in the trace."""
+    torch.manual_seed(0)
+    model = TinyTransformer(TINY)
+    data = synthetic_tokens(32)
+    train(model, data, epochs=1, batch_size=4, lr=1e-3, device="cpu", log_every=10**9,
+          profiler=StepProfiler(window, out_dir, "test-profile"))
+    table = (out_dir / "test-profile.top-ops.txt").read_text()
+    assert "aten::" in table and "Labelled spans" in table
+    trace = json.loads((out_dir / "test-profile.trace.json").read_text())
+    names = [e.get("name") for e in trace["traceEvents"]]
+    return {label: names.count(label)
+            for label in ("attention", "ffn", "loss", "backward", "optimizer")}
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        counts = profile((3, 5), Path(tmp))
+        print(f"steps 3..5: {counts}")
+        n_layers = TINY["num_layers"]
+        assert counts == {"attention": 3 * n_layers, "ffn": 3 * n_layers, "loss": 3,
+                          "backward": 3, "optimizer": 3}, counts
+
+        counts = profile((7, 100), Path(tmp))
+        print(f"steps 7..100 of {STEPS}: {counts}")
+        assert counts["optimizer"] == STEPS - 6, counts
+    print("Profiling OK")
+
+
+if __name__ == "__main__":
+    main()
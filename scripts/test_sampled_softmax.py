@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Sampled-softmax test: a logit vector trained only with the sampled loss
+(negatives from a proposal Q unrelated to the data) must converge to the
+data distribution, which holds only if the log-Q correction is right. Also
+checks the unigram proposal built from a token array."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _losses import sampled_softmax_cross_entropy, unigram_log_q  # noqa: E402
+
+VOCAB = 32
+NUM_SAMPLES = 32
+STEPS = 2000
+# Total variation between the learned and true distributions. A finite
+# number of negatives leaves a small bias (about 0.07 here); with the
+# proposal's log-Q left uncorrected the fit lands around 0.5.
+TV_TOL = 0.12
+
+
+def check_proposal() -> None:
+    tokens = np.array([0, 0, 0, 1, 3, 3, 3, 3, 3, 3, 3], dtype=np.uint16)
+    q = unigram_log_q(tokens, 5, power=0.75, chunk=4).exp().double()
+    counts = np.array([3, 1, 0, 7, 0]) + 1.0
+    expected = counts ** 0.75 / (counts ** 0.75).sum()
+    assert torch.allclose(q, torch.from_numpy(expected), atol=1e-6), (q, expected)
+    print(f"proposal OK: {q.numpy().round(3)}")
+
+
+def check_convergence() -> None:
+    torch.manual_seed(0)
+    p = torch.softmax(torch.randn(VOCAB) * 1.5, 0)  # data distribution
+    log_q = torch.log_softmax(torch.randn(VOCAB) * 1.5, 0)  # an unrelated proposal
+    # hidden = 1, so the weight column is the logit vector.
+    weight = torch.zeros(VOCAB, 1, requires_grad=True)
+    opt = torch.optim.Adam([weight], lr=0.05)
+    sched = torch.optim.lr_scheduler.CosineAnnealingLR(opt, STEPS)
+    for _ in range(STEPS):
+        targets = torch.multinomial(p, 512, replacement=True)
+        loss = sampled_softmax_cross_entropy(torch.ones(512, 1), weight, None, targets, log_q,
+                                             NUM_SAMPLES)
+        opt.zero_grad()
+        loss.backward()
+        opt.step()
+        sched.step()
+    learned = torch.softmax(weight.detach()[:, 0], 0)
+    tv = 0.5 * (learned - p).abs().sum().item()
+    print(f"TV(learned, data) after {STEPS} sampled-softmax steps: {tv:.3f}")
+    assert tv < TV_TOL, f"sampled softmax did not recover the data distribution (TV {tv:.3f})"
+
+
+def main() -> None:
+    check_proposal()
+    check_convergence()
+    print("Sampled softmax OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Serving test: a response never depends on which requests share its
+micro-batch. A short prompt's greedy continuation is the same full length
+whether it runs alone or next to a prompt that nearly fills the context,
+malformed or out-of-range requests get their own error, and a request that
+fails inside the model does not fail the rest of its batch."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import asyncio
+import sys
+from pathlib import Path
+
+import torch
+from tokenizers import Tokenizer
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _test_fixtures import TINY  # noqa: E402
+from serve_models import TOKENIZER_PATH, AttentionBackend, MicroBatcher, answer  # noqa: E402
+
+# The real tokenizer's vocabulary, and room for a prompt plus 20 new tokens.
+CONFIG = {**TINY, "vocab_size": 4096, "context_len": 64}
+SHORT = {"text": "once upon a", "max_new_tokens": 20}
+LONG = {"text": "the cat sat on the mat. " * 20, "max_new_tokens": 1}  # cut to 63 tokens
+
+
+def tiny_backend() -> AttentionBackend:
+    torch.manual_seed(0)
+    tok = Tokenizer.from_file(str(TOKENIZER_PATH))
+    vocab = [tok.id_to_token(i) or f"<id_{i}>" for i in range(CONFIG["vocab_size"])]
+    return AttentionBackend(TinyTransformer(CONFIG).eval(), vocab, tok, CONFIG["context_len"])
+
+
+async def served(backend: AttentionBackend, requests: list, check: bool = True) -> list[dict]:
+    """Answer `requests` concurrently through one micro-batcher."""
+    batcher = MicroBatcher(backend.run, max_batch=len(requests), max_latency_ms=50,
+                           check=backend.check if check else None)
+    worker = asyncio.create_task(batcher.serve())
+    try:
+        return await asyncio.gather(*(answer(batcher, r) for r in requests))
+    finally:
+        worker.cancel()
+
+
+def main() -> None:
+    backend = tiny_backend()
+    prompt = backend.encode([SHORT], CONFIG["context_len"])[0]
+    expected = backend.model.generate([prompt], 20, greedy=True)[0]
+    assert len(expected) == 20
+
+    [alone] = asyncio.run(served(backend, [SHORT]))
+    short, long = asyncio.run(served(backend, [SHORT, LONG]))
+    assert len(long["tokens"]) == CONFIG["context_len"] - 1, len(long["tokens"])
+    assert alone["continuation"] == short["continuation"] == backend.tok.decode(expected), \
+        (alone["continuation"], short["continuation"])
+
+    bad = [{"text": "hi", "top_k": 100_000}, {"text": "hi", "max_new_tokens": -1},
+           {"text": "hi", "temperature": "hot"}, {"top_k": 5}, [1, 2], 3]
+    *errors, ok = asyncio.run(served(backend, [*bad, {"id": 7, "text": "hi"}]))
+    assert all("ValueError" in e.get("error", "") for e in errors), errors
+    assert ok["id"] == 7 and len(ok["predictions"]) == 5, ok
+    # Unchecked, the bad top_k fails inside the batch; only its own request sees that.
+    failed, ok = asyncio.run(served(backend, [bad[0], {"text": "hi"}], check=False))
+    assert "error" in failed and "predictions" in ok, (failed, ok)
+    print("Serving OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Speculative decoding must not change what the transformer generates:
+greedy output equals TinyTransformer.generate(greedy=True), and sampled
+output follows the transformer's own distribution, checked on a tiny vocab
+against the exact joint probabilities of the first tokens."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "torch>=2.0",
+# ]
+# ///
+
+import itertools
+import sys
+from pathlib import Path
+
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer, sampling_probs  # noqa: E402
+from _next_word_model import NextWordModel  # noqa: E402
+from _speculative import speculative_generate  # noqa: E402
+
+TINY = {"vocab_size": 4, "embed_dim": 16, "num_heads": 2, "num_layers": 2, "ff_dim": 32,
+        "context_len": 16}
+SAMPLES = 10_000
+TV_TOL = 0.04  # expected sampling noise for 64 cells at 10k samples is <~0.02
+
+
+def tiny_models(vocab_size: int, seed: int) -> tuple[TinyTransformer, NextWordModel]:
+    torch.manual_seed(seed)
+    target = TinyTransformer({**TINY, "vocab_size": vocab_size}).eval()
+    draft = NextWordModel(vocab_size, 8, 2, 16).eval()
+    with torch.no_grad():  # sharpen the draft so it is confidently wrong some of the time
+        draft.fc2.weight.mul_(4)
+    return target, draft
+
+
+def check_greedy() -> None:
+    target, draft = tiny_models(32, seed=0)
+    prompts = [[1], [3, 7, 2], [5, 5, 5, 5, 9]]
+    for prompt, k in itertools.product(prompts, [1, 3, 5]):
+        ref = target.generate([prompt], 10, greedy=True)[0]
+        got, stats = speculative_generate(target, draft, prompt, 10, k=k, greedy=True)
+        assert got == ref, f"prompt {prompt} k={k}: {got} != {ref}"
+        assert stats.target_calls <= 1 + len(got)
+    # Capped at context_len, stops at EOS.
+    got, _ = speculative_generate(target, draft, list(range(TINY["context_len"] - 2)), 9, k=4,
+                                  greedy=True)
+    assert len(got) == 2
+    ref = target.generate([[1]], 10, greedy=True)[0]
+    got, _ = speculative_generate(target, draft, [1], 10, k=3, greedy=True, eos_id=ref[3])
+    assert got == ref[: ref.index(ref[3])], "did not stop at EOS"
+    print("greedy parity OK")
+
+
+@torch.no_grad()
+def exact_joint(target: TinyTransformer, prompt: list[int], n: int, **sampling) -> dict:
+    """P(first n tokens) under plain sampling from the target."""
+    joint = {}
+    for seq in itertools.product(range(target.cfg["vocab_size"]), repeat=n):
+        prob, ids = 1.0, list(prompt)
+        for t in seq:
+            prob *= float(sampling_probs(target(torch.tensor([ids]))[0, -1], **sampling)[t])
+            ids.append(t)
+        joint[seq] = prob
+    return joint
+
+
+def check_distribution(k: int, **sampling) -> None:
+    target, draft = tiny_models(TINY["vocab_size"], seed=1)
+    prompt, n = [2, 1], 3
+    exact = exact_joint(target, prompt, n, **sampling)
+    gen = torch.Generator().manual_seed(0)
+    counts = dict.fromkeys(exact, 0)
+    accepted = proposed = 0
+    for _ in range(SAMPLES):
+        out, stats = speculative_generate(target, draft, prompt, n, k=k, generator=gen, **sampling)
+        counts[tuple(out)] += 1
+        accepted += stats.accepted
+        proposed += stats.proposed
+    tv = 0.5 * sum(abs(counts[s] / SAMPLES - p) for s, p in exact.items())
+    print(f"k={k} {sampling}: total variation {tv:.4f}, acceptance {accepted / proposed:.0%}")
+    assert 0 < accepted < proposed, "test needs both accepted and rejected drafts"
+    assert tv < TV_TOL, f"speculative samples deviate from the target (TV {tv:.4f})"
+
+
+def main() -> None:
+    torch.set_grad_enabled(False)
+    check_greedy()
+    check_distribution(k=2)
+    check_distribution(k=3, temperature=0.7, top_k=3)
+    print("Speculative decoding OK")
+
+
+if __name__ == "__main__":
+    main()
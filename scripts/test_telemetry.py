@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Telemetry test: a tiny attention run writes one JSONL record per sampled
+step with every field filled in, the phase times fit inside the step time,
+and a Telemetry without a path writes nothing."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "tokenizers>=0.21",
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _telemetry import PHASES, Telemetry  # noqa: E402
+from _test_fixtures import TINY, synthetic_tokens  # noqa: E402
+from train_attention_model import train  # noqa: E402
+
+FIELDS = {"time", "trainer", "step", "step_ms", "tokens_per_s", "samples_per_s", "peak_rss_mb",
+          "lr", "grad_norm", "loss", "seq_len", *(f"{p}_ms" for p in PHASES)}
+
+
+def run(telemetry: Telemetry) -> None:
+    torch.manual_seed(0)
+    model = TinyTransformer(TINY)
+    data = synthetic_tokens(32)
+    train(model, data, epochs=2, batch_size=4, lr=1e-3, device="cpu", log_every=10**9,
+          telemetry=telemetry)
+    telemetry.close()
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "telemetry.jsonl"
+        run(Telemetry(path, every=3, run={"trainer": "attention"}))
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+
+        run(Telemetry(None))
+        assert list(Path(tmp).iterdir()) == [path], "a disabled Telemetry wrote a file"
+
+    print(f"{len(records)} records, first: {records[0]}")
+    assert [r["step"] for r in records] == [1, 4, 7, 10, 13, 16]  # 16 steps, every 3rd
+    for r in records:
+        assert FIELDS <= r.keys(), f"missing fields: {FIELDS - r.keys()}"
+        assert all(isinstance(r[k], float) for k in ("loss", "grad_norm", "lr"))
+        phases = sum(r[f"{p}_ms"] for p in PHASES)
+        assert 0 < phases <= r["step_ms"] * 1.01, (phases, r["step_ms"])
+        assert abs(r["tokens_per_s"] / r["samples_per_s"] - TINY["context_len"]) < 0.1
+    assert records[0]["lr"] > records[-1]["lr"], "lr should follow the cosine decay"
+    print("Telemetry OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Weights-container test: exports of both models round-trip (float32 bit for
+bit, int8 within half a quantization step), every tensor is 64-byte aligned
+and readable on its own from the index, the mapped loader shares float32
+pages with the file and dequantizes int8 only on lookup, and legacy files
+load and convert to containers without changing a single stored value.
+It also checks that the fixtures for src/lib/weights-file.test.ts are still
+what _weights.py writes (--update-fixtures rewrites them)."""
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "torch>=2.0",
+#     "numpy>=1.24",
+# ]
+# ///
+
+import json
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+from _attention_model import TinyTransformer  # noqa: E402
+from _test_fixtures import TINY  # noqa: E402
+from _weights import (  # noqa: E402
+    ALIGN, MappedWeights, build_model, convert_legacy, is_container, load_attention_model,
+    load_weights, quantize_int8, read_index, stored_array, write_weights,
+)
+
+FIXTURE_DIR = ROOT / "src" / "lib" / "__fixtures__" / "weights"
+
+
+def write_legacy(path: Path, tensors: dict[str, torch.Tensor], quantized: bool) -> None:
+    """The pre-container format: [ndims][dims...]([scale])[data], names implied by order."""
+    with open(path, "wb") as f:
+        for t in tensors.values():
+            arr = t.numpy()
+            f.write(struct.pack(f"<I{arr.ndim}I", arr.ndim, *arr.shape))
+            if quantized:
+                arr, scale = quantize_int8(arr)
+                f.write(struct.pack("<f", scale))
+            f.write(arr.tobytes())
+
+
+def check_container(path: Path, model: torch.nn.Module, config: dict, quantized: bool) -> None:
+    raw = np.fromfile(path, dtype=np.uint8)
+    assert is_container(raw)
+    index = read_index(raw)
+    state = model.state_dict()
+    assert [e["name"] for e in index] == list(state)
+    for e in index:
+        assert e["offset"] % ALIGN == 0, (e["name"], e["offset"])
+        assert e["dtype"] == ("int8" if quantized else "float32")
+        assert e["shape"] == list(state[e["name"]].shape)
+    # One tensor straight from its offset, no other tensor parsed.
+    last = index[-1]
+    arr = np.fromfile(path, dtype=np.int8 if quantized else np.float32,
+                      count=int(np.prod(last["shape"])), offset=last["offset"])
+    assert np.array_equal(arr.reshape(last["shape"]), stored_array(raw, last))
+
+    weights = MappedWeights(path)
+    base = weights.raw.ctypes.data
+    name = index[0]["name"]
+    if quantized:
+        assert not weights._dequantized and weights.stored(name).dtype == torch.int8
+        weights[name]
+        assert list(weights._dequantized) == [name], "int8 should dequantize on lookup only"
+    else:
+        assert weights[name].data_ptr() == base + index[0]["offset"], "float32 should not copy"
+
+    reloaded = build_model(config)
+    load_weights(reloaded, path)
+    for (key, a), b in zip(state.items(), reloaded.state_dict().values()):
+        if quantized:
+            step = next(e["scale"] for e in index if e["name"] == key)
+            assert (a - b).abs().max() <= step / 2 * 1.001, key
+        else:
+            assert torch.equal(a, b), key
+
+
+def write_fixtures(out_dir: Path) -> None:
+    """Small containers and legacy files (float32 and int8) for the browser
+    reader's test, with the values it should decode in expected.json."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tensors = {"a.weight": torch.tensor([[0.5, -1.25, 2.0], [3.75, -0.125, 0.0]]),
+               "a.bias": torch.tensor([1e-3, -7.0, 0.3]),
+               "b.weight": torch.linspace(-1, 1, 5)}
+    expected = {"names": list(tensors), "shapes": {k: list(t.shape) for k, t in tensors.items()}}
+    for quantization in (None, "int8"):
+        kind = quantization or "float32"
+        write_weights(out_dir / f"container-{kind}.bin", tensors, quantization)
+        write_legacy(out_dir / f"legacy-{kind}.bin", tensors, quantization == "int8")
+        weights = MappedWeights(out_dir / f"container-{kind}.bin")
+        expected[kind] = {k: weights[k].flatten().tolist() for k in tensors}
+    (out_dir / "expected.json").write_text(json.dumps(expected) + "\n")
+
+
+def check_fixtures(update: bool) -> None:
+    if update:
+        write_fixtures(FIXTURE_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_fixtures(Path(tmp))
+        for path in sorted(Path(tmp).iterdir()):
+            committed = FIXTURE_DIR / path.name
+            assert committed.exists() and committed.read_bytes() == path.read_bytes(), \
+                f"{committed} is stale; rerun with --update-fixtures"
+
+
+def main() -> None:
+    check_fixtures(update="--update-fixtures" in sys.argv)
+    torch.manual_seed(0)
+    next_word = {"vocab_size": 64, "embed_dim": 8, "context_len": 3, "hidden_dim": 32}
+    models = {"attention": (TinyTransformer(TINY), TINY),
+              "next-word": (build_model(next_word), next_word)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind, (model, config) in models.items():
+            for quantization in (None, "int8"):
+                quantized = quantization == "int8"
+                path = Path(tmp) / f"{kind}-{quantization}.weights.bin"
+                write_weights(path, model.state_dict(), quantization)
+                check_container(path, model, config, quantized)
+
+                config_path = Path(tmp) / f"{kind}-{quantization}-legacy.json"
+                config_path.write_text(json.dumps(
+                    {"config": {**config, "quantization": "int8"} if quantized else config}))
+                legacy = config_path.with_suffix(".weights.bin")
+                write_legacy(legacy, model.state_dict(), quantized)
+                legacy_bytes = legacy.stat().st_size
+                names = list(model.state_dict())
+                before = {k: t.clone() for k, t in MappedWeights(legacy, names, quantized).items()}
+                assert convert_legacy(config_path) and not convert_legacy(config_path)
+                after = MappedWeights(legacy)
+                assert list(after) == names
+                assert all(torch.equal(before[k], after[k]) for k in names), kind
+                check_container(legacy, model, config, quantized)
+                print(f"{kind:<9} {quantization or 'float32':<7} OK "
+                      f"({path.stat().st_size:,} bytes, legacy {legacy_bytes:,})")
+
+        # The tools' loader: an uninitialised model pointed at the mapped file.
+        model, config = models["attention"]
+        write_weights(Path(tmp) / "model.weights.bin", model.state_dict())
+        (Path(tmp) / "model.json").write_text(json.dumps({"config": config, "vocab": []}))
+        loaded, _ = load_attention_model(Path(tmp))
+        ids = torch.randint(0, config["vocab_size"], (2, config["context_len"]))
+        with torch.no_grad():
+            assert torch.equal(model.eval()(ids), loaded(ids))
+    print("Weight format OK")
+
+
+if __name__ == "__main__":
+    main()
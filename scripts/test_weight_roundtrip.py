@@ -10,62 +10,19 @@ that running the same forward pass on a fixed input produces matching logits."""
 # ///
 
 import json
-import struct
 import sys
 from pathlib import Path
 
-import numpy as np
 import torch
 
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT / "scripts"))
 from _attention_model import CONFIG, TinyTransformer  # noqa: E402
+from _weights import load_weights  # noqa: E402
 
 MODEL_DIR = ROOT / "public" / "data" / "attention-model"
 
 
-def read_tensor_quantized(f, quantized: bool) -> np.ndarray:
-    raw = f.read(4)
-    (ndims,) = struct.unpack("<I", raw)
-    dims = [struct.unpack("<I", f.read(4))[0] for _ in range(ndims)]
-    n = int(np.prod(dims))
-    if quantized:
-        (scale,) = struct.unpack("<f", f.read(4))
-        ints = np.frombuffer(f.read(n), dtype=np.int8).reshape(dims)
-        return (ints.astype(np.float32) * scale).copy()
-    else:
-        arr = np.frombuffer(f.read(n * 4), dtype=np.float32).reshape(dims)
-        return arr.copy()
-
-
-def load_into_model(model: TinyTransformer, bin_path: Path, quantized: bool = False) -> None:
-    with open(bin_path, "rb") as f:
-        model.token_emb.weight.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        model.pos_emb.weight.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        for layer in model.layers:
-            attn = layer["attn"]
-            ffn = layer["ffn"]
-            for name in [
-                ("attn", "ln1", "weight"), ("attn", "ln1", "bias"),
-                ("attn", "qkv", "weight"), ("attn", "qkv", "bias"),
-                ("attn", "out", "weight"), ("attn", "out", "bias"),
-                ("ffn", "ln2", "weight"), ("ffn", "ln2", "bias"),
-                ("ffn", "fc1", "weight"), ("ffn", "fc1", "bias"),
-                ("ffn", "fc2", "weight"), ("ffn", "fc2", "bias"),
-            ]:
-                root = attn if name[0] == "attn" else ffn
-                getattr(getattr(root, name[1]), name[2]).data.copy_(
-                    torch.from_numpy(read_tensor_quantized(f, quantized))
-                )
-        model.ln_final.weight.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        model.ln_final.bias.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        model.output.weight.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        model.output.bias.data.copy_(torch.from_numpy(read_tensor_quantized(f, quantized)))
-        # Verify file is fully consumed
-        leftover = f.read()
-        assert len(leftover) == 0, f"Leftover bytes: {len(leftover)}"
-
-
 def main() -> None:
     config_path = MODEL_DIR / "model.json"
     bin_path = MODEL_DIR / "model.weights.bin"
@@ -81,7 +38,7 @@ def main() -> None:
     # Build a fresh model and load weights from disk
     reloaded = TinyTransformer(CONFIG)
     reloaded.eval()
-    load_into_model(reloaded, bin_path, quantized=quantized)
+    load_weights(reloaded, bin_path, quantized=quantized)
 
     # The training script must save its trained model to checkpoint.pt as well
     # so we can compare. If that file doesn't exist, just sanity-check shapes.
@@ -7,6 +7,7 @@ previous N tokens.
 
 Usage:
     uv run scripts/train-next-word-model.py
+    uv run scripts/train-next-word-model.py --corpus stories.jsonl --workers 8
 
 Tries multiple configurations (context sizes, embedding widths) and exports
 the best one to TensorFlow.js format.
@@ -21,47 +22,41 @@ the best one to TensorFlow.js format.
 # ]
 # ///
 
+import argparse
 import json
 import math
 import os
-import struct
+import sys
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator
 
-import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from datasets import load_dataset
 from tokenizers import Tokenizer
+from torch.profiler import record_function
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _accel import add_accel_args, autocast, check_amp, compile_model, grad_scaler  # noqa: E402
+from _corpus import add_corpus_args  # noqa: E402
+from _evaluate import evaluate  # noqa: E402
+from _losses import sampled_softmax_cross_entropy, unigram_log_q  # noqa: E402
+from _next_word_model import NextWordModel, count_params  # noqa: E402
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args  # noqa: E402
+from _sweep import successive_halving  # noqa: E402
+from _telemetry import Telemetry, add_telemetry_args, grad_norm  # noqa: E402
+from _telemetry import from_args as telemetry_from_args  # noqa: E402
+from _token_store import ContextWindows, TokenStore, load_token_store, open_store  # noqa: E402
+from _weights import write_weights  # noqa: E402
 
 ROOT = Path(__file__).resolve().parent.parent
 TOKENIZER_PATH = ROOT / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
 OUTPUT_DIR = ROOT / "public" / "data" / "next-word-model"
 
 
-# ---------------------------------------------------------------------------
-# Model
-# ---------------------------------------------------------------------------
-class NextWordModel(nn.Module):
-    """Simple next-word predictor: embed context tokens → flatten → dense → vocab."""
-
-    def __init__(self, vocab_size: int, embed_dim: int, context_len: int, hidden_dim: int):
-        super().__init__()
-        self.context_len = context_len
-        self.embed_dim = embed_dim
-        self.embedding = nn.Embedding(vocab_size, embed_dim)
-        self.fc1 = nn.Linear(context_len * embed_dim, hidden_dim)
-        self.fc2 = nn.Linear(hidden_dim, vocab_size)
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        # x: (batch, context_len) of token ids
-        e = self.embedding(x)  # (batch, context_len, embed_dim)
-        e = e.view(e.size(0), -1)  # (batch, context_len * embed_dim)
-        h = F.relu(self.fc1(e))
-        return self.fc2(h)  # (batch, vocab_size)
-
-
 # ---------------------------------------------------------------------------
 # Data
 # ---------------------------------------------------------------------------
@@ -70,135 +65,252 @@ def load_tokenizer() -> Tokenizer:
     return tok
 
 
-def tokenize_stories(tok: Tokenizer, num_stories: int = 50_000) -> list[list[int]]:
-    """Load TinyStories and tokenize into lists of token ids."""
-    print(f"Loading TinyStories ({num_stories} stories)...")
-    ds = load_dataset("roneneldan/TinyStories", split="train", streaming=True)
-
-    all_ids: list[list[int]] = []
-    for i, row in enumerate(ds):
-        if i >= num_stories:
-            break
-        text = row["text"]
-        encoded = tok.encode(text)
-        ids = encoded.ids
-        if len(ids) >= 4:  # need at least context + 1 target
-            all_ids.append(ids)
-        if (i + 1) % 10000 == 0:
-            print(f"  Tokenized {i + 1} stories...")
-
-    print(f"  Done: {len(all_ids)} stories, {sum(len(s) for s in all_ids)} total tokens")
-    return all_ids
-
-
-def make_training_data(
-    stories: list[list[int]], context_len: int
-) -> tuple[torch.Tensor, torch.Tensor]:
-    """Create (context, target) pairs from tokenized stories."""
-    xs, ys = [], []
-    for story in stories:
-        for i in range(len(story) - context_len):
-            xs.append(story[i : i + context_len])
-            ys.append(story[i + context_len])
-
-    return torch.tensor(xs, dtype=torch.long), torch.tensor(ys, dtype=torch.long)
-
-
 # ---------------------------------------------------------------------------
 # Training
 # ---------------------------------------------------------------------------
+def split_windows(data: ContextWindows) -> tuple[torch.Tensor, torch.Tensor]:
+    """Shuffle and split window *indices* 95/5 for train/val.
+
+    Batches are gathered from the shared token array on demand, so the data
+    itself is never materialised or permuted.
+    """
+    n = len(data)
+    perm = torch.randperm(n, dtype=torch.int32 if n < 2**31 else torch.int64)
+    split = int(n * 0.95)
+    return perm[:split], perm[split:]
+
+
+# Models bigger than this snapshot their best weights to disk instead of RAM.
+SNAPSHOT_DISK_BYTES = 256 * 2**20
+
+
+class BestState:
+    """Holds a model's best-so-far weights and their Adam state: a CPU copy,
+    or a file for big models."""
+
+    def __init__(self, model: nn.Module):
+        n_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        self._dir = tempfile.TemporaryDirectory() if n_bytes > SNAPSHOT_DISK_BYTES else None
+        self._state: dict | None = None
+
+    def save(self, model: nn.Module, optimizer: torch.optim.Optimizer) -> None:
+        # The optimizer may be shared by a group, so only this model's params'
+        # moments are kept, with the device each value lives on.
+        state = {
+            "model": {k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()},
+            "optimizer": [{k: (v.device, v.detach().to("cpu", copy=True))
+                           for k, v in optimizer.state[p].items()} for p in model.parameters()],
+        }
+        if self._dir is None:
+            self._state = state
+        else:
+            torch.save(state, Path(self._dir.name) / "best.pt")
+
+    def restore(self, model: nn.Module, optimizer: torch.optim.Optimizer) -> None:
+        """Roll the weights back and the Adam moments with them, so training
+        that resumes from here (a halving rung) does not carry the momentum
+        of the worse epochs that were discarded."""
+        state = self._state
+        if self._dir is not None:
+            path = Path(self._dir.name) / "best.pt"
+            state = torch.load(path, weights_only=False) if path.exists() else None
+            self._dir.cleanup()
+        if state is None:
+            return
+        model.load_state_dict(state["model"])
+        for p, saved in zip(model.parameters(), state["optimizer"]):
+            optimizer.state[p] = {k: v.to(device) for k, (device, v) in saved.items()}
+
+
 def train_model(
     model: NextWordModel,
-    X: torch.Tensor,
-    Y: torch.Tensor,
+    data: ContextWindows,
     epochs: int = 3,
     batch_size: int = 512,
     lr: float = 0.001,
     device: str = "cpu",
+    log_prefix: str = "",
+    patience: int | None = None,
+    min_delta: float = 0.0,
 ) -> float:
-    model = model.to(device)
-    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
-    criterion = nn.CrossEntropyLoss()
+    return train_models([model], data, epochs=epochs, batch_size=batch_size, lr=lr,
+                        device=device, log_prefixes=[log_prefix], patience=patience,
+                        min_delta=min_delta)[0]["val_loss"]
 
-    n = len(X)
-    n_batches = math.ceil(n / batch_size)
-
-    # Shuffle once
-    perm = torch.randperm(n)
-    X = X[perm]
-    Y = Y[perm]
-
-    # Split 95/5 for train/val
-    split = int(n * 0.95)
-    X_train, X_val = X[:split], X[split:]
-    Y_train, Y_val = Y[:split], Y[split:]
 
-    best_val_loss = float("inf")
+def train_models(
+    models: list[NextWordModel],
+    data: ContextWindows,
+    epochs: int = 3,
+    batch_size: int = 512,
+    lr: float = 0.001,
+    device: str = "cpu",
+    log_prefixes: list[str] | None = None,
+    split: tuple[torch.Tensor, torch.Tensor] | None = None,
+    optimizer: torch.optim.Optimizer | None = None,
+    patience: int | None = None,
+    min_delta: float = 0.0,
+    eval_batch_size: int = 8192,
+    amp: str | None = None,
+    compile: bool = False,
+    sampled_softmax: int = 0,
+    telemetry: Telemetry | None = None,
+    profiler: StepProfiler | None = None,
+) -> list[dict]:
+    """Train several same-context models side by side on identical batches.
+
+    Every batch is gathered and moved to the device once for the whole group.
+    The summed loss is backpropagated once, and a single foreach Adam steps
+    every parameter. Parameters are disjoint, so each model's gradients and
+    Adam state are exactly what training it alone would give. Losses and
+    metrics are tracked per model; validation runs through the shared
+    Evaluator in `eval_batch_size` chunks without per-batch host syncs.
+
+    Each model still runs its own forward: the widths differ, and padding
+    them to one stacked bmm measured ~1.5x slower on CPU. Per step a group
+    costs about what its models cost one at a time (bench_models.py,
+    next_word_group/); what it saves is the per-run data and eval passes.
+
+    Each model's weights from its best validation epoch, and its Adam state
+    from then, are restored before returning. With `patience`, a model stops training once its val loss has
+    not improved by more than `min_delta` for that many epochs; the rest of
+    the group carries on without it. Returns one dict per model with its
+    best `val_loss`, `epochs` actually trained, `best_epoch`, `elapsed` wall
+    time and mean training `step_ms`.
+
+    `amp` / `compile` select mixed precision and torch.compile (see _accel);
+    parameters, snapshots and exports stay fp32.
+
+    With sampled_softmax > 0, training scores each target against that many
+    negatives from the corpus unigram proposal instead of all of fc2 (see
+    _losses); train_loss is then the sampled estimate. Validation, and hence
+    model selection, uses the full softmax.
+
+    `telemetry` (see _telemetry) records sampled per-step timings for the
+    group, with each active model's loss. `profiler` (see _profiling)
+    captures a window of steps, counted across calls.
+
+    Pass `split` and `optimizer` from a previous call to continue training
+    where it left off (the successive-halving sweep does this).
+    """
+    assert all(m.context_len == data.context_len for m in models)
+    t0 = time.time()
+    models = [m.to(device) for m in models]
+    log_prefixes = log_prefixes or [""] * len(models)
+    if optimizer is None:
+        params = [p for m in models for p in m.parameters()]
+        optimizer = torch.optim.Adam(params, lr=lr, foreach=True)
+    criterion = nn.CrossEntropyLoss()
+    telemetry = telemetry or Telemetry(None)
+    profiler = profiler or StepProfiler(None, OUTPUT_DIR, "")
+    names = [p.strip(" []") for p in log_prefixes]
+    if sampled_softmax:
+        log_q = unigram_log_q(data.tokens, models[0].fc2.out_features).to(device)
+
+        def loss_fn(j, xb, yb):
+            hidden = step_models[j](xb, return_hidden=True)
+            with record_function("loss"):
+                return sampled_softmax_cross_entropy(hidden, models[j].fc2.weight,
+                                                     models[j].fc2.bias, yb, log_q,
+                                                     sampled_softmax)
+    else:
+        def loss_fn(j, xb, yb):
+            logits = step_models[j](xb)
+            with record_function("loss"):
+                return criterion(logits, yb)
+    amp = check_amp(device, amp)
+    scaler = grad_scaler(device, amp)
+    step_models = models
+    if compile:
+        example = torch.zeros(batch_size, data.context_len, dtype=torch.long, device=device)
+        step_models = [compile_model(m, example, device=device, amp=amp) for m in models]
+
+    train_idx, val_idx = split if split is not None else split_windows(data)
+
+    k = len(models)
+    best = [BestState(m) for m in models]
+    stats = [{"val_loss": float("inf"), "epochs": 0, "best_epoch": 0, "elapsed": 0.0,
+              "step_ms": 0.0} for _ in models]
+    bad_epochs = [0] * k
+    active = list(range(k))
 
     for epoch in range(epochs):
-        model.train()
-        total_loss = 0.0
-        n_train_batches = math.ceil(len(X_train) / batch_size)
+        for j in active:
+            models[j].train()
+        total_loss = torch.zeros(len(active), device=device)
+        n_train_batches = math.ceil(len(train_idx) / batch_size)
 
         # Shuffle training data each epoch
-        perm = torch.randperm(len(X_train))
-        X_train = X_train[perm]
-        Y_train = Y_train[perm]
+        train_idx = train_idx[torch.randperm(len(train_idx))]
 
+        t_train = time.perf_counter()
+        telemetry.restart_clock()
         for i in range(n_train_batches):
-            start = i * batch_size
-            end = min(start + batch_size, len(X_train))
-            xb = X_train[start:end].to(device)
-            yb = Y_train[start:end].to(device)
-
-            logits = model(xb)
-            loss = criterion(logits, yb)
-
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-
-        # Validation
-        model.eval()
-        val_loss = 0.0
-        n_val_batches = math.ceil(len(X_val) / batch_size)
-        correct = 0
-        top5_correct = 0
-        total_val = 0
-
-        with torch.no_grad():
-            for i in range(n_val_batches):
-                start = i * batch_size
-                end = min(start + batch_size, len(X_val))
-                xb = X_val[start:end].to(device)
-                yb = Y_val[start:end].to(device)
-
-                logits = model(xb)
-                val_loss += criterion(logits, yb).item()
-
-                preds = logits.argmax(dim=-1)
-                correct += (preds == yb).sum().item()
-
-                top5 = logits.topk(5, dim=-1).indices
-                top5_correct += (top5 == yb.unsqueeze(-1)).any(dim=-1).sum().item()
-                total_val += len(yb)
-
-        avg_train = total_loss / n_train_batches
-        avg_val = val_loss / n_val_batches
-        acc = correct / total_val * 100
-        top5_acc = top5_correct / total_val * 100
-
-        if avg_val < best_val_loss:
-            best_val_loss = avg_val
-
-        print(
-            f"  Epoch {epoch + 1}/{epochs}: "
-            f"train_loss={avg_train:.4f}  val_loss={avg_val:.4f}  "
-            f"top1_acc={acc:.1f}%  top5_acc={top5_acc:.1f}%"
-        )
+            with telemetry.phase("fetch"):
+                xb, yb = data.batch(train_idx[i * batch_size : (i + 1) * batch_size].numpy())
+                xb, yb = xb.to(device), yb.to(device)
+
+            with telemetry.phase("forward"), autocast(device, amp):
+                losses = torch.stack([loss_fn(j, xb, yb) for j in active])
+
+            # Stopped models get no gradient, and Adam skips params whose grad is None.
+            with telemetry.phase("backward"), record_function("backward"):
+                optimizer.zero_grad()
+                scaler.scale(losses.sum()).backward()
+            norm = None
+            if telemetry.sampled:
+                norm = grad_norm(p for j in active for p in models[j].parameters())
+                if scaler.is_enabled():  # fp16 grads are still scaled (get_scale syncs)
+                    norm = norm / scaler.get_scale()
+            lr_used = optimizer.param_groups[0]["lr"]
+            with telemetry.phase("optimizer"), record_function("optimizer"):
+                scaler.step(optimizer)
+                scaler.update()
+            total_loss += losses.detach()
+            telemetry.end_step(step=epoch * n_train_batches + i + 1, tokens=len(yb),
+                               samples=len(yb), lr=lr_used, grad_norm=norm,
+                               loss=losses.detach(), epoch=epoch + 1,
+                               models=[names[j] for j in active])
+            profiler.step()
+        step_ms = (time.perf_counter() - t_train) / n_train_batches * 1e3
+        telemetry.flush()
+
+        # Validation: metrics accumulate on-device, one host sync per epoch
+        val_batches = (data.batch(val_idx[i : i + eval_batch_size].numpy())
+                       for i in range(0, len(val_idx), eval_batch_size))
+        metrics = dict(zip(active, evaluate([models[j] for j in active], val_batches,
+                                            device=device)))
+
+        for j, avg_train in zip(list(active), (total_loss / n_train_batches).tolist()):
+            avg_val, acc, top5_acc = (metrics[j][m] for m in ("loss", "top1", "top5"))
+            st = stats[j]
+            st["epochs"] = epoch + 1
+            st["elapsed"] = time.time() - t0
+            st["step_ms"] += (step_ms - st["step_ms"]) / st["epochs"]  # running mean
+
+            if avg_val < st["val_loss"]:
+                bad_epochs[j] = 0 if avg_val < st["val_loss"] - min_delta else bad_epochs[j] + 1
+                st["val_loss"], st["best_epoch"] = avg_val, epoch + 1
+                best[j].save(models[j], optimizer)
+            else:
+                bad_epochs[j] += 1
+
+            print(
+                f"  {log_prefixes[j]}Epoch {epoch + 1}/{epochs}: "
+                f"train_loss={avg_train:.4f}  val_loss={avg_val:.4f}  "
+                f"top1_acc={acc:.1f}%  top5_acc={top5_acc:.1f}%"
+            )
+            if patience is not None and bad_epochs[j] >= patience and epoch + 1 < epochs:
+                print(f"  {log_prefixes[j]}Early stop: no val improvement > {min_delta} "
+                      f"in {patience} epochs (best epoch {st['best_epoch']})")
+                active.remove(j)
+
+        if not active:
+            break
 
-    return best_val_loss
+    for j, m in enumerate(models):
+        best[j].restore(m, optimizer)
+    return stats
 
 
 # ---------------------------------------------------------------------------
@@ -275,14 +387,7 @@ def export_model_binary(model: NextWordModel, tok: Tokenizer, output_dir: Path,
 
     # Save weights as a single binary file (float32)
     bin_path = output_dir / f"{name}.weights.bin"
-    with open(bin_path, "wb") as f:
-        for key in ["embedding.weight", "fc1.weight", "fc1.bias", "fc2.weight", "fc2.bias"]:
-            arr = state[key].cpu().numpy().astype(np.float32)
-            # Write shape: ndims (uint32), then each dim (uint32)
-            f.write(struct.pack("<I", len(arr.shape)))
-            for d in arr.shape:
-                f.write(struct.pack("<I", d))
-            f.write(arr.tobytes())
+    write_weights(bin_path, state)
 
     total_size = config_path.stat().st_size + bin_path.stat().st_size
     print(f"  JSON: {config_path.stat().st_size / 1024:.0f} KB")
@@ -292,85 +397,267 @@ def export_model_binary(model: NextWordModel, tok: Tokenizer, output_dir: Path,
     return config_path, bin_path
 
 
+# ---------------------------------------------------------------------------
+# Sweep
+# ---------------------------------------------------------------------------
+CONFIGS = [
+    # (context_len, embed_dim, hidden_dim, name)
+    (2, 32, 128, "ctx2_e32_h128"),
+    (2, 64, 128, "ctx2_e64_h128"),
+    (2, 64, 256, "ctx2_e64_h256"),
+    (3, 32, 128, "ctx3_e32_h128"),
+    (3, 64, 128, "ctx3_e64_h128"),
+    (3, 64, 256, "ctx3_e64_h256"),
+    (3, 128, 256, "ctx3_e128_h256"),
+]
+
+
+def run_configs(store_path: Path, vocab_size: int, configs: list[tuple], device: str,
+                log_prefix: str = "", train_opts: dict | None = None) -> list[dict]:
+    """Train a group of same-context configs together (see train_models).
+
+    `train_opts` are extra train_models keyword arguments (e.g. patience).
+    Returns each config's metrics and (CPU) weights.
+    """
+    context_len = configs[0][0]
+    # Each group (or worker process) maps the same read-only token file.
+    data = ContextWindows(open_store(store_path), context_len)
+    models = [NextWordModel(vocab_size, e, context_len, h) for _, e, h, _ in configs]
+    for (_, embed_dim, hidden_dim, name), model in zip(configs, models):
+        n_params = sum(p.numel() for p in model.parameters())
+        print(f"{log_prefix}Config: {name} (context={context_len}, embed={embed_dim}, "
+              f"hidden={hidden_dim}), {n_params:,} params, {len(data):,} samples")
+
+    prefixes = [f"{log_prefix}[{c[3]}] " if len(configs) > 1 else log_prefix for c in configs]
+    stats = train_models(models, data, epochs=5, batch_size=1024, device=device,
+                         log_prefixes=prefixes, **(train_opts or {}))
+    return [{
+        "name": name,
+        "context_len": context_len,
+        "embed_dim": embed_dim,
+        "hidden_dim": hidden_dim,
+        "n_params": sum(p.numel() for p in model.parameters()),
+        **st,
+        "state_dict": {k: v.cpu() for k, v in model.state_dict().items()},
+    } for (_, embed_dim, hidden_dim, name), model, st in zip(configs, models, stats)]
+
+
+def _init_sweep_worker(threads: int) -> None:
+    torch.set_num_threads(threads)
+
+
+def run_sweep(store: TokenStore, vocab_size: int, configs: list[tuple], *,
+              device: str, jobs: int, grouped: bool = False,
+              train_opts: dict | None = None) -> Iterator[dict]:
+    """Yield per-config results in completion order, `jobs` tasks at a time.
+
+    A task is one config, or with `grouped` every config sharing a context
+    length (trained in one pass by train_models). Workers split the machine's
+    cores evenly (torch.set_num_threads) so the tiny models don't fight over
+    a shared intra-op thread pool.
+    """
+    if grouped:
+        by_ctx: dict[int, list[tuple]] = {}
+        for config in configs:
+            by_ctx.setdefault(config[0], []).append(config)
+        tasks = list(by_ctx.values())
+    else:
+        tasks = [[config] for config in configs]
+
+    if jobs <= 1:
+        for task in tasks:
+            print(f"\n{'='*60}")
+            yield from run_configs(store.path, vocab_size, task, device, train_opts=train_opts)
+        return
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    print(f"Running {len(tasks)} tasks on {jobs} processes x {threads} threads")
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_sweep_worker,
+                             initargs=(threads,)) as pool:
+        futures = [pool.submit(run_configs, store.path, vocab_size, task, "cpu",
+                               f"[{task[0][3]}] " if len(task) == 1 else f"[ctx{task[0][0]}]",
+                               train_opts)
+                   for task in tasks]
+        for fut in as_completed(futures):
+            yield from fut.result()
+
+
+# A wider grid for --halving: successive halving spends most of its budget on
+# the survivors, so it can afford to look at many more configs.
+SEARCH_CONFIGS = [
+    (ctx, e, h, f"ctx{ctx}_e{e}_h{h}")
+    for ctx in (2, 3) for e in (32, 64, 128) for h in (128, 256, 512)
+]
+
+
+def run_halving(store: TokenStore, vocab_size: int, configs: list[tuple], *, device: str,
+                epochs: int = 5, eta: int = 2,
+                train_opts: dict | None = None) -> Iterator[dict]:
+    """Successive-halving sweep, one context length at a time, budget in epochs.
+
+    Promoted configs resume from their model + Adam state on the same
+    train/val split. Yields a result for every config; ones eliminated before
+    the final rung have `state_dict=None` and must not be picked as winners.
+    """
+    by_ctx: dict[int, list[tuple]] = {}
+    for config in configs:
+        by_ctx.setdefault(config[0], []).append(config)
+
+    for context_len, group in by_ctx.items():
+        data = ContextWindows(store, context_len)
+        split = split_windows(data)
+        epochs_used: dict[str, int] = {}
+        step_ms: dict[str, float] = {}
+
+        def train_fn(config, state, budget):
+            _, embed_dim, hidden_dim, name = config
+            if state is None:
+                model = NextWordModel(vocab_size, embed_dim, context_len, hidden_dim)
+                optimizer = torch.optim.Adam(model.parameters(), lr=0.001, foreach=True)
+                state = (model, optimizer, 0)
+            model, optimizer, done = state
+            stats = train_models([model], data, epochs=budget - done, batch_size=1024,
+                                 device=device, log_prefixes=[f"[{name}] "], split=split,
+                                 optimizer=optimizer, **(train_opts or {}))[0]
+            epochs_used[name] = epochs_used.get(name, 0) + stats["epochs"]
+            step_ms[name] = stats["step_ms"]
+            return stats["val_loss"], (model, optimizer, budget)
+
+        print(f"\n{'='*60}")
+        print(f"Successive halving: {len(group)} context-{context_len} configs, "
+              f"{len(data):,} samples")
+        for trial in successive_halving(group, train_fn, min_budget=1, max_budget=epochs,
+                                        eta=eta, label=lambda c: c[3]):
+            _, embed_dim, hidden_dim, name = trial.candidate
+            model = trial.state[0] if trial.state is not None else None
+            yield {
+                "name": f"{name}@{trial.budget}ep",
+                "context_len": context_len,
+                "embed_dim": embed_dim,
+                "hidden_dim": hidden_dim,
+                "n_params": count_params(vocab_size, embed_dim, context_len, hidden_dim),
+                "val_loss": trial.loss,
+                "epochs": epochs_used[name],
+                "elapsed": trial.elapsed,
+                "step_ms": step_ms[name],
+                "state_dict": ({k: v.cpu() for k, v in model.state_dict().items()}
+                               if trial.budget == epochs else None),
+            }
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-stories", type=int, default=50_000)
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Configs to train in parallel processes (CPU only; "
+                             "default: about one per 4 cores).")
+    parser.add_argument("--grouped", action="store_true",
+                        help="Train all configs of a context length together on shared batches.")
+    parser.add_argument("--halving", action="store_true",
+                        help="Successive-halving search over SEARCH_CONFIGS instead of "
+                             "fully training every entry of CONFIGS.")
+    parser.add_argument("--eta", type=int, default=2,
+                        help="With --halving: keep the best 1/eta of configs per rung.")
+    parser.add_argument("--patience", type=int, default=2,
+                        help="Stop a config after this many epochs without val improvement "
+                             "(0 disables early stopping).")
+    parser.add_argument("--min-delta", type=float, default=1e-3,
+                        help="Smallest val-loss drop that counts as an improvement.")
+    parser.add_argument("--sampled-softmax", type=int, default=0, metavar="N",
+                        help="Train with a sampled softmax over N negatives from the corpus "
+                             "unigram distribution (validation and export use the full softmax).")
+    add_accel_args(parser)
+    add_corpus_args(parser)
+    add_telemetry_args(parser)
+    add_profile_args(parser)
+    args = parser.parse_args()
+
     device = "mps" if torch.backends.mps.is_available() else "cpu"
     print(f"Using device: {device}")
+    if args.jobs is None:
+        args.jobs = 1 if device != "cpu" or args.profile_steps else \
+            min(len(CONFIGS), max(1, (os.cpu_count() or 1) // 4))
+    if args.profile_steps and args.jobs > 1:
+        parser.error("--profile-steps profiles a single process; use --jobs 1")
 
     tok = load_tokenizer()
     vocab_size = tok.get_vocab_size()
     print(f"Vocab size: {vocab_size}")
 
-    # Load and tokenize stories
-    stories = tokenize_stories(tok, num_stories=50_000)
-
-    # Try different configurations
-    configs = [
-        # (context_len, embed_dim, hidden_dim, name)
-        (2, 32, 128, "ctx2_e32_h128"),
-        (2, 64, 128, "ctx2_e64_h128"),
-        (2, 64, 256, "ctx2_e64_h256"),
-        (3, 32, 128, "ctx3_e32_h128"),
-        (3, 64, 128, "ctx3_e64_h128"),
-        (3, 64, 256, "ctx3_e64_h256"),
-        (3, 128, 256, "ctx3_e128_h256"),
-    ]
-
-    results = []
-
-    for context_len, embed_dim, hidden_dim, name in configs:
-        print(f"\n{'='*60}")
-        print(f"Config: {name} (context={context_len}, embed={embed_dim}, hidden={hidden_dim})")
-        print(f"{'='*60}")
-
-        X, Y = make_training_data(stories, context_len)
-        print(f"Training samples: {len(X):,}")
-
-        model = NextWordModel(vocab_size, embed_dim, context_len, hidden_dim)
-        n_params = sum(p.numel() for p in model.parameters())
-        print(f"Parameters: {n_params:,}")
-
-        t0 = time.time()
-        val_loss = train_model(model, X, Y, epochs=5, batch_size=1024, device=device)
-        elapsed = time.time() - t0
-        print(f"Training time: {elapsed:.1f}s")
-
-        results.append((name, context_len, embed_dim, hidden_dim, n_params, val_loss, model))
+    # Load (or tokenize and cache) stories; every config shares this token array
+    store = load_token_store(TOKENIZER_PATH, args.num_stories, corpus=args.corpus,
+                             workers=args.workers, rebuild=args.rebuild_cache)
+
+    # Configs train concurrently; each result streams back as soon as it is
+    # done, and only the current best model per context length is kept.
+    train_opts = {"patience": args.patience or None, "min_delta": args.min_delta,
+                  "amp": args.amp, "compile": args.compile,
+                  "sampled_softmax": args.sampled_softmax,
+                  "telemetry": telemetry_from_args(args, device, run={"trainer": "next-word"}),
+                  "profiler": StepProfiler(args.profile_steps, PROFILE_DIR, "next-word-train",
+                                           device=device)}
+    if args.halving:
+        configs = SEARCH_CONFIGS
+        results = run_halving(store, vocab_size, configs, device=device, eta=args.eta,
+                              train_opts=train_opts)
+    else:
+        configs = CONFIGS
+        results = run_sweep(store, vocab_size, configs, device=device, jobs=args.jobs,
+                            grouped=args.grouped, train_opts=train_opts)
+    remaining = {ctx: sum(c[0] == ctx for c in configs) for ctx, *_ in configs}
+    best: dict[int, tuple[dict, NextWordModel]] = {}
+    summary = []
+    t_sweep = time.time()
+
+    for res in results:
+        ctx_len = res["context_len"]
+        state = res.pop("state_dict")
+        summary.append((res["name"], res["n_params"], res["val_loss"], res["epochs"],
+                        res["elapsed"]))
+        print(f"Finished {res['name']}: val_loss={res['val_loss']:.4f} "
+              f"({res['epochs']} epochs, {res['elapsed']:.1f}s, "
+              f"{res['step_ms']:.1f} ms/step)")
+        if state is not None and (
+            ctx_len not in best or res["val_loss"] < best[ctx_len][0]["val_loss"]
+        ):
+            model = NextWordModel(vocab_size, res["embed_dim"], ctx_len, res["hidden_dim"])
+            model.load_state_dict(state)
+            best[ctx_len] = (res, model)
+
+        # Every config for this context length is in, so its winner is final.
+        remaining[ctx_len] -= 1
+        if remaining[ctx_len] == 0:
+            win, model = best[ctx_len]
+            print(f"\nBest context-{ctx_len} model: {win['name']} "
+                  f"(loss={win['val_loss']:.4f}, params={win['n_params']:,})")
+            export_model_binary(model, tok, OUTPUT_DIR, f"next-word-ctx{ctx_len}")
 
     # Summary
     print(f"\n{'='*60}")
     print("RESULTS SUMMARY")
     print(f"{'='*60}")
-    print(f"{'Name':<20} {'Params':>10} {'Val Loss':>10}")
-    print("-" * 42)
-    for name, ctx, emb, hid, params, loss, _ in results:
-        print(f"{name:<20} {params:>10,} {loss:>10.4f}")
-
-    # Export the best model for each context length
-    for ctx_len in [2, 3]:
-        ctx_results = [(n, c, e, h, p, l, m) for n, c, e, h, p, l, m in results if c == ctx_len]
-        if not ctx_results:
-            continue
-        best = min(ctx_results, key=lambda x: x[5])
-        name, _, _, _, params, loss, model = best
-        print(f"\nBest context-{ctx_len} model: {name} (loss={loss:.4f}, params={params:,})")
-
-        export_model_binary(model, tok, OUTPUT_DIR, f"next-word-ctx{ctx_len}")
+    print(f"{'Name':<20} {'Params':>10} {'Val Loss':>10} {'Epochs':>7} {'Time':>8}")
+    print("-" * 59)
+    for name, params, loss, epochs, elapsed in summary:
+        print(f"{name:<20} {params:>10,} {loss:>10.4f} {epochs:>7} {elapsed:>7.1f}s")
+    print(f"Sweep wall time: {time.time() - t_sweep:.1f}s (jobs={args.jobs})")
+    train_opts["telemetry"].close()
+    train_opts["profiler"].close()
 
     # Also export the overall best
-    best_overall = min(results, key=lambda x: x[5])
-    name, ctx, emb, hid, params, loss, model = best_overall
-    print(f"\nOverall best: {name} (loss={loss:.4f}, params={params:,})")
+    best_res, model = min(best.values(), key=lambda b: b[0]["val_loss"])
+    print(f"\nOverall best: {best_res['name']} "
+          f"(loss={best_res['val_loss']:.4f}, params={best_res['n_params']:,})")
     export_model_binary(model, tok, OUTPUT_DIR, "next-word-best")
 
     # Quick demo of the best model
     print(f"\n{'='*60}")
     print("DEMO: Top-5 predictions")
     print(f"{'='*60}")
-    model = best_overall[6]
     model.eval()
+    ctx_len = best_res["context_len"]
 
     demo_phrases = [
         "once upon",
@@ -385,8 +672,8 @@ def main():
 
     for phrase in demo_phrases:
         encoded = tok.encode(phrase)
-        ids = encoded.ids[-best_overall[1]:]  # last context_len tokens
-        if len(ids) < best_overall[1]:
+        ids = encoded.ids[-ctx_len:]  # last context_len tokens
+        if len(ids) < ctx_len:
             continue
 
         x = torch.tensor([ids], dtype=torch.long)
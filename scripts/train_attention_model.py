@@ -8,6 +8,8 @@ JSON-config + binary-weights format the JS engine loads.
 Usage:
     uv run scripts/train_attention_model.py --smoke   # quick sanity run
     uv run scripts/train_attention_model.py            # full training
+    uv run scripts/train_attention_model.py --nproc 8  # 8 data-parallel CPU workers
+    uv run scripts/train_attention_model.py --scaling 1,2,4,8  # tokens/s vs. workers
 """
 # /// script
 # requires-python = ">=3.11"
@@ -20,198 +22,698 @@ Usage:
 # ///
 
 import argparse
+import contextlib
 import json
-import struct
+import math
+import os
 import sys
+import time
 from pathlib import Path
+from typing import Iterator
 
 import numpy as np
 import torch
 import torch.nn.functional as F
-from datasets import load_dataset
 from tokenizers import Tokenizer
+from torch.profiler import record_function
 
 # Shared model definition lives in _attention_model.py so test scripts can
 # import it without pulling in datasets/tokenizers.
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from _attention_model import CONFIG, TinyTransformer  # noqa: E402
+from _attention_model import ATTENTION_BACKENDS, CONFIG, TinyTransformer  # noqa: E402
+from _accel import (  # noqa: E402
+    add_accel_args, autocast, check_amp, compile_model, grad_scaler, peak_memory_mb,
+)
+from _checkpoint import AsyncCheckpointer, capture_rng, load_checkpoint, restore_rng  # noqa: E402
+from _corpus import add_corpus_args  # noqa: E402
+from _distributed import launch, world  # noqa: E402
+from _evaluate import evaluate  # noqa: E402
+from _losses import chunked_cross_entropy, sampled_softmax_cross_entropy, unigram_log_q  # noqa: E402
+from _profiling import PROFILE_DIR, StepProfiler, add_profile_args  # noqa: E402
+from _sweep import successive_halving  # noqa: E402
+from _telemetry import Telemetry, add_telemetry_args  # noqa: E402
+from _telemetry import from_args as telemetry_from_args  # noqa: E402
+from _token_store import block_batches, load_token_store, prefetch  # noqa: E402
+from _weights import write_weights  # noqa: E402
 
 ROOT = Path(__file__).resolve().parent.parent
 TOKENIZER_PATH = ROOT / "public" / "data" / "tokenizer" / "ts-tokenizer-4096.json"
 OUTPUT_DIR = ROOT / "public" / "data" / "attention-model"
+# Resumable state (weights + optimizer + RNG, ~3x the export) is not for the site.
+TRAIN_STATE_PATH = ROOT / "data" / "attention-model" / "train-state.pt"
 
 
-def load_data(tokenizer: Tokenizer, num_stories: int, ctx: int) -> torch.Tensor:
-    print(f"Loading TinyStories ({num_stories:,} stories)...")
-    ds = load_dataset("roneneldan/TinyStories", split="train", streaming=True)
-    all_ids: list[int] = []
-    bos = tokenizer.token_to_id("[BOS]") or 1
-    eos = tokenizer.token_to_id("[EOS]") or 2
-    for i, row in enumerate(ds):
-        if i >= num_stories:
-            break
-        ids = tokenizer.encode(row["text"]).ids
-        all_ids.extend([bos, *ids, eos])
-    flat = torch.tensor(all_ids, dtype=torch.long)
-    n_blocks = (flat.numel() - 1) // ctx
+def load_data(num_stories: int, ctx: int, *, corpus: str | None = None,
+              workers: int = 1, rebuild_cache: bool = False) -> np.ndarray:
+    """Flat uint16 token stream ([BOS] story [EOS] ...), memory-mapped from the cache."""
+    store = load_token_store(TOKENIZER_PATH, num_stories, corpus=corpus, workers=workers,
+                             rebuild=rebuild_cache)
+    flat = store.tokens
+    n_blocks = (len(flat) - 1) // ctx
     flat = flat[: n_blocks * ctx + 1]
-    print(f"  → {flat.numel():,} tokens, {n_blocks:,} training blocks")
+    print(f"  → {len(flat):,} tokens, {n_blocks:,} training blocks")
     return flat
 
 
-def train(model: TinyTransformer, data: torch.Tensor, *, epochs: int, batch_size: int,
-          lr: float, device: str, log_every: int = 100) -> None:
+WARMUP_STEPS = 3
+DEFAULT_CURRICULUM = "16:0.25,32:0.25"
+
+
+def parse_curriculum(spec: str) -> list[tuple[int, float]]:
+    """"16:0.25,32:0.25" -> [(16, 0.25), (32, 0.25)]: the first quarter of the
+    steps trains on 16-token sequences, the next quarter on 32, and the rest
+    on full blocks."""
+    stages = [(int(length), float(frac)) for length, frac in
+              (stage.split(":") for stage in spec.split(","))]
+    if sum(frac for _, frac in stages) > 1:
+        raise argparse.ArgumentTypeError(f"curriculum fractions exceed 1: {spec}")
+    return stages
+
+
+def curriculum_seq_len(step: int, n_steps: int, ctx: int,
+                       curriculum: list[tuple[int, float]] | None) -> int:
+    """Training sequence length for optimizer step `step` (0-based)."""
+    edge = 0.0
+    for seq_len, frac in curriculum or ():
+        edge += frac
+        if step < edge * n_steps:
+            return seq_len
+    return ctx
+
+
+def split_blocks(n_blocks: int, val_frac: float = 0.05, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Fixed random train/val split of block indices."""
+    perm = np.random.default_rng(seed).permutation(n_blocks)
+    n_val = max(1, int(n_blocks * val_frac))
+    return np.sort(perm[n_val:]), np.sort(perm[:n_val])
+
+
+def train(model: TinyTransformer, data: np.ndarray, *, epochs: int, batch_size: int,
+          lr: float, device: str, log_every: int = 100, blocks: np.ndarray | None = None,
+          max_steps: int | None = None, val_blocks: np.ndarray | None = None,
+          eval_every: int = 0, amp: str | None = None, compile: bool = False,
+          checkpoint_path: Path | None = None, checkpoint_every: int = 0,
+          resume: dict | None = None, grad_accum_steps: int = 1,
+          chunked_loss: int = 0, sampled_softmax: int = 0,
+          curriculum: list[tuple[int, float]] | None = None,
+          telemetry: Telemetry | None = None, profiler: StepProfiler | None = None) -> dict:
+    """Train on `blocks` (default: every block), for `epochs` or `max_steps`.
+
+    The cosine schedule always spans the steps that will actually run, so a
+    truncated (max_steps) run still anneals fully. With `val_blocks`, held-out
+    metrics are printed every `eval_every` steps (0 = only at the end).
+    `amp` / `compile` select mixed precision and torch.compile (see _accel);
+    the parameters themselves stay fp32 either way. Mean step time is
+    reported at the end so modes can be compared.
+
+    With `checkpoint_path`, the full training state is saved every
+    `checkpoint_every` steps and at the end (see _checkpoint). Passing a
+    loaded state as `resume` continues that run exactly where it stopped:
+    the same remaining batches in the same order, and bit-identical weights
+    to an uninterrupted run. The other arguments must match the original run.
+
+    Under a process group (see _distributed), the model is wrapped in DDP and
+    every rank takes a disjoint `batch_size` slice of each step's global
+    batch, so the effective batch is batch_size * world_size. Only rank 0
+    evaluates and checkpoints.
+
+    With grad_accum_steps > 1, each optimizer step averages the gradients of
+    that many micro-batches of `batch_size`, so the effective batch grows
+    without the activation memory; steps, schedule and clipping count
+    optimizer steps. With chunked_loss > 0 the output projection and
+    cross-entropy are fused and run that many tokens at a time (see
+    _losses), so the full (tokens, vocab) logits are never materialised.
+    With sampled_softmax > 0 each position is instead scored against that
+    many negatives from the corpus unigram proposal; held-out evaluation
+    still uses the full softmax.
+
+    With a `curriculum` (see parse_curriculum), early steps cut each block
+    into ctx / seq_len shorter rows. Every step still covers the same
+    tokens, so the data order, the step count and the cosine schedule are
+    unchanged; only the attention span (and its cost) is smaller.
+    Evaluation always uses full blocks.
+
+    `telemetry` (see _telemetry) records sampled per-step timings and
+    throughput for the global batch; `profiler` (see _profiling) captures
+    a window of steps with torch.profiler.
+
+    Returns {"step_ms", "tokens_per_s", "peak_mem_mb", "history"}. history
+    has one {"step", "train_s", "val_loss"} entry per evaluation, where
+    train_s is the cumulative time spent in training steps.
+    """
     model.to(device)
     model.train()
     ctx = model.cfg["context_len"]
-    n_blocks = (data.numel() - 1) // ctx
+    amp = check_amp(device, amp)
+    scaler = grad_scaler(device, amp)
+    rank, world_size = world()
+    step_model, ddp = model, None
+    if world_size > 1:
+        step_model = ddp = torch.nn.parallel.DistributedDataParallel(model)
+    eager_model = step_model
+    if compile:
+        example = torch.zeros(batch_size, ctx, dtype=torch.long, device=device)
+        step_model = compile_model(step_model, example, device=device, amp=amp)
+    if blocks is None:
+        blocks = np.arange((len(data) - 1) // ctx)
+    assert not (chunked_loss and sampled_softmax), "pick one of chunked_loss / sampled_softmax"
+    assert all(ctx % seq_len == 0 for seq_len, _ in curriculum or ()), \
+        f"curriculum lengths must divide context_len {ctx}"
+    if sampled_softmax:
+        log_q = unigram_log_q(data, model.cfg["vocab_size"]).to(device)
+    telemetry = telemetry or Telemetry(None)
+    profiler = profiler or StepProfiler(None, OUTPUT_DIR, "")
+    n_blocks = len(blocks)
     opt = torch.optim.AdamW(model.parameters(), lr=lr, betas=(0.9, 0.95), weight_decay=0.1)
-    n_steps = epochs * (n_blocks // batch_size)
+    accum = grad_accum_steps
+    steps_per_epoch = n_blocks // (batch_size * world_size * accum)
+    n_steps = epochs * steps_per_epoch
+    if max_steps is not None:
+        n_steps = min(n_steps, max_steps)
     sched = torch.optim.lr_scheduler.CosineAnnealingLR(opt, T_max=n_steps, eta_min=lr * 0.1)
+    run = {"cfg": model.cfg, "epochs": epochs, "batch_size": batch_size, "lr": lr,
+           "n_blocks": n_blocks, "n_steps": n_steps, "world_size": world_size,
+           "grad_accum_steps": accum}
+    if curriculum:
+        run["curriculum"] = curriculum
 
-    step = 0
-    for ep in range(epochs):
-        # Shuffle block start positions
-        starts = torch.randperm(n_blocks)[: (n_blocks // batch_size) * batch_size]
-        starts = starts.view(-1, batch_size)
-        for batch_starts in starts:
-            xs = torch.stack([data[s * ctx : s * ctx + ctx] for s in batch_starts]).to(device)
-            ys = torch.stack([data[s * ctx + 1 : s * ctx + ctx + 1] for s in batch_starts]).to(device)
-            logits = model(xs)
-            loss = F.cross_entropy(logits.view(-1, model.cfg["vocab_size"]), ys.reshape(-1))
-            opt.zero_grad()
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            opt.step()
-            sched.step()
+    step, start_epoch = 0, 0
+    opt.zero_grad()
+    if resume is not None:
+        assert resume["run"] == run, f"resume: run settings differ: {resume['run']} vs {run}"
+        model.load_state_dict(resume["model"])
+        opt.load_state_dict(resume["optimizer"])
+        sched.load_state_dict(resume["scheduler"])
+        scaler.load_state_dict(resume["scaler"])
+        step, start_epoch = resume["step"], resume["epoch"]
+        print(f"Resumed at epoch {start_epoch} step {step}/{n_steps}")
+    checkpointer = AsyncCheckpointer(checkpoint_path) if checkpoint_path and rank == 0 else None
+
+    def save_checkpoint(ep: int, epoch_rng: torch.Tensor) -> None:
+        checkpointer.save({
+            "run": run, "step": step, "epoch": ep, "epoch_rng": epoch_rng, "rng": capture_rng(),
+            "model": model.state_dict(), "optimizer": opt.state_dict(),
+            "scheduler": sched.state_dict(), "scaler": scaler.state_dict(),
+        })
+
+    step_time, timed_steps = 0.0, 0
+    train_s, history = 0.0, []
+    telemetry.restart_clock()
+    for ep in range(start_epoch, epochs):
+        if step >= n_steps:
+            break
+        # Shuffle block start positions. The RNG state that drew this epoch's
+        # order is checkpointed, so a resumed run can redraw it and skip the
+        # batches already done. Every rank draws the same order (same seed)
+        # and keeps its own slice of each step's micro-batches.
+        resuming = resume is not None and ep == start_epoch
+        if resuming:
+            torch.set_rng_state(resume["epoch_rng"])
+        epoch_rng = torch.get_rng_state()
+        per_step = steps_per_epoch * world_size * accum * batch_size
+        starts = blocks[torch.randperm(n_blocks)[:per_step].numpy()]
+        starts = starts.reshape(-1, accum, world_size, batch_size)[
+            : n_steps - ep * steps_per_epoch, :, rank]
+        if resuming:
+            starts = starts[step - ep * steps_per_epoch :]
+            restore_rng(resume["rng"])
+        # Batches are gathered on a background thread while the model trains.
+        micro = 0
+        for batch in telemetry.iter(prefetch(block_batches(data, starts.reshape(-1, batch_size),
+                                                           ctx), pin_memory=device == "cuda")):
+            if micro == 0:
+                t0 = time.perf_counter()
+                loss = 0.0
+            batch = batch.to(device, non_blocking=True)
+            xs, ys = batch[:, :-1], batch[:, 1:]
+            seq_len = curriculum_seq_len(step, n_steps, ctx, curriculum)
+            if seq_len < ctx:
+                xs, ys = xs.reshape(-1, seq_len), ys.reshape(-1, seq_len)
+            micro += 1
+            # DDP all-reduces gradients only on the step's last micro-batch.
+            sync = micro == accum
+            with contextlib.nullcontext() if sync or ddp is None else ddp.no_sync():
+                with telemetry.phase("forward"), autocast(device, amp):
+                    out = step_model(xs, return_hidden=bool(chunked_loss or sampled_softmax))
+                    with record_function("loss"):
+                        if chunked_loss:
+                            micro_loss = chunked_cross_entropy(
+                                out, model.output.weight, model.output.bias, ys,
+                                chunk_size=chunked_loss) / accum
+                        elif sampled_softmax:
+                            micro_loss = sampled_softmax_cross_entropy(
+                                out, model.output.weight, model.output.bias, ys, log_q,
+                                sampled_softmax) / accum
+                        else:
+                            micro_loss = F.cross_entropy(out.view(-1, model.cfg["vocab_size"]),
+                                                         ys.reshape(-1)) / accum
+                with telemetry.phase("backward"), record_function("backward"):
+                    scaler.scale(micro_loss).backward()
+            loss = loss + micro_loss.detach()
+            if not sync:
+                continue
+            micro = 0
+            lr_used = opt.param_groups[0]["lr"]
+            with telemetry.phase("optimizer"), record_function("optimizer"):
+                scaler.unscale_(opt)
+                norm = torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                scaler.step(opt)
+                scaler.update()
+                opt.zero_grad()
+                sched.step()
             step += 1
+            rows = batch_size * world_size * accum
+            telemetry.end_step(step=step, tokens=rows * ctx, samples=rows, lr=lr_used,
+                               grad_norm=norm, loss=loss, seq_len=seq_len)
+            profiler.step()
+            elapsed = time.perf_counter() - t0
+            train_s += elapsed
+            if step > WARMUP_STEPS:  # skip compile / allocator warm-up
+                step_time += elapsed
+                timed_steps += 1
             if step == 1 or step % log_every == 0 or step == n_steps:
                 print(f"epoch {ep} step {step}/{n_steps}  loss={loss.item():.3f}")
+            if rank == 0 and val_blocks is not None and (
+                step == n_steps or (eval_every and step % eval_every == 0)
+            ):
+                m = evaluate(model, eval_batches(data, val_blocks, ctx), device=device)
+                print(f"  val  step {step}: loss={m['loss']:.3f}  ppl={m['ppl']:.1f}  "
+                      f"top1={m['top1']:.1f}%  top5={m['top5']:.1f}%")
+                history.append({"step": step, "train_s": train_s, "val_loss": m["loss"]})
+            if checkpointer and (step == n_steps or (checkpoint_every and step % checkpoint_every == 0)):
+                save_checkpoint(ep, epoch_rng)
+            telemetry.restart_clock()  # logging / eval / checkpointing are not step time
+    if checkpointer:
+        checkpointer.close()
+    telemetry.flush()
+    profiler.close()
+    peak = peak_memory_mb(device)
+    if not timed_steps:
+        return {"step_ms": math.nan, "tokens_per_s": math.nan, "peak_mem_mb": peak,
+                "history": history}
+    ms = step_time / timed_steps * 1e3
+    tokens_per_s = batch_size * world_size * accum * ctx / ms * 1e3
+    print(f"Step time: {ms:.1f} ms/step, {tokens_per_s:,.0f} tokens/s, peak memory {peak:,.0f} MB "
+          f"(amp={amp or 'off'}, compile={'on' if step_model is not eager_model else 'off'}, "
+          f"procs={world_size}, accum={accum}, "
+          f"act-ckpt={'on' if model.checkpoint_layers else 'off'}, "
+          f"chunked-loss={chunked_loss or 'off'}, sampled-softmax={sampled_softmax or 'off'}, "
+          f"curriculum={'on' if curriculum else 'off'})")
+    return {"step_ms": ms, "tokens_per_s": tokens_per_s, "peak_mem_mb": peak, "history": history}
 
 
-def write_tensor(f, t: torch.Tensor) -> None:
-    """Write a tensor in the JS engine's format: [ndims][dims...][float32 data]."""
-    arr = t.detach().cpu().contiguous().to(torch.float32).numpy()
-    f.write(struct.pack("<I", arr.ndim))
-    for d in arr.shape:
-        f.write(struct.pack("<I", d))
-    f.write(arr.tobytes(order="C"))
+def eval_batches(data: np.ndarray, blocks: np.ndarray, ctx: int,
+                 batch_size: int = 256) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+    """(inputs, targets) batches over the given blocks, for evaluate()."""
+    for i in range(0, len(blocks), batch_size):
+        batch = next(block_batches(data, blocks[None, i : i + batch_size], ctx))
+        yield batch[:, :-1], batch[:, 1:]
 
 
-def export_weights(model: TinyTransformer, vocab: list[str], out_dir: Path) -> None:
-    """Write model.json + model.weights.bin in the format model-inference.ts loads."""
-    out_dir.mkdir(parents=True, exist_ok=True)
-    config_path = out_dir / "model.json"
-    bin_path = out_dir / "model.weights.bin"
+# CONFIG variants for --search. context_len and vocab_size stay fixed: the
+# widget and tokenizer depend on them.
+SEARCH_SPACE = {
+    "embed_dim": [128, 192, 256],
+    "num_heads": [4, 8],
+    "num_layers": [2, 4, 6],
+    "ff_dim_mult": [2, 4],
+}
 
-    with open(bin_path, "wb") as f:
-        write_tensor(f, model.token_emb.weight)
-        write_tensor(f, model.pos_emb.weight)
-        for layer in model.layers:
-            attn = layer["attn"]
-            ffn = layer["ffn"]
-            write_tensor(f, attn.ln1.weight)
-            write_tensor(f, attn.ln1.bias)
-            write_tensor(f, attn.qkv.weight)
-            write_tensor(f, attn.qkv.bias)
-            write_tensor(f, attn.out.weight)
-            write_tensor(f, attn.out.bias)
-            write_tensor(f, ffn.ln2.weight)
-            write_tensor(f, ffn.ln2.bias)
-            write_tensor(f, ffn.fc1.weight)
-            write_tensor(f, ffn.fc1.bias)
-            write_tensor(f, ffn.fc2.weight)
-            write_tensor(f, ffn.fc2.bias)
-        write_tensor(f, model.ln_final.weight)
-        write_tensor(f, model.ln_final.bias)
-        write_tensor(f, model.output.weight)
-        write_tensor(f, model.output.bias)
 
-    with open(config_path, "w") as f:
-        json.dump({"config": model.cfg, "vocab": vocab}, f)
-    print(f"Wrote {config_path} and {bin_path} ({bin_path.stat().st_size / 1e6:.1f} MB)")
+def search_configs(n: int, seed: int = 0) -> list[dict]:
+    """`n` distinct CONFIG variants drawn from SEARCH_SPACE (CONFIG itself first)."""
+    grid = [
+        {**CONFIG, "embed_dim": e, "num_heads": h, "num_layers": l, "ff_dim": e * m}
+        for e in SEARCH_SPACE["embed_dim"] for h in SEARCH_SPACE["num_heads"]
+        for l in SEARCH_SPACE["num_layers"] for m in SEARCH_SPACE["ff_dim_mult"]
+    ]
+    rng = np.random.default_rng(seed)
+    picked = [CONFIG] + [grid[i] for i in rng.permutation(len(grid)) if grid[i] != CONFIG]
+    return picked[:n]
 
 
-def write_tensor_int8(f, t: torch.Tensor) -> None:
-    """Write a tensor in int8 quantized format with per-tensor scale."""
-    arr = t.detach().cpu().contiguous().to(torch.float32).numpy()
-    f.write(struct.pack("<I", arr.ndim))
-    for d in arr.shape:
-        f.write(struct.pack("<I", d))
-    abs_max = float(np.abs(arr).max())
-    scale = abs_max / 127.0 if abs_max > 0 else 1.0
-    f.write(struct.pack("<f", scale))
-    # Clip to symmetric [-127, 127]; -128 has no positive counterpart and
-    # banker's rounding can occasionally emit it, which would overflow int8.
-    quantized = np.clip(np.round(arr / scale), -127, 127).astype(np.int8)
-    f.write(quantized.tobytes(order="C"))
+def search(data: np.ndarray, n_candidates: int, *, epochs: int, batch_size: int, lr: float,
+           device: str, eta: int = 3, amp: str | None = None,
+           compile: bool = False) -> TinyTransformer:
+    """Successive-halving search over CONFIG variants; budget is optimizer steps.
 
+    Each rung retrains from scratch with a cosine schedule sized to its budget,
+    so every candidate is compared on a fully annealed run. Returns the
+    winning model, trained on the full budget.
+    """
+    ctx = CONFIG["context_len"]
+    train_blocks, val_blocks = split_blocks((len(data) - 1) // ctx)
+    max_steps = epochs * (len(train_blocks) // batch_size)
+    n_rungs = max(0, math.floor(math.log(n_candidates, eta)))
+    min_steps = max(1, max_steps // eta**n_rungs)
 
-def export_weights_int8(model: TinyTransformer, vocab: list[str], out_dir: Path) -> None:
+    def train_fn(cfg, _state, budget):
+        torch.manual_seed(0)
+        model = TinyTransformer(cfg)
+        train(model, data, epochs=epochs, batch_size=batch_size, lr=lr, device=device,
+              log_every=10**9, blocks=train_blocks, max_steps=budget, amp=amp,
+              compile=compile)
+        return evaluate(model, eval_batches(data, val_blocks, ctx), device=device)["loss"], model
+
+    def label(cfg):
+        return (f"e{cfg['embed_dim']}_h{cfg['num_heads']}_l{cfg['num_layers']}"
+                f"_ff{cfg['ff_dim']}")
+
+    trials = successive_halving(search_configs(n_candidates), train_fn, min_budget=min_steps,
+                                max_budget=max_steps, eta=eta, label=label)
+    print("\nSearch results (best first):")
+    for t in trials:
+        print(f"  {label(t.candidate):<24} val_loss={t.loss:.4f}  steps={t.budget:<6} "
+              f"time={t.elapsed:.1f}s")
+    return trials[0].state
+
+
+def bench_data(data: np.ndarray, *, ctx: int, batch_size: int, device: str,
+               n_batches: int = 500) -> None:
+    """Data-path-only benchmark: how fast can batches be produced and moved to device?"""
+    n_blocks = (len(data) - 1) // ctx
+    starts = np.random.randint(0, n_blocks, size=(n_batches, batch_size))
+    flat = torch.from_numpy(data.astype(np.int64))
+    per_row = (torch.stack([flat[s * ctx : s * ctx + ctx + 1] for s in row]) for row in starts)
+    for label, batches in [
+        ("per-row", per_row),  # the old list-comprehension + torch.stack path
+        ("gather", block_batches(data, starts, ctx)),
+        ("prefetch", prefetch(block_batches(data, starts, ctx), pin_memory=device == "cuda")),
+    ]:
+        t0 = time.perf_counter()
+        for blocks in batches:
+            blocks.to(device, non_blocking=True)
+        if device == "cuda":
+            torch.cuda.synchronize()
+        dt = time.perf_counter() - t0
+        print(f"  {label:<9} {n_batches / dt:,.0f} batches/s  "
+              f"({n_batches * batch_size * ctx / dt / 1e6:.1f}M tokens/s)")
+
+
+def export_weights(model: TinyTransformer, vocab: list[str], out_dir: Path,
+                   quantization: str | None = None) -> None:
+    """Write model.json + model.weights.bin in the format model-inference.ts loads."""
     out_dir.mkdir(parents=True, exist_ok=True)
     config_path = out_dir / "model.json"
     bin_path = out_dir / "model.weights.bin"
-
-    with open(bin_path, "wb") as f:
-        write_tensor_int8(f, model.token_emb.weight)
-        write_tensor_int8(f, model.pos_emb.weight)
-        for layer in model.layers:
-            attn = layer["attn"]
-            ffn = layer["ffn"]
-            for tensor in [
-                attn.ln1.weight, attn.ln1.bias,
-                attn.qkv.weight, attn.qkv.bias,
-                attn.out.weight, attn.out.bias,
-                ffn.ln2.weight, ffn.ln2.bias,
-                ffn.fc1.weight, ffn.fc1.bias,
-                ffn.fc2.weight, ffn.fc2.bias,
-            ]:
-                write_tensor_int8(f, tensor)
-        write_tensor_int8(f, model.ln_final.weight)
-        write_tensor_int8(f, model.ln_final.bias)
-        write_tensor_int8(f, model.output.weight)
-        write_tensor_int8(f, model.output.bias)
-
-    config_with_quant = {**model.cfg, "quantization": "int8"}
+    write_weights(bin_path, model.state_dict(), quantization)
+    config = {**model.cfg, "quantization": quantization} if quantization else model.cfg
     with open(config_path, "w") as f:
-        json.dump({"config": config_with_quant, "vocab": vocab}, f)
-    print(f"Wrote int8 model: {bin_path.stat().st_size / 1e6:.1f} MB")
+        json.dump({"config": config, "vocab": vocab}, f)
+    print(f"Wrote {config_path} and {bin_path} ({bin_path.stat().st_size / 1e6:.1f} MB"
+          f"{', ' + quantization if quantization else ''})")
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--smoke", action="store_true", help="Tiny smoke run.")
-    parser.add_argument("--quantize", action="store_true", help="Export int8 quantized.")
-    args = parser.parse_args()
+def export_weights_int8(model: TinyTransformer, vocab: list[str], out_dir: Path) -> None:
+    export_weights(model, vocab, out_dir, quantization="int8")
 
-    device = "cuda" if torch.cuda.is_available() else (
-        "mps" if torch.backends.mps.is_available() else "cpu"
-    )
-    print(f"Using device: {device}")
 
-    tok = Tokenizer.from_file(str(TOKENIZER_PATH))
-    if args.smoke:
-        data = load_data(tok, num_stories=200, ctx=CONFIG["context_len"])
-        epochs, batch_size, lr, log_every = 1, 16, 3e-4, 10
-    else:
-        data = load_data(tok, num_stories=50_000, ctx=CONFIG["context_len"])
-        epochs, batch_size, lr, log_every = 3, 64, 3e-4, 100
+def run_settings(smoke: bool) -> dict:
+    if smoke:
+        return {"num_stories": 200, "epochs": 1, "batch_size": 16, "lr": 3e-4,
+                "log_every": 10, "eval_every": 10, "checkpoint_every": 10}
+    return {"num_stories": 50_000, "epochs": 3, "batch_size": 64, "lr": 3e-4,
+            "log_every": 100, "eval_every": 1000, "checkpoint_every": 1000}
+
 
-    model = TinyTransformer(CONFIG)
+def get_data(args: argparse.Namespace) -> np.ndarray:
+    return load_data(num_stories=run_settings(args.smoke)["num_stories"], ctx=CONFIG["context_len"],
+                     corpus=args.corpus, workers=args.workers, rebuild_cache=args.rebuild_cache)
+
+
+def train_run(args: argparse.Namespace, data: np.ndarray, device: str, *,
+              max_steps: int | None = None, outputs: bool = True,
+              validate: bool | None = None) -> tuple[TinyTransformer, dict]:
+    """Train CONFIG as the flags say. With outputs=False (benchmarks) there is no
+    checkpointing and, unless `validate`, no held-out evaluation."""
+    cfg = run_settings(args.smoke)
+    model = TinyTransformer(CONFIG, attn_backend=args.attn_backend)
+    model.set_activation_checkpointing(args.activation_checkpointing)
     n_params = sum(p.numel() for p in model.parameters())
     print(f"Model: {n_params:,} parameters")
 
-    train(model, data, epochs=epochs, batch_size=batch_size, lr=lr, device=device,
-          log_every=log_every)
+    train_blocks, val_blocks = split_blocks((len(data) - 1) // CONFIG["context_len"])
+    resume = load_checkpoint(TRAIN_STATE_PATH) if args.resume else None
+    # Every rank trains the same steps; rank 0 records the global throughput.
+    telemetry = telemetry_from_args(args, device, run={
+        "trainer": "attention", "batch_size": args.batch_size or cfg["batch_size"],
+        "grad_accum_steps": args.grad_accum_steps, "world_size": world()[1],
+    }) if world()[0] == 0 else None
+    profiler = StepProfiler(args.profile_steps if world()[0] == 0 else None, PROFILE_DIR,
+                            "attention-train", device=device)
+    stats = train(
+        model, data, epochs=cfg["epochs"], batch_size=args.batch_size or cfg["batch_size"],
+        lr=cfg["lr"], grad_accum_steps=args.grad_accum_steps, chunked_loss=args.chunked_loss,
+        sampled_softmax=args.sampled_softmax, curriculum=args.curriculum,
+        device=device, log_every=cfg["log_every"], blocks=train_blocks, max_steps=max_steps,
+        val_blocks=val_blocks if (outputs if validate is None else validate) else None,
+        eval_every=cfg["eval_every"] if args.eval_every is None else args.eval_every,
+        amp=args.amp, compile=args.compile,
+        checkpoint_path=TRAIN_STATE_PATH if outputs else None,
+        checkpoint_every=cfg["checkpoint_every"] if args.checkpoint_every is None
+        else args.checkpoint_every,
+        resume=resume, telemetry=telemetry, profiler=profiler,
+    )
+    if telemetry:
+        telemetry.close()
+    return model, stats
+
+
+def save_outputs(model: TinyTransformer, quantize: bool) -> None:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     torch.save(model.state_dict(), OUTPUT_DIR / "checkpoint.pt")
     print(f"Saved checkpoint to {OUTPUT_DIR / 'checkpoint.pt'}")
-    vocab = [tok.id_to_token(i) or f"<id_{i}>" for i in range(CONFIG["vocab_size"])]
-    if args.quantize:
+    tok = Tokenizer.from_file(str(TOKENIZER_PATH))
+    vocab = [tok.id_to_token(i) or f"<id_{i}>" for i in range(model.cfg["vocab_size"])]
+    if quantize:
         export_weights_int8(model, vocab, OUTPUT_DIR)
     else:
         export_weights(model, vocab, OUTPUT_DIR)
 
 
+def ddp_worker(rank: int, world_size: int, args: argparse.Namespace, max_steps: int | None,
+               results=None) -> None:
+    """One --nproc worker. Rank 0 exports, or reports its stats to `results`."""
+    torch.manual_seed(0)  # identical init and batch order on every rank
+    data = get_data(args)
+    model, stats = train_run(args, data, "cpu", max_steps=max_steps, outputs=results is None)
+    if rank == 0:
+        if results is None:
+            save_outputs(model, args.quantize)
+        else:
+            results.put(stats)
+
+
+def scaling_report(args: argparse.Namespace, nprocs: list[int], steps: int) -> None:
+    """tokens/s of `steps` DDP training steps for each worker count."""
+    import torch.multiprocessing as mp
+
+    results = mp.get_context("spawn").SimpleQueue()
+    rows = []
+    for n in nprocs:
+        print(f"\n--- {n} worker(s) ---")
+        launch(ddp_worker, n, args, steps, results)
+        rows.append((n, results.get()))
+    base = rows[0][1]["tokens_per_s"] / rows[0][0]
+    batch = args.batch_size or run_settings(args.smoke)["batch_size"]
+    print(f"\nScaling ({steps} steps, per-worker batch {batch}, "
+          f"{os.cpu_count()} cores):")
+    print(f"{'Workers':>7} {'ms/step':>8} {'tokens/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for n, r in rows:
+        speedup = r["tokens_per_s"] / rows[0][1]["tokens_per_s"]
+        print(f"{n:>7} {r['step_ms']:>8.1f} {r['tokens_per_s']:>10,.0f} {speedup:>7.2f}x "
+              f"{r['tokens_per_s'] / (base * n):>9.0%}")
+
+
+def _device() -> str:
+    return "cuda" if torch.cuda.is_available() else (
+        "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+
+
+def _memory_worker(args: argparse.Namespace, steps: int) -> dict:
+    data = get_data(args)
+    return train_run(args, data, _device(), max_steps=steps, outputs=False)[1]
+
+
+def _curriculum_worker(args: argparse.Namespace, steps: int) -> dict:
+    data = get_data(args)
+    return train_run(args, data, _device(), max_steps=steps, outputs=False, validate=True)[1]
+
+
+def curriculum_report(args: argparse.Namespace, steps: int) -> None:
+    """Held-out loss against training time for fixed-length training and the
+    curriculum, each in a fresh process, and how soon the curriculum reaches
+    the baseline's final loss."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing as mp
+
+    curriculum = args.curriculum or parse_curriculum(DEFAULT_CURRICULUM)
+    eval_every = args.eval_every or max(1, steps // 10)
+    modes = [("fixed", None), ("curriculum", curriculum)]
+    rows = []
+    for name, cur in modes:
+        print(f"\n--- {name} ---")
+        mode_args = argparse.Namespace(**{**vars(args), "curriculum": cur,
+                                          "eval_every": eval_every, "resume": False})
+        with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+            rows.append((name, pool.submit(_curriculum_worker, mode_args, steps).result()))
+
+    spec = ",".join(f"{n}:{f:g}" for n, f in curriculum)
+    print(f"\nLoss vs time ({rows[0][1]['history'][-1]['step']} steps, curriculum {spec}, "
+          f"ctx {CONFIG['context_len']}):")
+    print(f"{'step':>6}" + "".join(f" {name + ' s':>13} {'val':>6}" for name, _ in rows))
+    for points in zip(*(r["history"] for _, r in rows)):
+        print(f"{points[0]['step']:>6}"
+              + "".join(f" {p['train_s']:>13.1f} {p['val_loss']:>6.3f}" for p in points))
+    target = rows[0][1]["history"][-1]
+    for name, r in rows:
+        reached = next((p for p in r["history"] if p["val_loss"] <= target["val_loss"]), None)
+        when = (f"reaches {target['val_loss']:.3f} at {reached['train_s']:.1f}s "
+                f"({target['train_s'] / reached['train_s']:.2f}x)" if reached
+                else f"does not reach {target['val_loss']:.3f}")
+        print(f"{name}: final val {r['history'][-1]['val_loss']:.3f} after "
+              f"{r['history'][-1]['train_s']:.1f}s; {when}")
+
+
+def memory_report(args: argparse.Namespace, steps: int) -> None:
+    """Peak memory and tokens/s for plain / accumulated / checkpointed /
+    chunked-loss training at the same effective batch, each mode in a fresh
+    process."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing as mp
+
+    batch = args.batch_size or run_settings(args.smoke)["batch_size"]
+    accum = args.grad_accum_steps if args.grad_accum_steps > 1 else 4
+    chunk = args.chunked_loss or 1024
+    modes = [
+        ("plain", batch, 1, False, 0),
+        (f"accum x{accum}", batch // accum, accum, False, 0),
+        ("act-ckpt", batch, 1, True, 0),
+        ("chunked-loss", batch, 1, False, chunk),
+        (f"accum x{accum}+ckpt", batch // accum, accum, True, 0),
+        ("all three", batch // accum, accum, True, chunk),
+    ]
+    rows = []
+    for name, b, a, ckpt, chunked in modes:
+        print(f"\n--- {name}: batch {b} x {a} ---")
+        mode_args = argparse.Namespace(**{**vars(args), "batch_size": b, "grad_accum_steps": a,
+                                          "activation_checkpointing": ckpt,
+                                          "chunked_loss": chunked, "sampled_softmax": 0,
+                                          "resume": False})
+        with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+            rows.append((name, b, a, pool.submit(_memory_worker, mode_args, steps).result()))
+    print(f"\nMemory ({steps} steps, effective batch {batch}, ctx {CONFIG['context_len']}):")
+    print(f"{'Mode':<18} {'micro-batch':>11} {'peak MB':>9} {'ms/step':>8} {'tokens/s':>9}")
+    for name, b, a, r in rows:
+        print(f"{name:<18} {f'{b} x {a}':>11} {r['peak_mem_mb']:>9,.0f} {r['step_ms']:>8.1f} "
+              f"{r['tokens_per_s']:>9,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--smoke", action="store_true", help="Tiny smoke run.")
+    parser.add_argument("--quantize", action="store_true", help="Export int8 quantized.")
+    parser.add_argument("--bench-data", action="store_true",
+                        help="Only benchmark batch assembly (batches/sec), then exit.")
+    parser.add_argument("--search", type=int, default=0, metavar="N",
+                        help="Successive-halving search over N CONFIG variants; "
+                             "exports the winner.")
+    parser.add_argument("--eval-every", type=int, default=None,
+                        help="Held-out evaluation interval in steps (0 = end only).")
+    parser.add_argument("--attn-backend", choices=ATTENTION_BACKENDS, default="sdpa",
+                        help="Fused scaled_dot_product_attention or the explicit math path.")
+    parser.add_argument("--checkpoint-every", type=int, default=None, metavar="STEPS",
+                        help=f"Save resumable training state to {TRAIN_STATE_PATH.relative_to(ROOT)} "
+                             "every STEPS steps (0 = only at the end).")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continue the run saved in {TRAIN_STATE_PATH.relative_to(ROOT)} "
+                             "(same flags as the original run).")
+    parser.add_argument("--nproc", type=int, default=1,
+                        help="Data-parallel CPU worker processes (DDP over gloo); the "
+                             "batch size is per worker.")
+    parser.add_argument("--scaling", type=lambda s: [int(n) for n in s.split(",")], default=None,
+                        metavar="N1,N2,...",
+                        help="Report DDP tokens/s for each worker count, then exit.")
+    parser.add_argument("--scaling-steps", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Micro-batch size (default: 16 smoke / 64 full).")
+    parser.add_argument("--grad-accum-steps", type=int, default=1,
+                        help="Micro-batches per optimizer step (effective batch = batch x N).")
+    parser.add_argument("--activation-checkpointing", action="store_true",
+                        help="Recompute each layer's activations in backward to save memory.")
+    parser.add_argument("--chunked-loss", type=int, nargs="?", const=1024, default=0,
+                        metavar="TOKENS",
+                        help="Fuse the output projection with cross-entropy, TOKENS rows "
+                             "at a time (default 1024), instead of materialising all logits.")
+    parser.add_argument("--sampled-softmax", type=int, default=0, metavar="N",
+                        help="Train with a sampled softmax over N negatives from the corpus "
+                             "unigram distribution (evaluation and export use the full softmax).")
+    parser.add_argument("--curriculum", type=parse_curriculum, nargs="?",
+                        const=parse_curriculum(DEFAULT_CURRICULUM), default=None,
+                        metavar="LEN:FRAC,...",
+                        help="Sequence-length curriculum: train the first FRAC of the steps on "
+                             f"LEN-token sequences, and so on (default {DEFAULT_CURRICULUM}), at "
+                             "constant tokens per step.")
+    parser.add_argument("--curriculum-report", action="store_true",
+                        help="Compare held-out loss vs training time of fixed-length and "
+                             "curriculum training, then exit.")
+    parser.add_argument("--curriculum-steps", type=int, default=300)
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Compare peak memory / tokens/s of plain, accumulated, "
+                             "checkpointed and chunked-loss training, then exit.")
+    parser.add_argument("--memory-steps", type=int, default=10)
+    add_accel_args(parser)
+    add_corpus_args(parser)
+    add_telemetry_args(parser)
+    add_profile_args(parser)
+    args = parser.parse_args()
+    if any(CONFIG["context_len"] % n for n, _ in args.curriculum or ()):
+        parser.error(f"--curriculum lengths must divide context_len {CONFIG['context_len']}")
+    if args.chunked_loss and args.sampled_softmax:
+        parser.error("--chunked-loss and --sampled-softmax are alternatives; pick one")
+    if args.resume and args.search:
+        parser.error("--resume is not supported with --search")
+    if args.nproc > 1 and args.search:
+        parser.error("--nproc is not supported with --search")
+    if args.search and (args.grad_accum_steps > 1 or args.activation_checkpointing
+                        or args.curriculum):
+        parser.error("--search trains plain; drop --grad-accum-steps / "
+                     "--activation-checkpointing / --curriculum")
+
+    device = _device()
+    if args.nproc > 1 or args.scaling:
+        device = "cpu"
+    print(f"Using device: {device}")
+
+    cfg = run_settings(args.smoke)
+    data = get_data(args)  # also builds the token cache before any workers start
+
+    batch_size = args.batch_size or cfg["batch_size"]
+    if args.bench_data:
+        print(f"Data-path benchmark (batch={batch_size}, ctx={CONFIG['context_len']}):")
+        bench_data(data, ctx=CONFIG["context_len"], batch_size=batch_size, device=device)
+        return
+    if args.scaling:
+        scaling_report(args, args.scaling, args.scaling_steps)
+        return
+    if args.memory_report:
+        memory_report(args, args.memory_steps)
+        return
+    if args.curriculum_report:
+        curriculum_report(args, args.curriculum_steps)
+        return
+    if args.nproc > 1:
+        launch(ddp_worker, args.nproc, args, None)
+        return
+
+    if args.search:
+        model = search(data, args.search, epochs=cfg["epochs"], batch_size=batch_size,
+                       lr=cfg["lr"], device=device, amp=args.amp, compile=args.compile)
+    else:
+        model, _ = train_run(args, data, device)
+    save_outputs(model, args.quantize)
+
+
 if __name__ == "__main__":
     main()
@@ -6,6 +6,7 @@ import { WidgetTabs } from "../shared/WidgetTabs";
 import { SliderControl } from "../shared/SliderControl";
 import { loadTinyStoriesTokenizer } from "../embeddings/bpeTokenizer";
 import type { EncodedPiece } from "../embeddings/bpeTokenizer";
+import { readWeights } from "@/lib/weights-file";
 
 // ---------------------------------------------------------------------------
 // Model loading & inference (pure JS, no TF.js needed)
@@ -54,38 +55,19 @@ async function loadModel(): Promise<Model> {
     const binResp = await fetch(`${MODEL_BASE}.weights.bin`);
     if (!binResp.ok) throw new Error(`Model weights: ${binResp.status}`);
     const buf = await binResp.arrayBuffer();
-    const view = new DataView(buf);
-
-    let offset = 0;
-
-    function readTensor(): { data: Float32Array } {
-      const ndims = view.getUint32(offset, true);
-      offset += 4;
-      let nElements = 1;
-      for (let i = 0; i < ndims; i++) {
-        nElements *= view.getUint32(offset, true);
-        offset += 4;
-      }
-      const data = new Float32Array(buf, offset, nElements);
-      offset += nElements * 4;
-      return { data };
-    }
-
-    const embedding = readTensor();
-    const fc1_weight = readTensor();
-    const fc1_bias = readTensor();
-    const fc2_weight = readTensor();
-    const fc2_bias = readTensor();
+    const tensor = readWeights(buf, [
+      "embedding.weight", "fc1.weight", "fc1.bias", "fc2.weight", "fc2.bias",
+    ]);
 
     return {
       config,
       vocab,
       weights: {
-        embedding: embedding.data,
-        fc1_weight: fc1_weight.data,
-        fc1_bias: fc1_bias.data,
-        fc2_weight: fc2_weight.data,
-        fc2_bias: fc2_bias.data,
+        embedding: tensor("embedding.weight"),
+        fc1_weight: tensor("fc1.weight"),
+        fc1_bias: tensor("fc1.bias"),
+        fc2_weight: tensor("fc2.weight"),
+        fc2_bias: tensor("fc2.bias"),
       },
     };
   })();
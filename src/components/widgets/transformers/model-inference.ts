@@ -4,6 +4,8 @@
  * Supports causal-masked multi-head attention, layer norm, residual connections, and feed-forward layers.
  */
 
+import { readWeights } from "@/lib/weights-file";
+
 // ---------------------------------------------------------------------------
 // Types
 // ---------------------------------------------------------------------------
@@ -330,6 +332,18 @@ export function forward(
 // Model loading
 // ---------------------------------------------------------------------------
 
+/** TinyTransformer's state_dict names, in order (for pre-container weight files). */
+function transformerWeightNames(numLayers: number): string[] {
+  const names = ["token_emb.weight", "pos_emb.weight"];
+  for (let l = 0; l < numLayers; l++) {
+    for (const m of ["attn.ln1", "attn.qkv", "attn.out", "ffn.ln2", "ffn.fc1", "ffn.fc2"]) {
+      names.push(`layers.${l}.${m}.weight`, `layers.${l}.${m}.bias`);
+    }
+  }
+  names.push("ln_final.weight", "ln_final.bias", "output.weight", "output.bias");
+  return names;
+}
+
 const modelCache = new Map<string, Promise<TransformerModel>>();
 
 export function loadTransformerModel(baseUrl: string): Promise<TransformerModel> {
@@ -346,62 +360,34 @@ export function loadTransformerModel(baseUrl: string): Promise<TransformerModel>
     const binResp = await fetch(`${baseUrl}.weights.bin`);
     if (!binResp.ok) throw new Error(`Model weights: ${binResp.status}`);
     const buf = await binResp.arrayBuffer();
-    const view = new DataView(buf);
-
-    const quantization = (json.config as TransformerConfig).quantization;
-
-    let offset = 0;
-
-    function readTensor(): Float32Array {
-      const ndims = view.getUint32(offset, true);
-      offset += 4;
-      let nElements = 1;
-      for (let i = 0; i < ndims; i++) {
-        nElements *= view.getUint32(offset, true);
-        offset += 4;
-      }
-      if (quantization === "int8") {
-        const scale = view.getFloat32(offset, true);
-        offset += 4;
-        // Int8Array view over the buffer — int8 alignment is trivial.
-        // Per-element JIT-friendly access beats DataView.getInt8 on large tensors.
-        const ints = new Int8Array(buf, offset, nElements);
-        const out = new Float32Array(nElements);
-        for (let i = 0; i < nElements; i++) out[i] = ints[i] * scale;
-        offset += nElements;
-        return out;
-      } else {
-        const data = new Float32Array(buf, offset, nElements);
-        offset += nElements * 4;
-        return data;
-      }
-    }
+    const tensor = readWeights(buf, transformerWeightNames(config.num_layers), config.quantization);
 
-    const token_embedding = readTensor();
-    const pos_embedding = readTensor();
+    const token_embedding = tensor("token_emb.weight");
+    const pos_embedding = tensor("pos_emb.weight");
 
     const layers: LayerWeights[] = [];
     for (let l = 0; l < config.num_layers; l++) {
+      const p = `layers.${l}`;
       layers.push({
-        ln1_weight: readTensor(),
-        ln1_bias: readTensor(),
-        qkv_weight: readTensor(),
-        qkv_bias: readTensor(),
-        attn_out_weight: readTensor(),
-        attn_out_bias: readTensor(),
-        ln2_weight: readTensor(),
-        ln2_bias: readTensor(),
-        ff1_weight: readTensor(),
-        ff1_bias: readTensor(),
-        ff2_weight: readTensor(),
-        ff2_bias: readTensor(),
+        ln1_weight: tensor(`${p}.attn.ln1.weight`),
+        ln1_bias: tensor(`${p}.attn.ln1.bias`),
+        qkv_weight: tensor(`${p}.attn.qkv.weight`),
+        qkv_bias: tensor(`${p}.attn.qkv.bias`),
+        attn_out_weight: tensor(`${p}.attn.out.weight`),
+        attn_out_bias: tensor(`${p}.attn.out.bias`),
+        ln2_weight: tensor(`${p}.ffn.ln2.weight`),
+        ln2_bias: tensor(`${p}.ffn.ln2.bias`),
+        ff1_weight: tensor(`${p}.ffn.fc1.weight`),
+        ff1_bias: tensor(`${p}.ffn.fc1.bias`),
+        ff2_weight: tensor(`${p}.ffn.fc2.weight`),
+        ff2_bias: tensor(`${p}.ffn.fc2.bias`),
       });
     }
 
-    const ln_final_weight = readTensor();
-    const ln_final_bias = readTensor();
-    const output_weight = readTensor();
-    const output_bias = readTensor();
+    const ln_final_weight = tensor("ln_final.weight");
+    const ln_final_bias = tensor("ln_final.bias");
+    const output_weight = tensor("output.weight");
+    const output_bias = tensor("output.bias");
 
     return {
       config,
@@ -0,0 +1,66 @@
+import { describe, it, expect } from "vitest";
+import { readFileSync } from "node:fs";
+import { readWeights } from "./weights-file";
+
+// Written by scripts/_weights.py via scripts/test_weight_format.py, which
+// also checks they are still current (--update-fixtures regenerates them).
+const FIXTURES = new URL("./__fixtures__/weights/", import.meta.url);
+
+interface Expected {
+  names: string[];
+  shapes: Record<string, number[]>;
+  float32: Record<string, number[]>;
+  int8: Record<string, number[]>;
+}
+
+const expected: Expected = JSON.parse(readFileSync(new URL("expected.json", FIXTURES), "utf8"));
+
+function load(name: string): ArrayBuffer {
+  const b = readFileSync(new URL(name, FIXTURES));
+  return b.buffer.slice(b.byteOffset, b.byteOffset + b.byteLength);
+}
+
+describe("readWeights", () => {
+  for (const dtype of ["float32", "int8"] as const) {
+    for (const format of ["container", "legacy"]) {
+      it(`decodes a ${format} ${dtype} file`, () => {
+        const tensor = readWeights(
+          load(`${format}-${dtype}.bin`),
+          format === "legacy" ? expected.names : [],
+          dtype === "int8" ? "int8" : undefined,
+        );
+        for (const name of expected.names) {
+          expect(Array.from(tensor(name))).toEqual(expected[dtype][name]);
+        }
+      });
+    }
+  }
+
+  it("reads the container header and ignores the legacy arguments", () => {
+    const buf = load("container-float32.bin");
+    const bytes = new Uint8Array(buf);
+    expect(new TextDecoder().decode(bytes.subarray(0, 4))).toBe("AIXW");
+    expect(new DataView(buf).getUint32(4, true)).toBe(1);
+    // Names come from the index, not the order given for legacy files.
+    const tensor = readWeights(buf, ["b.weight", "a.weight"], "int8");
+    expect(Array.from(tensor("b.weight"))).toEqual(expected.float32["b.weight"]);
+  });
+
+  it("views float32 tensors in place at 64-byte aligned offsets", () => {
+    const buf = load("container-float32.bin");
+    const tensor = readWeights(buf, []);
+    for (const name of expected.names) {
+      const t = tensor(name);
+      expect(t.buffer).toBe(buf);
+      expect(t.byteOffset % 64).toBe(0);
+      expect(t.length).toBe(expected.shapes[name].reduce((a, b) => a * b, 1));
+    }
+  });
+
+  it("rejects unknown versions and missing tensors", () => {
+    const buf = load("container-float32.bin");
+    expect(() => readWeights(buf, [])("nope")).toThrow("no tensor nope");
+    new DataView(buf).setUint32(4, 2, true);
+    expect(() => readWeights(buf, [])).toThrow("unsupported version 2");
+  });
+});
@@ -0,0 +1,90 @@
+// Reader for the models' `.weights.bin` files (written by scripts/_weights.py).
+//
+// Current files are a container: "AIXW", a uint32 version, a uint32 header
+// length, then a JSON index of every tensor's name, dtype, shape, byte offset
+// (from the start of the data) and int8 scale. Tensors start on 64-byte
+// boundaries, so float32 tensors are zero-copy views of the buffer. Older
+// files are a bare stream of [ndims][dims][data] records in a fixed order,
+// which is why callers pass the tensor names in state_dict order.
+
+const MAGIC = 0x57584941; // "AIXW", read as a little-endian uint32
+const VERSION = 1;
+const PREFIX_BYTES = 12;
+
+interface TensorEntry {
+  name: string;
+  dtype: "float32" | "int8";
+  shape: number[];
+  offset: number;
+  nbytes: number;
+  scale?: number;
+}
+
+function tensorData(buf: ArrayBuffer, entry: TensorEntry): Float32Array {
+  const n = entry.shape.reduce((a, b) => a * b, 1);
+  if (entry.dtype === "float32") return new Float32Array(buf, entry.offset, n);
+  // Per-element JIT-friendly access beats DataView.getInt8 on large tensors.
+  const ints = new Int8Array(buf, entry.offset, n);
+  const scale = entry.scale ?? 1;
+  const out = new Float32Array(n);
+  for (let i = 0; i < n; i++) out[i] = ints[i] * scale;
+  return out;
+}
+
+function containerIndex(buf: ArrayBuffer, view: DataView): TensorEntry[] {
+  const version = view.getUint32(4, true);
+  if (version !== VERSION) throw new Error(`Model weights: unsupported version ${version}`);
+  const headerBytes = view.getUint32(8, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buf, PREFIX_BYTES, headerBytes)),
+  );
+  const dataStart = PREFIX_BYTES + headerBytes;
+  return (header.tensors as TensorEntry[]).map((e) => ({ ...e, offset: dataStart + e.offset }));
+}
+
+function legacyIndex(view: DataView, names: string[], quantization?: string): TensorEntry[] {
+  let offset = 0;
+  return names.map((name) => {
+    const ndims = view.getUint32(offset, true);
+    offset += 4;
+    const shape: number[] = [];
+    for (let i = 0; i < ndims; i++) {
+      shape.push(view.getUint32(offset, true));
+      offset += 4;
+    }
+    const n = shape.reduce((a, b) => a * b, 1);
+    if (quantization === "int8") {
+      const scale = view.getFloat32(offset, true);
+      offset += 4;
+      const entry: TensorEntry = { name, dtype: "int8", shape, offset, nbytes: n, scale };
+      offset += n;
+      return entry;
+    }
+    const entry: TensorEntry = { name, dtype: "float32", shape, offset, nbytes: n * 4 };
+    offset += n * 4;
+    return entry;
+  });
+}
+
+/**
+ * Parse a weights file. `legacyNames` (state_dict order) and
+ * `legacyQuantization` are only used for pre-container files.
+ * Returns a lookup that throws on a missing tensor.
+ */
+export function readWeights(
+  buf: ArrayBuffer,
+  legacyNames: string[],
+  legacyQuantization?: string,
+): (name: string) => Float32Array {
+  const view = new DataView(buf);
+  const index =
+    buf.byteLength >= PREFIX_BYTES && view.getUint32(0, true) === MAGIC
+      ? containerIndex(buf, view)
+      : legacyIndex(view, legacyNames, legacyQuantization);
+  const entries = new Map(index.map((e) => [e.name, e]));
+  return (name) => {
+    const entry = entries.get(name);
+    if (!entry) throw new Error(`Model weights: no tensor ${name}`);
+    return tensorData(buf, entry);
+  };
+}